@@ -0,0 +1,110 @@
+"""
+Simulação e benchmark do modo bandit
+
+Simula --visitors visitantes num split de três destinos com taxas de
+conversão reais diferentes (padrão 2%, 3% e 5%). Cada visitante passa pelo
+sorteio do split compilado e pelo click id (bandit.track); as conversões
+voltam por record_conversion com o click id, e bandit.sync() roda a cada
+--sync-every visitantes num SQLite descartável, como a thread de
+sincronização faria. Para 'thompson' e 'epsilon_greedy' mostra a fatia de
+tráfego do melhor destino ao longo do tempo e as conversões obtidas contra
+um split estático uniforme e contra o ótimo.
+
+Mede também o custo por redirecionamento (sorteio + click id) com e sem
+bandit e o tempo de uma sincronização.
+
+Uso: python benchmarks/bench_bandit.py [--visitors 200000] [--sync-every 2000] [--rates 0.02,0.03,0.05]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from common import make_app
+
+from src.services.bandit import BANDIT_MODES, bandit
+from src.services.split_cache import compile_split
+
+
+def simulate(mode, split_id, rates, visitors, sync_every, rng):
+    destinations = [f'https://dest{i}.example/oferta' for i in range(len(rates))]
+    rate_of = dict(zip(destinations, rates))
+    best = destinations[rates.index(max(rates))]
+    split = compile_split(split_id, f'bandit-{mode}', destinations, [1] * len(rates), bandit_mode=mode)
+    checkpoints = {visitors * p // 10 for p in (1, 2, 5, 10)}
+    conversions = 0
+    best_hits = 0
+    window = 0
+    shares = []
+    for visitor in range(1, visitors + 1):
+        url = split.pick()
+        click_id = bandit.track(split.arms, url)
+        window += 1
+        if url == best:
+            best_hits += 1
+        if rng.random() < rate_of[url]:
+            conversions += 1
+            bandit.record_conversion(click_id)
+        if visitor % sync_every == 0:
+            bandit.sync()
+        if visitor in checkpoints:
+            shares.append((visitor, best_hits / window))
+            best_hits = window = 0
+    return conversions, shares
+
+
+def time_redirects(split, rounds=200000):
+    pick = split.pick
+    track = bandit.track if hasattr(split, 'arms') else None
+    start = time.perf_counter()
+    if track is None:
+        for _ in range(rounds):
+            pick()
+    else:
+        arms = split.arms
+        for _ in range(rounds):
+            track(arms, pick())
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--visitors', type=int, default=200000)
+    parser.add_argument('--sync-every', type=int, default=2000)
+    parser.add_argument('--rates', default='0.02,0.03,0.05')
+    args = parser.parse_args()
+    rates = [float(r) for r in args.rates.split(',')]
+
+    # Sincronização só manual: a thread de fundo não entra na medição
+    make_app(CLICK_LOGGING_ENABLED=False, BANDIT_SYNC_INTERVAL=3600)
+    uniform = args.visitors * sum(rates) / len(rates)
+    optimal = args.visitors * max(rates)
+    print(f"🎰 {args.visitors} visitantes, taxas reais {rates}, sincronização a cada {args.sync_every}")
+    print(f"   split estático uniforme: {uniform:8.0f} conversões esperadas;  ótimo: {optimal:8.0f}")
+    for split_id, mode in enumerate(BANDIT_MODES, start=1):
+        start = time.perf_counter()
+        conversions, shares = simulate(mode, split_id, rates, args.visitors, args.sync_every, random.Random(split_id))
+        elapsed = time.perf_counter() - start
+        trajectory = '  '.join(f'{visitor}: {share:.0%}' for visitor, share in shares)
+        print(f"   {mode:15s} {conversions:8d} conversões ({(conversions - uniform) / uniform:+.0%} vs uniforme, "
+              f"{conversions / optimal:.0%} do ótimo) em {elapsed:.1f}s")
+        print(f"      tráfego no melhor destino por trecho (até o visitante N): {trajectory}")
+
+    destinations = [f'https://dest{i}.example/oferta' for i in range(len(rates))]
+    plain = compile_split(10, 'fixo', destinations, [1] * len(rates))
+    bandit_split = compile_split(11, 'bandit', destinations, [1] * len(rates), bandit_mode='thompson')
+    pick_cost = time_redirects(plain)
+    tracked_cost = time_redirects(bandit_split)
+    start = time.perf_counter()
+    bandit.sync()
+    sync_cost = time.perf_counter() - start
+    print(f"⏱️ por redirecionamento: sorteio {pick_cost * 1e6:.2f} µs   sorteio + click id {tracked_cost * 1e6:.2f} µs")
+    print(f"⏱️ sincronização ({len(bandit._arms)} splits): {sync_cost * 1e3:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark da edição em lote (PATCH /api/splits) e da concorrência otimista
+
+1. Rebalanceamento de --splits splits: uma PUT por split x uma PATCH em lote
+   (rota Flask, test client), com a quantidade de consultas SQL de cada forma.
+2. Lost updates: --threads automações editam os mesmos splits ao mesmo tempo,
+   cada uma movendo 1 ponto de peso do destino B para o A em --rounds rodadas
+   (ler, calcular, gravar). Sem versão (PUT cega) parte das edições se perde;
+   com `version` no lote os conflitos voltam por item, a automação relê e
+   tenta de novo, e o peso final confere com o total de edições.
+
+Uso: python benchmarks/bench_batch_update.py [--splits 500] [--threads 4] [--rounds 20]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from sqlalchemy import event
+
+from common import make_app
+
+from src.models.user import db
+
+DESTINATIONS = ['https://a.example.com/', 'https://b.example.com/']
+
+
+def seed(client, count, prefix):
+    lines = [json.dumps({'slug': f'{prefix}-{i}', 'name': f'{prefix} {i}', 'destinations': DESTINATIONS,
+                         'weights': [10, 90]}) for i in range(count)]
+    response = client.post('/api/splits/import', data='\n'.join(lines), content_type='application/x-ndjson')
+    assert response.get_json()['imported'] == count, response.get_json()
+    return list_splits(client, prefix)
+
+
+def list_splits(client, prefix):
+    """{id: (versão, pesos)} dos splits com o prefixo"""
+    splits = {}
+    cursor = None
+    while True:
+        url = f'/api/splits?q={prefix}-&limit=1000&fields=id,weights,version' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        for split in response.get_json():
+            splits[split['id']] = (split['version'], split['weights'])
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return splits
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, *args):
+        self.count += 1
+
+
+def rebalance(args, client, counter):
+    splits = seed(client, args.splits, 'rebalance')
+    new_weights = {split_id: [40, 60] for split_id in splits}
+
+    before = counter.count
+    start = time.perf_counter()
+    for split_id, weights in new_weights.items():
+        response = client.put(f'/api/splits/{split_id}', json={'name': f'split {split_id}', 'destinations': DESTINATIONS,
+                                                                 'weights': weights})
+        assert response.status_code == 200, response.get_json()
+    put_seconds = time.perf_counter() - start
+    put_queries = counter.count - before
+
+    items = [{'id': split_id, 'weights': [30, 70], 'version': splits[split_id][0] + 1} for split_id in splits]
+    before = counter.count
+    start = time.perf_counter()
+    response = client.patch('/api/splits', json={'items': items})
+    patch_seconds = time.perf_counter() - start
+    patch_queries = counter.count - before
+    result = response.get_json()
+    assert result['updated'] == args.splits, result
+    final = list_splits(client, 'rebalance')
+    ok = all(weights == [30, 70] for _, weights in final.values())
+    print(f"⏱️ Rebalancear {args.splits} splits:")
+    print(f"   {args.splits} x PUT          {put_seconds * 1e3:8.0f} ms   {put_queries:6d} consultas SQL")
+    print(f"   1 x PATCH em lote    {patch_seconds * 1e3:8.0f} ms   {patch_queries:6d} consultas SQL "
+          f"({put_seconds / patch_seconds:.0f}x mais rápido)")
+    print(f"{'✅' if ok else '❌'} pesos gravados conferem em {len(final)} splits")
+
+
+def automation(app, prefix, rounds, versioned, stats):
+    """Move 1 ponto de B para A em cada split, `rounds` vezes (ler, calcular, gravar)"""
+    client = app.test_client()
+    for _ in range(rounds):
+        pending = list_splits(client, prefix)
+        while pending:
+            if versioned:
+                items = [{'id': split_id, 'version': version, 'weights': [weights[0] + 1, weights[1] - 1]}
+                         for split_id, (version, weights) in pending.items()]
+                results = client.patch('/api/splits', json={'items': items}).get_json()['results']
+                conflicts = {result['id'] for result in results if result['status'] == 'conflict'}
+                stats['conflicts'] += len(conflicts)
+                # Reler só o que conflitou e tentar de novo
+                pending = {split_id: value for split_id, value in list_splits(client, prefix).items()
+                           if split_id in conflicts}
+            else:
+                for split_id, (_, weights) in pending.items():
+                    client.put(f'/api/splits/{split_id}', json={'name': prefix, 'destinations': DESTINATIONS,
+                                                                'weights': [weights[0] + 1, weights[1] - 1]})
+                pending = {}
+
+
+def lost_updates(args, app, client):
+    print(f"🔁 {args.threads} automações x {args.rounds} rodadas em {args.concurrent_splits} splits "
+          f"(esperado: peso A = 10 + {args.threads * args.rounds}):")
+    for label, versioned in (('PUT sem versão', False), ('PATCH com version', True)):
+        prefix = 'versioned' if versioned else 'blind'
+        seed(client, args.concurrent_splits, prefix)
+        stats = {'conflicts': 0}
+        threads = [threading.Thread(target=automation, args=(app, prefix, args.rounds, versioned, stats))
+                   for _ in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        expected = 10 + args.threads * args.rounds
+        final = [weights[0] for _, weights in list_splits(client, prefix).values()]
+        lost = sum(expected - weight for weight in final)
+        # Sem versão as perdas são o esperado (é o que a PATCH com version evita)
+        mark = '✅' if not lost else ('⚠️' if not versioned else '❌')
+        print(f"   {mark} {label:<18} {elapsed:6.1f} s  edições perdidas: {lost:5.0f} "
+              f"de {args.threads * args.rounds * len(final)}  conflitos refeitos: {stats['conflicts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--splits', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--concurrent-splits', type=int, default=50)
+    args = parser.parse_args()
+
+    app = make_app(CLICK_LOGGING_ENABLED=False)
+    client = app.test_client()
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+    rebalance(args, client, counter)
+    lost_updates(args, app, client)
+
+
+if __name__ == '__main__':
+    main()
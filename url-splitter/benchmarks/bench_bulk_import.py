@@ -0,0 +1,54 @@
+"""
+Benchmark do import em massa: N splits via POST /api/splits/import (NDJSON)
+
+Uso: python benchmarks/bench_bulk_import.py [--splits 100000] [--destinations 3]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import make_app
+
+
+def ndjson_payload(splits, destinations):
+    for i in range(splits):
+        yield (json.dumps({
+            'slug': f'bulk-{i}',
+            'name': f'Campanha {i}',
+            'destinations': [f'https://example.com/{i}/{d}' for d in range(destinations)],
+            'weights': [round(100 / destinations, 1)] * destinations,
+        }) + '\n').encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--splits', type=int, default=100000)
+    parser.add_argument('--destinations', type=int, default=3)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = make_app(BULK_CHUNK_SIZE=args.chunk_size, CLICK_LOGGING_ENABLED=False)
+    client = app.test_client()
+    body = b''.join(ndjson_payload(args.splits, args.destinations))
+
+    start = time.perf_counter()
+    response = client.post('/api/splits/import', data=body, content_type='application/x-ndjson')
+    elapsed = time.perf_counter() - start
+    result = response.get_json()
+    print(f"📦 Import: {result['imported']} splits em {elapsed:.2f}s "
+          f"({result['imported'] / elapsed:,.0f} linhas/s), {result['failed']} erros")
+
+    start = time.perf_counter()
+    response = client.get('/api/splits/export')
+    exported = sum(1 for _ in response.response)
+    elapsed = time.perf_counter() - start
+    print(f"📤 Export: {exported} linhas em {elapsed:.2f}s ({exported / elapsed:,.0f} linhas/s)")
+    print(f"💾 Banco: {app.db_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark do particionamento de cliques: banco único x partições mensais
+
+Grava --clicks cliques espalhados por --months meses de dois jeitos: tudo na
+tabela click_logs do banco principal (como antes) e nas partições mensais
+do ClickArchive. Compara o tamanho do banco principal, o tempo de backup
+(BackupManager) e de VACUUM dele, o export de um mês de um split e o
+arquivamento dos meses além da retenção.
+
+Uso: python benchmarks/bench_click_archive.py [--clicks 1000000] [--months 12]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from common import make_app
+
+from src.models.user import db
+from src.services.backup import BackupManager
+from src.services.click_archive import ClickArchive, partition_table
+
+CHUNK = 20000
+
+
+def make_events(count, months, splits=100):
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    span = months * 30 * 86400
+    for _ in range(count):
+        yield {
+            'url_split_id': rng.randint(1, splits),
+            'destination_url': f'https://dest{rng.randint(0, 3)}.example/campanha',
+            'ip_address': f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+            'user_agent': 'Mozilla/5.0 (Linux; Android 13) AppleWebKit/537.36 Chrome/120.0 Mobile',
+            'clicked_at': now - timedelta(seconds=rng.randint(0, span)),
+        }
+
+
+def chunks(events):
+    batch = []
+    for event in events:
+        batch.append(event)
+        if len(batch) >= CHUNK:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main_db_costs(app):
+    db_path = app.db_path
+    backups = BackupManager(db_path, os.path.join(os.path.dirname(db_path), 'backups'), keep=1)
+    backup_time, _ = timed(backups.backup_now)
+    with app.app_context():
+        with db.engine.connect() as conn:
+            vacuum_time, _ = timed(lambda: conn.exec_driver_sql('VACUUM'))
+    return os.path.getsize(db_path), backup_time, vacuum_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clicks', type=int, default=1000000)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--retention', type=int, default=3)
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    since, until = now - timedelta(days=45), now - timedelta(days=15)
+
+    # Banco único
+    single = make_app(CLICK_LOGGING_ENABLED=False)
+    with single.app_context():
+        insert = partition_table.insert()
+        for batch in chunks(make_events(args.clicks, args.months)):
+            with db.engine.begin() as conn:
+                conn.execute(insert, batch)
+        table = partition_table
+        query = (table.select()
+                 .where(table.c.url_split_id == 7, table.c.clicked_at >= since, table.c.clicked_at < until))
+        with db.engine.connect() as conn:
+            export_single, rows = timed(lambda: conn.execute(query).fetchall())
+    size, backup_time, vacuum_time = main_db_costs(single)
+    print(f"📦 {args.clicks} cliques em {args.months} meses")
+    print(f"   banco único:  principal {size / 1e6:7.1f} MB   backup {backup_time:6.2f}s   "
+          f"VACUUM {vacuum_time:6.2f}s   export 30 dias/1 split {export_single * 1e3:7.1f} ms ({len(rows)})")
+
+    # Partições mensais
+    partitioned = make_app(CLICK_LOGGING_ENABLED=False)
+    archive = ClickArchive()
+    archive.configure(os.path.join(tempfile.mkdtemp(prefix='url-splitter-bench-'), 'clicks'),
+                      retention_months=args.retention)
+    for batch in chunks(make_events(args.clicks, args.months)):
+        archive.write(batch)
+    export_part, clicks = timed(lambda: list(archive.iter_clicks(since, until, 7)))
+    size, backup_time, vacuum_time = main_db_costs(partitioned)
+    live = sum(p['size_bytes'] for p in archive.partitions())
+    print(f"   particionado: principal {size / 1e6:7.1f} MB   backup {backup_time:6.2f}s   "
+          f"VACUUM {vacuum_time:6.2f}s   export 30 dias/1 split {export_part * 1e3:7.1f} ms ({len(clicks)})")
+
+    archive_time, archived = timed(archive.archive)
+    after = archive.partitions()
+    compressed = sum(p['size_bytes'] for p in after if p['status'] == 'archived')
+    remaining = sum(p['size_bytes'] for p in after if p['status'] == 'live')
+    print(f"🗄️ Arquivamento de {len(archived)} meses: {archive_time:.2f}s; partições {live / 1e6:.1f} MB -> "
+          f"{remaining / 1e6:.1f} MB vivas + {compressed / 1e6:.1f} MB em NDJSON gzip")
+    old_since = now - timedelta(days=30 * (args.months - 1))
+    old_export, old_clicks = timed(lambda: list(archive.iter_clicks(old_since, old_since + timedelta(days=30), 7)))
+    print(f"   export 30 dias/1 split de mês arquivado: {old_export * 1e3:.1f} ms ({len(old_clicks)})")
+
+
+if __name__ == '__main__':
+    main()
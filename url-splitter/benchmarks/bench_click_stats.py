@@ -0,0 +1,111 @@
+"""
+Benchmark das estatísticas por rollup: N cliques sintéticos em 30 dias
+
+Os cliques passam pelo mesmo caminho do click writer (agregação por minuto +
+UPSERT), depois os rollups são compactados e a consulta de estatísticas é
+cronometrada em cada granularidade. Para comparação, uma amostra de cliques
+brutos é gravada em click_logs e agregada com GROUP BY direto.
+
+Uso: python benchmarks/bench_click_stats.py [--clicks 10000000] [--raw-sample 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+
+from common import make_app
+from src.models.user import db
+from src.services.click_stats import compact_rollups, query_stats, record_rollups
+
+DAYS = 30
+BATCH = 200000
+
+
+def synthetic_clicks(count, splits, destinations, start, rng):
+    """Cliques em ordem cronológica (como chegam ao click writer) ao longo de DAYS dias"""
+    step = DAYS * 86400 / count
+    for i in range(count):
+        split_id = rng.randrange(1, splits + 1)
+        yield {
+            'url_split_id': split_id,
+            'destination_url': f'https://example.com/{split_id}/{rng.randrange(destinations)}',
+            'clicked_at': start + timedelta(seconds=i * step),
+        }
+
+
+def timed(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clicks', type=int, default=10000000)
+    parser.add_argument('--splits', type=int, default=10)
+    parser.add_argument('--destinations', type=int, default=5)
+    parser.add_argument('--raw-sample', type=int, default=1000000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    app = make_app(CLICK_LOGGING_ENABLED=False)
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    start = now - timedelta(days=DAYS)
+
+    with app.app_context():
+        engine = db.engine
+        t0 = time.perf_counter()
+        batch = []
+        for event in synthetic_clicks(args.clicks, args.splits, args.destinations, start, rng):
+            batch.append(event)
+            if len(batch) >= BATCH:
+                with engine.begin() as conn:
+                    record_rollups(conn, batch)
+                batch = []
+        if batch:
+            with engine.begin() as conn:
+                record_rollups(conn, batch)
+        ingest = time.perf_counter() - t0
+        print(f"📥 {args.clicks:,} cliques agregados em {ingest:.1f}s ({args.clicks / ingest:,.0f} cliques/s)")
+
+        with engine.connect() as conn:
+            before = conn.execute(text('SELECT COUNT(*) FROM click_rollups')).scalar()
+        t0 = time.perf_counter()
+        with engine.begin() as conn:
+            compact_rollups(conn)
+        with engine.connect() as conn:
+            after = conn.execute(text('SELECT COUNT(*) FROM click_rollups')).scalar()
+        print(f"🗜️ Compactação: {before:,} -> {after:,} linhas de rollup em {time.perf_counter() - t0:.2f}s")
+
+        until = int(now.replace(tzinfo=timezone.utc).timestamp()) + 60
+        print("⏱️ Consulta de estatísticas (split 1)")
+        with engine.connect() as conn:
+            for granularity, window in (('minute', 6 * 3600), ('hour', 7 * 86400), ('day', DAYS * 86400),
+                                        ('minute', 7 * 86400)):
+                ms, (buckets, totals, used) = timed(lambda: query_stats(conn, 1, granularity, until - window, until))
+                print(f"   {granularity:>6} ({window // 3600:>4}h): {ms:7.2f} ms, {len(buckets):>5} intervalos "
+                      f"por {used}, {sum(totals.values()):,} cliques")
+
+        if args.raw_sample:
+            rows = [dict(event, ip_address=None, user_agent=None)
+                    for event in synthetic_clicks(args.raw_sample, args.splits, args.destinations, start, rng)]
+            with engine.begin() as conn:
+                conn.execute(text('INSERT INTO click_logs (url_split_id, destination_url, ip_address, user_agent, '
+                                  'clicked_at) VALUES (:url_split_id, :destination_url, :ip_address, '
+                                  ':user_agent, :clicked_at)'), rows)
+            raw_query = text("SELECT destination_url, strftime('%Y-%m-%d %H', clicked_at) AS bucket, COUNT(*) "
+                             "FROM click_logs WHERE url_split_id = 1 GROUP BY destination_url, bucket")
+            with engine.connect() as conn:
+                ms, _ = timed(lambda: conn.execute(raw_query).fetchall(), repeat=3)
+            print(f"🐢 GROUP BY direto em {args.raw_sample:,} cliques brutos (por hora): {ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
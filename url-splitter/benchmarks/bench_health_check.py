@@ -0,0 +1,211 @@
+"""
+Benchmark do verificador de saúde dos destinos e do failover
+
+1. Rodada de verificação: um servidor HTTP local (asyncio, numa thread)
+   responde --urls caminhos espalhados por --hosts endereços 127.0.0.x; uma
+   parte devolve 500, 404, demora mais que o timeout ou aponta para uma porta
+   fechada. Mede o tempo de HealthChecker.check_once (concorrência limitada,
+   por host e global) contra sondas sequenciais com urllib numa amostra, e
+   confere a classificação de cada URL.
+2. Failover: split com pesos 40/30/20/10 e um destino fora do ar no arquivo
+   de estado; confere que o tráfego se redistribui na proporção dos pesos
+   restantes (rota Flask) e que, no modo sticky, só os visitantes do destino
+   fora do ar mudam de destino.
+
+Uso: python benchmarks/bench_health_check.py [--urls 20000] [--hosts 50] [--concurrency 200]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from common import make_app
+from http_load import free_port
+
+from src.services.destination_health import HealthChecker, destination_health
+
+# Tipo de cada caminho do servidor local -> está no ar?
+KINDS = (('ok', 0.90, True), ('err', 0.04, False), ('gone', 0.02, False), ('redir', 0.02, True),
+         ('slow', 0.01, False), ('closed', 0.01, False))
+STATUS_LINES = {'ok': b'HTTP/1.1 200 OK', 'err': b'HTTP/1.1 503 Service Unavailable',
+                'gone': b'HTTP/1.1 404 Not Found', 'redir': b'HTTP/1.1 301 Moved Permanently'}
+
+
+class StubServer:
+    """Servidor HTTP mínimo: o status depende do primeiro segmento do caminho"""
+
+    def __init__(self, port, slow_seconds):
+        self.port = port
+        self.slow_seconds = slow_seconds
+        self.requests = 0
+        self.ready = threading.Event()
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            self.requests += 1
+            kind = head.split(b' ', 2)[1].split(b'/')[1].decode()
+            if kind == 'slow':
+                await asyncio.sleep(self.slow_seconds)
+            else:
+                writer.write(STATUS_LINES[kind] + b'\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def run(self):
+        async def main():
+            server = await asyncio.start_server(self.handle, '0.0.0.0', self.port, backlog=4096)
+            self.ready.set()
+            async with server:
+                await server.serve_forever()
+        asyncio.run(main())
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        self.ready.wait(10)
+
+
+def make_urls(count, hosts, port, closed_port, rng):
+    """{url: está no ar?} com os tipos sorteados nas proporções de KINDS"""
+    urls = {}
+    names = [kind for kind, _, _ in KINDS]
+    weights = [share for _, share, _ in KINDS]
+    healthy = {kind: up for kind, _, up in KINDS}
+    for i in range(count):
+        kind = rng.choices(names, weights)[0]
+        host = f'127.0.0.{1 + i % hosts}'
+        if kind == 'closed':
+            urls[f'http://{host}:{closed_port}/ok/{i}'] = False
+        else:
+            urls[f'http://{host}:{port}/{kind}/{i}?utm_source=bench'] = healthy[kind]
+    return urls
+
+
+def serial_probe(url, timeout):
+    request = urllib.request.Request(url, method='HEAD')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout):
+            pass
+    except (urllib.error.URLError, OSError):
+        pass
+
+
+def check_round(args, rng):
+    port, closed_port = free_port(), free_port()
+    server = StubServer(port, args.timeout * 2)
+    server.start()
+    urls = make_urls(args.urls, args.hosts, port, closed_port, rng)
+    checker = HealthChecker(timeout=args.timeout, concurrency=args.concurrency, per_host=args.per_host,
+                            failures=1)
+    start = time.perf_counter()
+    unhealthy = asyncio.run(checker.check_once(urls))
+    elapsed = time.perf_counter() - start
+    expected = {url for url, up in urls.items() if not up}
+    wrong = expected.symmetric_difference(unhealthy)
+    print(f"⏱️ check_once: {len(urls)} URLs em {args.hosts} hosts, concorrência {args.concurrency} "
+          f"({args.per_host} por host), timeout {args.timeout:g}s: {elapsed:.2f} s "
+          f"({len(urls) / elapsed:,.0f} URLs/s)")
+    print(f"{'✅' if not wrong else '❌'} {len(unhealthy)} fora do ar (esperado {len(expected)}), "
+          f"classificações erradas: {len(wrong)}")
+    errors = {}
+    for state in unhealthy.values():
+        reason = state.error.split(':')[0]
+        errors[reason] = errors.get(reason, 0) + 1
+    print(f"   motivos: {dict(sorted(errors.items()))}")
+
+    # Referência: sondas sequenciais (urllib) numa amostra, extrapoladas para todas as URLs
+    sample = rng.sample(list(urls), min(args.serial_sample, len(urls)))
+    start = time.perf_counter()
+    for url in sample:
+        serial_probe(url, args.timeout)
+    serial = (time.perf_counter() - start) / len(sample) * len(urls)
+    print(f"⏱️ sequencial (urllib, {len(sample)} URLs extrapoladas): {serial:.1f} s por rodada "
+          f"({serial / elapsed:.0f}x mais lento)")
+
+
+def failover_check(args):
+    data_dir = tempfile.mkdtemp(prefix='url-splitter-health-')
+    state_path = os.path.join(data_dir, 'destination_health.json')
+    app = make_app(os.path.join(data_dir, 'bench.db'), CLICK_LOGGING_ENABLED=False,
+                   HEALTH_STATE_PATH=state_path, SPLIT_CACHE_CHECK_INTERVAL=0.0)
+    destination_health.init_app(app)
+    client = app.test_client()
+    destinations = [f'https://{name}.example.com/' for name in 'abcd']
+    weights = [40, 30, 20, 10]
+    for slug, sticky in (('pesos', None), ('sticky', 'param')):
+        response = client.post('/api/splits', json={'slug': slug, 'name': slug, 'destinations': destinations,
+                                                    'weights': weights, 'sticky_mode': sticky,
+                                                    'sticky_param': 'vid' if sticky else None})
+        assert response.status_code == 201, response.get_json()
+
+    def sticky_assignments():
+        return [client.get(f'/api/r/sticky?vid=v{i}').headers['Location'] for i in range(args.visitors)]
+
+    before = sticky_assignments()
+    down = destinations[1]
+    with open(state_path, 'w') as f:
+        json.dump({'checked_at': time.time(), 'interval': 30, 'unhealthy': [down]}, f)
+
+    counts = dict.fromkeys(destinations, 0)
+    start = time.perf_counter()
+    for _ in range(args.visitors):
+        counts[client.get('/api/r/pesos').headers['Location']] += 1
+    elapsed = (time.perf_counter() - start) / args.visitors
+    healthy_total = sum(w for d, w in zip(destinations, weights) if d != down)
+    print(f"📐 Distribuição com {down} fora do ar ({args.visitors} redirecionamentos, {elapsed * 1e6:.0f} µs cada):")
+    for dest, weight in zip(destinations, weights):
+        expected = 0 if dest == down else weight / healthy_total
+        print(f"   {dest:<28} peso {weight:>3}  esperado {expected:6.1%}  obtido {counts[dest] / args.visitors:6.1%}")
+
+    after = sticky_assignments()
+    moved = [(old, new) for old, new in zip(before, after) if old != new]
+    wrongly_moved = sum(old != down for old, _ in moved)
+    on_down = sum(old == down for old in before)
+    still_down = sum(new == down for new in after)
+    print(f"{'✅' if not wrongly_moved and not still_down else '❌'} sticky: {len(moved)} de {args.visitors} "
+          f"visitantes mudaram ({on_down} estavam no destino fora do ar); mudanças indevidas: {wrongly_moved}, "
+          f"ainda no destino fora do ar: {still_down}")
+    targets = {dest: sum(new == dest for _, new in moved) / max(len(moved), 1) for dest in destinations if dest != down}
+    print("   destino dos que mudaram: " + ', '.join(f'{d.split("//")[1].split(".")[0]} {share:.0%}'
+                                                    for d, share in targets.items()))
+
+    # Verificador parado: estado velho é ignorado e o destino volta a receber tráfego
+    with open(state_path, 'w') as f:
+        json.dump({'checked_at': time.time() - 1000, 'interval': 30, 'unhealthy': [down]}, f)
+    stale = sum(client.get('/api/r/pesos').headers['Location'] == down for _ in range(2000))
+    print(f"{'✅' if stale else '❌'} estado velho ignorado: {stale / 2000:.0%} do tráfego de volta ao destino")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--urls', type=int, default=20000)
+    parser.add_argument('--hosts', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--per-host', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=1.0)
+    parser.add_argument('--serial-sample', type=int, default=300)
+    parser.add_argument('--visitors', type=int, default=20000)
+    args = parser.parse_args()
+    rng = random.Random(42)
+    # Um aviso por destino fora do ar: milhares de linhas aqui
+    logging.getLogger('url_splitter.destination_health').setLevel(logging.ERROR)
+    check_round(args, rng)
+    failover_check(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Load test do redirecionamento com logging desligado x ligado
+
+Mede p50/p99 de GET /api/r/<slug> (test client, sem rede) em três modos:
+logging em WARNING, DEBUG síncrono sem amostragem (equivalente aos prints
+antigos) e DEBUG assíncrono com amostragem. A saída vai para um arquivo
+temporário; os modos são intercalados em rodadas para diluir aquecimento.
+
+Uso: python benchmarks/bench_logging.py [--requests 20000] [--rounds 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import make_app
+from src.services.logging_setup import configure_logging
+
+MODES = {
+    'desligado (WARNING)': {'LOG_LEVEL': 'WARNING'},
+    'DEBUG síncrono, sem amostragem': {'LOG_LEVEL': 'DEBUG', 'LOG_ASYNC': False, 'LOG_REDIRECT_SAMPLE_RATE': 1.0},
+    'DEBUG assíncrono, amostragem 1%': {'LOG_LEVEL': 'DEBUG', 'LOG_ASYNC': True, 'LOG_REDIRECT_SAMPLE_RATE': 0.01},
+}
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_mode(app, client, config, requests, log_path):
+    app.config.update(config)
+    stdout = sys.stdout
+    sys.stdout = open(log_path, 'a')
+    try:
+        handler = configure_logging(app)
+        latencies = []
+        for i in range(requests):
+            # 1 em cada 10 requisições é um slug inexistente (como bots)
+            path = '/api/r/bench' if i % 10 else f'/api/r/missing-{i}'
+            start = time.perf_counter()
+            client.get(path)
+            latencies.append(time.perf_counter() - start)
+        if hasattr(handler, 'stop'):
+            handler.stop()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    app = make_app(CLICK_LOGGING_ENABLED=False)
+    client = app.test_client()
+    client.post('/api/splits', json={'slug': 'bench', 'name': 'Bench',
+                                     'destinations': ['https://a.example', 'https://b.example']})
+    log_path = os.path.join(tempfile.mkdtemp(prefix='url-splitter-bench-'), 'bench.log')
+
+    run_mode(app, client, MODES['desligado (WARNING)'], 2000, log_path)  # aquecimento
+    results = {label: [] for label in MODES}
+    for _ in range(args.rounds):
+        for label, config in MODES.items():
+            results[label] += run_mode(app, client, config, args.requests // args.rounds, log_path)
+
+    print(f"⏱️ Redirecionamento ({args.requests} requisições por modo, log em {log_path})")
+    for label, latencies in results.items():
+        latencies.sort()
+        print(f"   {label:<34} p50 {percentile(latencies, 0.5) * 1e6:7.0f} µs   "
+              f"p99 {percentile(latencies, 0.99) * 1e6:7.0f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Load test do redirecionamento: rota Flask (gunicorn sync) x servidor assíncrono
+
+Sobe cada servidor contra o mesmo banco temporário (com --splits splits) e
+dispara GET /api/r/<slug> com conexões concorrentes por --seconds segundos,
+medindo requisições/s e latência p50/p99. Roda com 1 worker e com N workers
+(--cores, padrão "1,<núcleos da máquina>"). O gerador de carga roda em
+processos separados (--client-procs) e divide a mesma máquina com o servidor.
+Com --method HEAD mede o caminho de sondagem (sem sorteio nem clique).
+
+Uso: python benchmarks/bench_redirect_server.py [--cores 1,4] [--connections 64] [--seconds 10] [--method HEAD]
+"""
+import argparse
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from common import make_app
+from http_load import (free_port, gunicorn_command, load, percentile, redirect_server_command, start_server,
+                       stop_server)
+
+
+def wsgi_app():
+    """Fábrica usada pelo gunicorn: a rota Flask atual sobre o banco do benchmark"""
+    return make_app(os.environ['BENCH_DB_PATH'])
+
+
+def prepare(splits):
+    app = make_app(CLICK_LOGGING_ENABLED=False)
+    client = app.test_client()
+    for i in range(splits):
+        client.post('/api/splits', json={
+            'slug': f'bench-{i}', 'name': f'Bench {i}',
+            'destinations': ['https://a.example/x', 'https://b.example/y', 'https://c.example/z'],
+            'weights': [50, 30, 20],
+        })
+    return app.db_path
+
+
+def server_command(kind, workers, port):
+    if kind == 'flask':
+        return gunicorn_command('bench_redirect_server:wsgi_app()', workers, port)
+    return redirect_server_command(workers, port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cores', default=f'1,{os.cpu_count() or 1}')
+    parser.add_argument('--splits', type=int, default=1000)
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--client-procs', type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--servers', default='flask,async')
+    parser.add_argument('--method', default='GET', choices=('GET', 'HEAD'))
+    args = parser.parse_args()
+
+    db_path = prepare(args.splits)
+    paths = [f'/api/r/bench-{i}' for i in range(args.splits)]
+    cores = sorted({int(c) for c in args.cores.split(',')})
+
+    print(f"⏱️ Redirecionamento ({args.method}): {args.splits} splits, {args.connections} conexões, "
+          f"{args.seconds:.0f}s por rodada, {args.client_procs} processo(s) de carga")
+    for workers in cores:
+        for kind in args.servers.split(','):
+            port = free_port()
+            server = start_server(server_command(kind, workers, port), port, name=f'servidor {kind}', env={
+                'BENCH_DB_PATH': db_path, 'DATABASE_PATH': db_path, 'LOG_LEVEL': 'WARNING'})
+            try:
+                latencies, errors = load(port, paths, args.connections, args.seconds, args.client_procs,
+                                         args.method)
+            finally:
+                stop_server(server)
+            rps = len(latencies) / args.seconds
+            print(f"   {kind:<6} {workers:>2} worker(s): {rps:9.0f} req/s   "
+                  f"p50 {percentile(latencies, 0.5) * 1e3:7.2f} ms   "
+                  f"p99 {percentile(latencies, 0.99) * 1e3:7.2f} ms   erros {errors}")
+
+
+if __name__ == '__main__':
+    main()
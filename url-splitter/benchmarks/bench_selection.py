@@ -0,0 +1,85 @@
+"""
+Benchmark da seleção ponderada: random.choices (caminho antigo) x tabela de alias
+
+Também verifica estatisticamente (qui-quadrado) que a distribuição observada
+bate com os pesos configurados.
+
+Uso: python benchmarks/bench_selection.py [--picks 200000] [--seed 42]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.selection import AliasTable
+
+
+def chi_square_critical(df, z=3.09):
+    """Valor crítico aproximado (Wilson-Hilferty); z=3.09 ~ nível de 0.1%"""
+    a = 2.0 / (9.0 * df)
+    return df * (1.0 - a + z * math.sqrt(a)) ** 3
+
+
+def check_distribution(weights, picks, rng):
+    """Retorna (estatística, crítico) do teste de aderência para uma tabela"""
+    table = AliasTable(weights)
+    counts = [0] * len(weights)
+    for _ in range(picks):
+        counts[table.sample(rng.random)] += 1
+    total = float(sum(weights))
+    stat = 0.0
+    for count, weight in zip(counts, weights):
+        expected = picks * weight / total
+        stat += (count - expected) ** 2 / expected
+    return stat, chi_square_critical(len(weights) - 1)
+
+
+def bench(n, picks):
+    destinations = [f'https://example.com/{i}' for i in range(n)]
+    weights = [random.uniform(1, 100) for _ in range(n)]
+    table = AliasTable(weights)
+
+    choices = timeit.timeit(lambda: random.choices(destinations, weights=weights)[0], number=picks)
+    alias = timeit.timeit(lambda: destinations[table.sample()], number=picks)
+    build = timeit.timeit(lambda: AliasTable(weights), number=100) / 100
+    return choices / picks * 1e9, alias / picks * 1e9, build * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--picks', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+
+    print("📐 Aderência (qui-quadrado)")
+    cases = {
+        '2 destinos 80/20': [80, 20],
+        '4 destinos iguais': [25, 25, 25, 25],
+        '10 destinos enviesados': [50, 20, 10, 5, 5, 4, 3, 1, 1, 1],
+        '100 destinos aleatórios': [rng.uniform(0.5, 10) for _ in range(100)],
+    }
+    failed = False
+    for name, weights in cases.items():
+        stat, critical = check_distribution(weights, args.picks, rng)
+        ok = stat < critical
+        failed |= not ok
+        print(f"   {'✅' if ok else '❌'} {name}: chi2={stat:.1f} (crítico {critical:.1f})")
+
+    print("⏱️ Custo por escolha (ns)")
+    print(f"   {'destinos':>8} {'choices':>10} {'alias':>10} {'build (µs)':>11}")
+    for n in (2, 10, 100, 1000):
+        choices, alias, build = bench(n, args.picks)
+        print(f"   {n:>8} {choices:>10.0f} {alias:>10.0f} {build:>11.1f}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
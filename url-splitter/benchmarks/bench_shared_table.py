@@ -0,0 +1,142 @@
+"""
+Benchmark da tabela de splits compartilhada (mmap) x cópia por worker
+
+Compila --splits splits, publica o arquivo compartilhado e compara:
+- memória somada dos workers (Pss de /proc/<pid>/smaps_rollup, que divide as
+  páginas compartilhadas entre os processos) para 1, 2, 4 e 8 workers, com
+  cada worker montando seu dicionário próprio ou mapeando o arquivo (o que
+  sobra por worker no modo compartilhado é o próprio interpretador);
+- custo de lookup + sorteio (normal e sticky) por requisição nos dois modos;
+- tempo de publicação de uma nova geração.
+
+Uso: python benchmarks/bench_shared_table.py [--splits 100000] [--workers 1,2,4,8]
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.split_cache import compile_split
+from src.services.shared_table import SharedSplitTable, publish_table
+
+
+def make_rows(count):
+    rng = random.Random(0)
+    rows = []
+    for i in range(count):
+        n = 2 + i % 4
+        destinations = json.dumps([f'https://dest{j}.example/campanha/{i}' for j in range(n)])
+        weights = json.dumps([rng.randint(1, 100) for _ in range(n)])
+        sticky = 'cookie' if i % 100 == 0 else None
+        rows.append((i + 1, f'slug-{i}', destinations, weights, sticky))
+    return rows
+
+
+def compile_rows(rows):
+    return {slug: compile_split(split_id, slug, dest, weights, sticky)
+            for split_id, slug, dest, weights, sticky in rows}
+
+
+def pss_kb():
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1])
+    return 0
+
+
+def worker(mode, count, path, ready, done, results):
+    # Processo novo (spawn): nada herdado do pai, como um worker carregando do banco
+    if mode == 'dict':
+        rows = make_rows(count)
+        table = compile_rows(rows)
+        del rows
+        gc.collect()
+        for i in range(count):
+            table[f'slug-{i}'].pick()
+    else:
+        table = SharedSplitTable(path)
+        for i in range(count):
+            table.get(f'slug-{i}')[1].pick()
+    ready.wait()  # todos carregados antes de medir
+    results.put(pss_kb())
+    done.wait()
+
+
+def measure_memory(mode, workers, count, path):
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Barrier(workers + 1)
+    done = ctx.Event()
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(mode, count, path, ready, done, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    ready.wait()
+    total = sum(results.get() for _ in range(workers))
+    done.set()
+    for process in processes:
+        process.join()
+    return total
+
+
+def measure_lookups(table_get, slugs, sticky=False, rounds=200000):
+    picks = [random.choice(slugs) for _ in range(rounds)]
+    start = time.perf_counter()
+    if sticky:
+        for i, slug in enumerate(picks):
+            table_get(slug)[1].pick_sticky(f'visitante-{i}')
+    else:
+        for slug in picks:
+            table_get(slug)[1].pick()
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--splits', type=int, default=100000)
+    parser.add_argument('--workers', default='1,2,4,8')
+    args = parser.parse_args()
+
+    rows = make_rows(args.splits)
+    slugs = [row[1] for row in rows]
+    path = os.path.join(tempfile.mkdtemp(prefix='url-splitter-bench-'), 'split_table.bin')
+
+    start = time.perf_counter()
+    compiled = compile_rows(rows)
+    compile_time = time.perf_counter() - start
+    start = time.perf_counter()
+    size = publish_table(path, compiled, 1)
+    publish_time = time.perf_counter() - start
+
+    print(f"📦 {args.splits} splits: compilação {compile_time:.2f}s, publicação {publish_time:.2f}s, "
+          f"arquivo {size / 1e6:.1f} MB")
+
+    def local_get(slug):
+        return True, compiled[slug]
+    shared = SharedSplitTable(path)
+    sticky_slugs = [slug for slug in slugs if compiled[slug].sticky_mode]
+    print(f"⏱️ lookup + sorteio: dict {measure_lookups(local_get, slugs) * 1e6:.2f} µs   "
+          f"mmap {measure_lookups(shared.get, slugs) * 1e6:.2f} µs")
+    print(f"⏱️ lookup + sticky:  dict {measure_lookups(local_get, sticky_slugs, True) * 1e6:.2f} µs   "
+          f"mmap {measure_lookups(shared.get, sticky_slugs, True) * 1e6:.2f} µs")
+    del compiled, rows
+    gc.collect()
+
+    print("🧠 Memória somada dos workers (Pss):")
+    for workers in sorted(int(w) for w in args.workers.split(',')):
+        dict_kb = measure_memory('dict', workers, args.splits, path)
+        shared_kb = measure_memory('shared', workers, args.splits, path)
+        print(f"   {workers} worker(s): cópia por worker {dict_kb / 1024:8.1f} MB   "
+              f"compartilhada {shared_kb / 1024:8.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark de concorrência do SQLite: leitura de splits + gravação de cliques
+
+Roda a mesma carga mista (processos leitores consultando slugs e processos
+escritores gravando lotes de cliques) com o SQLite padrão (journal DELETE,
+sem pragmas) e com o ajuste de src/services/database.py (WAL + pragmas).
+
+Uso: python benchmarks/bench_sqlite_concurrency.py [--readers 4] [--writers 2] [--seconds 5]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.database import DEFAULT_PRAGMAS, apply_sqlite_pragmas
+
+SPLITS = 10000
+
+
+def prepare(path, tuned):
+    conn = sqlite3.connect(path)
+    if tuned:
+        apply_sqlite_pragmas(conn, DEFAULT_PRAGMAS)
+    conn.executescript('''
+        CREATE TABLE url_splits (id INTEGER PRIMARY KEY, slug TEXT UNIQUE, destinations TEXT,
+                                 weights TEXT, total_clicks INTEGER DEFAULT 0);
+        CREATE TABLE click_logs (id INTEGER PRIMARY KEY, url_split_id INTEGER, destination_url TEXT,
+                                 ip_address TEXT, user_agent TEXT, clicked_at TEXT);
+        CREATE INDEX ix_click_logs_split_clicked ON click_logs (url_split_id, clicked_at);
+    ''')
+    conn.executemany('INSERT INTO url_splits (slug, destinations, weights) VALUES (?, ?, ?)',
+                     [(f's{i}', '["https://a.example", "https://b.example"]', '[50, 50]')
+                      for i in range(SPLITS)])
+    conn.commit()
+    conn.close()
+
+
+def worker(path, tuned, role, seconds, results):
+    conn = sqlite3.connect(path, timeout=5)
+    if tuned:
+        apply_sqlite_pragmas(conn, DEFAULT_PRAGMAS)
+    rng = random.Random(os.getpid())
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if role == 'reader':
+                conn.execute('SELECT id, destinations, weights FROM url_splits WHERE slug = ?',
+                             (f's{rng.randrange(SPLITS)}',)).fetchone()
+            else:
+                split_id = rng.randrange(1, SPLITS)
+                with conn:
+                    conn.executemany(
+                        'INSERT INTO click_logs (url_split_id, destination_url, ip_address, user_agent, clicked_at) '
+                        'VALUES (?, ?, ?, ?, datetime())',
+                        [(split_id, 'https://a.example', '203.0.113.1', 'bench')] * 200)
+                    conn.execute('UPDATE url_splits SET total_clicks = total_clicks + 200 WHERE id = ?',
+                                 (split_id,))
+        except sqlite3.OperationalError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    results.put((role, latencies, errors))
+
+
+def run(tuned, readers, writers, seconds):
+    path = os.path.join(tempfile.mkdtemp(prefix='url-splitter-bench-'), 'concurrency.db')
+    prepare(path, tuned)
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(path, tuned, role, seconds, results))
+             for role in ['reader'] * readers + ['writer'] * writers]
+    for p in procs:
+        p.start()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    summary = {}
+    for role in ('reader', 'writer'):
+        latencies = sorted(l for r, ls, _ in collected if r == role for l in ls)
+        errors = sum(e for r, _, e in collected if r == role)
+        if not latencies:
+            continue
+        summary[role] = {
+            'ops_per_s': len(latencies) / seconds,
+            'p50_ms': latencies[len(latencies) // 2] * 1000,
+            'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+            'errors': errors,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    for label, tuned in (('padrão (DELETE)', False), ('ajustado (WAL)', True)):
+        summary = run(tuned, args.readers, args.writers, args.seconds)
+        print(f"🗄️ {label}")
+        for role, stats in summary.items():
+            print(f"   {role:>6}: {stats['ops_per_s']:>9,.0f} ops/s  p50 {stats['p50_ms']:.2f} ms  "
+                  f"p99 {stats['p99_ms']:.2f} ms  erros {stats['errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark da inicialização: boot de worker antigo (tudo no import) x create_app
+
+Sobre um banco gerado por seed.py (--splits, --clicks), mede em processos
+novos (imports incluídos):
+
+- legado: create_app + prepare_app em cada worker (backup, create_all,
+  migrações e contagem, como o import do src/main.py fazia);
+- create_app: o boot de um worker hoje (sem tocar no banco);
+- create_app + pré-carga: com SPLIT_CACHE_WARMUP = --warmup;
+- prepare_app: o passo único, rodado uma vez por deploy.
+
+Para cada caso mostra também a latência dos primeiros redirecionamentos aos
+splits mais acessados (cache frio x pré-carregado). Por fim sobe o gunicorn
+com --workers workers nos dois modos e mede o tempo até a primeira resposta
+e quantos backups cada boot deixou.
+
+Uso: python benchmarks/bench_startup.py [--splits 20000] [--clicks 200000] [--workers 4] [--warmup 1000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from common import make_app
+from http_load import free_port
+from seed import generate, split_slug
+
+# Executado num processo novo: imprime os tempos em JSON
+BOOT_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from src.main import create_app, prepare_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+if {mode!r} in ('legacy', 'prepare'):
+    prepare_app(app)
+booted = time.perf_counter()
+latencies = []
+if {mode!r} != 'prepare':
+    client = app.test_client()
+    for slug in {slugs!r}:
+        t = time.perf_counter()
+        client.get('/api/r/' + slug)
+        latencies.append(time.perf_counter() - t)
+print(json.dumps({{'import': imported - start, 'create_app': created - imported,
+                  'boot': booted - start, 'first_redirects': latencies}}))
+'''
+
+
+def legacy_app():
+    """Fábrica usada pelo gunicorn no modo legado: passos únicos em cada worker"""
+    from src.main import create_app, prepare_app
+    app = create_app()
+    prepare_app(app)
+    return app
+
+
+def boot(mode, env, slugs):
+    script = BOOT_SCRIPT.format(root=ROOT, mode=mode, slugs=slugs)
+    output = subprocess.run([sys.executable, '-c', script], env=env, cwd=ROOT, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def wait_ready(port, deadline):
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=5) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+
+def gunicorn_boot(legacy, workers, env):
+    """Tempo do start do gunicorn até a primeira resposta de /api/health"""
+    port = free_port()
+    if legacy:
+        cmd = [sys.executable, '-m', 'gunicorn', '--chdir', BENCH_DIR, '-w', str(workers),
+               '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'bench_startup:legacy_app()']
+    else:
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'src', 'gunicorn_conf.py'),
+               '-w', str(workers), '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'src.main:create_app()']
+    start = time.time()
+    process = subprocess.Popen(cmd, env=env, cwd=ROOT, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_ready(port, start + 120):
+            raise RuntimeError('gunicorn não respondeu')
+        return time.time() - start
+    finally:
+        # Workers ainda no boot só saem depois do graceful timeout do gunicorn
+        process.terminate()
+        process.wait(60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--splits', type=int, default=20000)
+    parser.add_argument('--clicks', type=int, default=200000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=1000)
+    parser.add_argument('--first-requests', type=int, default=200)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='url-splitter-startup-')
+    db_path = os.path.join(data_dir, 'data', 'url_splitter.db')
+    os.makedirs(os.path.dirname(db_path))
+    app = make_app(db_path, CLICK_LOGGING_ENABLED=False)
+    generate(app, args.splits, 3, args.clicks)
+    size = os.path.getsize(db_path) / 1e6
+    print(f"🌱 {args.splits} splits, {args.clicks:,} cliques ({size:.0f} MB)")
+
+    env = dict(os.environ, DATABASE_PATH=db_path, BACKUP_DIR=os.path.join(data_dir, 'backups'),
+               BACKUP_KEEP='1000', CLICK_PARTITION_DIR='', LOG_LEVEL='WARNING')
+    # Os mais acessados (seed.py distribui os cliques em Zipf pelos primeiros splits)
+    slugs = [split_slug(i % args.warmup) for i in range(args.first_requests)]
+    cases = [
+        ('legado (tudo no import)', 'legacy', env),
+        ('create_app', 'create', env),
+        (f'create_app + pré-carga {args.warmup}', 'create', dict(env, SPLIT_CACHE_WARMUP=str(args.warmup))),
+        ('prepare_app (uma vez)', 'prepare', env),
+    ]
+    print(f"⏱️ Boot de um processo (import incluído), primeiros {args.first_requests} redirecionamentos:")
+    for label, mode, case_env in cases:
+        result = boot(mode, case_env, slugs)
+        line = (f"   {label:<32} boot {result['boot'] * 1e3:8.1f} ms "
+                f"(import {result['import'] * 1e3:6.1f} ms, create_app {result['create_app'] * 1e3:6.1f} ms)")
+        if result['first_redirects']:
+            latencies = sorted(result['first_redirects'])
+            line += (f"   redirecionamentos: total {sum(latencies) * 1e3:6.1f} ms, "
+                     f"máx {latencies[-1] * 1e3:5.2f} ms")
+        print(line)
+
+    print(f"⏱️ gunicorn com {args.workers} workers até a primeira resposta:")
+    for label, legacy in (('legado (cada worker prepara)', True), ('gunicorn_conf (mestre prepara)', False)):
+        before = len(os.listdir(env['BACKUP_DIR']))
+        elapsed = gunicorn_boot(legacy, args.workers, env)
+        backups = len(os.listdir(env['BACKUP_DIR']))
+        print(f"   {label:<32} {elapsed * 1e3:8.0f} ms   backups feitos: {backups - before}")
+
+
+if __name__ == '__main__':
+    main()
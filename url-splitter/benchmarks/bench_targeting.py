@@ -0,0 +1,197 @@
+"""
+Benchmark das regras de direcionamento (país, dispositivo, sistema, idioma)
+
+1. Faixas de GeoIP: gera --ranges faixas IPv4 aleatórias num CSV temporário,
+   mede a carga e o custo de GeoIPRanges.lookup (bisect) e confere contra a
+   amostra de src/data/geoip_sample.csv.
+2. Avaliação: --rules regras aleatórias compiladas num RuleIndex; mede
+   Targeting.route por visitante (user-agents e Accept-Language variados, com
+   e sem cache) e confere cada resultado com uma varredura linear das regras.
+3. Rota Flask: latência de GET /api/r/<slug> de um split com --rules regras
+   contra um split só com pesos.
+
+Uso: python benchmarks/bench_targeting.py [--rules 5000] [--ranges 200000] [--visitors 100000] [--check 2000]
+"""
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from common import make_app
+
+from src.services.targeting import (DEVICE_CLASSES, OS_FAMILIES, GeoIPRanges, RuleIndex, device_class,
+                                    language_keys, normalize_rules, os_family, targeting)
+
+SAMPLE_RANGES = os.path.join(ROOT, 'src', 'data', 'geoip_sample.csv')
+SAMPLE_EXPECTED = {'10.1.2.3': 'BR', '10.70.0.1': 'US', '10.130.0.1': 'PT', '10.200.0.1': 'DE',
+                   '192.0.2.10': 'BR', '198.51.100.10': 'US', '203.0.113.10': 'PT', '2001:db8::1': 'DE',
+                   '::ffff:10.70.0.1': 'US', '8.8.8.8': None}
+# 'AA'..'ZZ': regras estreitas, como campanhas por país (a varredura linear vai fundo na lista)
+COUNTRIES = tuple(a + b for a in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' for b in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ')[:200]
+LANGUAGES = ('pt', 'pt-br', 'en', 'en-us', 'es', 'de', 'fr', 'it', 'ja')
+USER_AGENTS = (
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_{v} like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android 13; SM-A536B) AppleWebKit/537.36 Chrome/{v}.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Linux; Android 13; SM-T970) AppleWebKit/537.36 Chrome/{v}.0 Safari/537.36',
+    'Mozilla/5.0 (iPad; CPU OS 17_{v} like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/{v}.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_{v}) AppleWebKit/605.1.15 Version/17.0 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:{v}.0) Gecko/20100101 Firefox/{v}.0',
+)
+ACCEPT_LANGUAGES = ('pt-BR,pt;q=0.9,en;q=0.8', 'en-US,en;q=0.9', 'es-ES,es;q=0.9', 'de-DE,de;q=0.9,en;q=0.5',
+                    'fr-FR,fr;q=0.9', 'ja', 'it-IT,it;q=0.8,en;q=0.6', '')
+
+
+def write_ranges(path, count, rng):
+    """Faixas IPv4 disjuntas em ordem aleatória no formato inicio,fim,país"""
+    starts = sorted(rng.sample(range(1 << 24, (224 << 24) - 512, 256), count))
+    rows = [(start, start + rng.randint(0, 255), rng.choice(COUNTRIES)) for start in starts]
+    rng.shuffle(rows)
+    with open(path, 'w') as f:
+        f.write('start_ip,end_ip,country\n')
+        for start, end, country in rows:
+            f.write(f'{ipaddress.IPv4Address(start)},{ipaddress.IPv4Address(end)},{country}\n')
+    return rows
+
+
+def random_rules(count, rng):
+    """Cada regra fixa 1-2 países e, às vezes, dispositivo, sistema e idioma"""
+    rules = []
+    for i in range(count):
+        match = {'country': rng.sample(COUNTRIES, rng.randint(1, 2))}
+        for dimension, values, chance in (('device', DEVICE_CLASSES, 0.6), ('os', OS_FAMILIES, 0.3),
+                                          ('language', LANGUAGES, 0.5)):
+            if rng.random() < chance:
+                match[dimension] = rng.sample(values, rng.randint(1, 2))
+        rules.append({'match': match, 'destination': f'https://rule{i}.example.com/'})
+    return rules
+
+
+def linear_route(rules, country, device, os_name, languages):
+    """Referência: primeira regra que casa, varrendo a lista"""
+    features = {'country': (country,) if country else (), 'device': (device,), 'os': (os_name,),
+                'language': languages}
+    for rule in rules:
+        if all(any(value in accepted for value in features[dimension])
+               for dimension, accepted in rule['match'].items()):
+            return rule['destination']
+    return None
+
+
+def visitors(count, range_rows, rng):
+    result = []
+    for _ in range(count):
+        start, end, _ = rng.choice(range_rows)
+        # 10% fora de qualquer faixa (sem país)
+        ip = (str(ipaddress.IPv4Address(rng.randint(start, end))) if rng.random() < 0.9
+              else f'100.64.0.{rng.randint(1, 254)}')
+        headers = {'user-agent': rng.choice(USER_AGENTS).format(v=rng.randint(100, 130)),
+                   'accept-language': rng.choice(ACCEPT_LANGUAGES)}
+        result.append((ip, headers))
+    return result
+
+
+def time_route(index, items):
+    route = targeting.route
+    start = time.perf_counter()
+    for ip, headers in items:
+        route(index, ip, headers)
+    return (time.perf_counter() - start) / len(items)
+
+
+def time_redirects(client, slug, items):
+    start = time.perf_counter()
+    for ip, headers in items:
+        response = client.get(f'/api/r/{slug}', headers={'User-Agent': headers['user-agent'],
+                                                         'Accept-Language': headers['accept-language'],
+                                                         'X-Forwarded-For': ip})
+        assert response.status_code == 302, response.status_code
+    return (time.perf_counter() - start) / len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rules', type=int, default=5000)
+    parser.add_argument('--ranges', type=int, default=200000)
+    parser.add_argument('--visitors', type=int, default=100000)
+    parser.add_argument('--check', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    sample = GeoIPRanges.load(SAMPLE_RANGES)
+    wrong = {ip: sample.lookup(ip) for ip, country in SAMPLE_EXPECTED.items() if sample.lookup(ip) != country}
+    print(f"✅ Amostra {os.path.relpath(SAMPLE_RANGES, ROOT)}: {len(sample)} faixas"
+          + (f", ❌ divergências: {wrong}" if wrong else ", países conferem"))
+
+    ranges_path = os.path.join(tempfile.mkdtemp(prefix='url-splitter-geoip-'), 'ranges.csv')
+    range_rows = write_ranges(ranges_path, args.ranges, rng)
+    start = time.perf_counter()
+    geoip = GeoIPRanges.load(ranges_path)
+    load_seconds = time.perf_counter() - start
+    items = visitors(args.visitors, range_rows, rng)
+    ips = [ip for ip, _ in items]
+    start = time.perf_counter()
+    countries = [geoip.lookup(ip) for ip in ips]
+    lookup = (time.perf_counter() - start) / len(ips)
+    print(f"⏱️ GeoIP: {len(geoip)} faixas carregadas em {load_seconds * 1e3:.0f} ms, "
+          f"lookup {lookup * 1e6:.2f} µs ({sum(c is not None for c in countries) / len(ips):.0%} com país)")
+
+    targeting.configure(ranges_path)
+    rules, error = normalize_rules(random_rules(args.rules, rng))
+    if error:
+        raise ValueError(error)
+    start = time.perf_counter()
+    index = RuleIndex(rules)
+    compile_seconds = time.perf_counter() - start
+
+    # Conferência contra a varredura linear (lenta: só os primeiros --check visitantes)
+    mismatches = 0
+    matched = 0
+    linear_seconds = 0.0
+    checked = list(zip(items, countries))[:args.check]
+    for (ip, headers), country in checked:
+        got = targeting.route(index, ip, headers)
+        start = time.perf_counter()
+        expected = linear_route(rules, country, device_class(headers['user-agent']),
+                                os_family(headers['user-agent']), language_keys(headers['accept-language']))
+        linear_seconds += time.perf_counter() - start
+        mismatches += got != expected
+        matched += got is not None
+    print(f"✅ {args.rules} regras compiladas em {compile_seconds * 1e3:.0f} ms; {matched / len(checked):.0%} "
+          f"de {len(checked)} visitantes casam com alguma regra; divergências da varredura linear: {mismatches}")
+
+    print(f"⏱️ Targeting.route ({args.rules} regras, {len(items)} visitantes):")
+    print(f"   user-agents repetidos (cache): {time_route(index, items) * 1e6:7.2f} µs")
+    for function in (device_class, os_family, language_keys):
+        function.cache_clear()
+    unique = [(ip, dict(headers, **{'user-agent': f"{headers['user-agent']} build/{i}",
+                                    'accept-language': f"{headers['accept-language']},x-{i % 1000};q=0.1"}))
+              for i, (ip, headers) in enumerate(items)]
+    print(f"   user-agents distintos:         {time_route(index, unique) * 1e6:7.2f} µs")
+    print(f"   varredura linear (referência): {linear_seconds / len(checked) * 1e6:7.2f} µs")
+
+    app = make_app(CLICK_LOGGING_ENABLED=False, TRUSTED_PROXIES=1)
+    targeting.configure(ranges_path)
+    client = app.test_client()
+    destinations = ['https://a.example.com/', 'https://b.example.com/']
+    for slug, targeting_rules in (('pesos', None), ('regras', rules)):
+        response = client.post('/api/splits', json={'slug': slug, 'name': slug, 'destinations': destinations,
+                                                    'weights': [50, 50], 'targeting_rules': targeting_rules})
+        assert response.status_code == 201, response.get_json()
+    requests = items[:args.requests]
+    print(f"⏱️ GET /api/r/<slug> na rota Flask ({len(requests)} requisições, test client):")
+    for slug in ('pesos', 'regras'):
+        time_redirects(client, slug, requests[:200])  # aquece o cache do split
+        print(f"   {slug:<7} {time_redirects(client, slug, requests) * 1e6:8.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark do limite de taxa e do filtro de bots do redirecionamento
+
+Mede o custo por requisição de TrafficFilter.check com --ips IPs distintos
+(padrão 1M) em três cenários: sem limites, limite por IP com o LRU padrão
+(100k chaves, com despejos) e com LRU grande o bastante para todos os IPs
+(memória medida com tracemalloc). Mede também o classificador de
+user-agent com poucos user-agents repetidos (cache) e com todos distintos.
+
+Uso: python benchmarks/bench_traffic_filter.py [--ips 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.split_cache import compile_split
+from src.services.traffic_filter import TrafficFilter
+
+BROWSER_UAS = [
+    'Mozilla/5.0 (Linux; Android 13; SM-A536B) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/{v}.0.0.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_{v} like Mac OS X) AppleWebKit/605.1.15 '
+    '(KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/{v}.0.0.0 Safari/537.36',
+]
+BOT_UAS = [
+    'facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)',
+    'WhatsApp/2.23.{v} A',
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+    'TelegramBot (like TwitterBot)',
+    'curl/8.{v}.0',
+]
+
+
+def make_ips(count):
+    rng = random.Random(0)
+    return [f'{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+            for _ in range(count)]
+
+
+def time_checks(traffic, compiled, ips):
+    check = traffic.check
+    start = time.perf_counter()
+    for ip in ips:
+        check(compiled, ip)
+    return (time.perf_counter() - start) / len(ips)
+
+
+def time_classifier(traffic, user_agents):
+    is_bot = traffic.is_bot
+    start = time.perf_counter()
+    for ua in user_agents:
+        is_bot(ua)
+    return (time.perf_counter() - start) / len(user_agents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ips', type=int, default=1000000)
+    args = parser.parse_args()
+
+    ips = make_ips(args.ips)
+    compiled = compile_split(1, 'bench', ['https://a.example/x', 'https://b.example/y'], [50, 50])
+    print(f"⏱️ TrafficFilter.check com {args.ips} IPs distintos:")
+
+    traffic = TrafficFilter()
+    print(f"   sem limites:                {time_checks(traffic, compiled, ips) * 1e6:6.2f} µs")
+
+    traffic.configure(ip_rate=5, max_keys=100000)
+    time_checks(traffic, compiled, ips)  # aquece o LRU (já cheio na medição)
+    per_call = time_checks(traffic, compiled, ips)
+    print(f"   por IP, LRU 100k (despejos): {per_call * 1e6:6.2f} µs")
+
+    traffic.configure(ip_rate=5, split_rate=100000, max_keys=args.ips)
+    first_pass = time_checks(traffic, compiled, ips)
+    per_call = time_checks(traffic, compiled, ips)
+    print(f"   por IP + split, LRU {args.ips}: {per_call * 1e6:6.2f} µs "
+          f"(1ª passada, criando as chaves: {first_pass * 1e6:.2f} µs)")
+
+    traffic.configure(ip_rate=5, max_keys=args.ips)
+    tracemalloc.start()
+    time_checks(traffic, compiled, ips)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"   memória do LRU: {memory / 1e6:.0f} MB ({memory / max(1, len(traffic.ip_buckets)):.0f} B/IP)")
+
+    rng = random.Random(1)
+    templates = BROWSER_UAS * 4 + BOT_UAS
+    repeated = [rng.choice(templates).format(v=rng.randint(100, 130)) for _ in range(200000)]
+    unique = [f'{ua} build/{i}' for i, ua in enumerate(repeated)]
+    traffic = TrafficFilter()
+    bots = sum(traffic.is_bot(ua) for ua in repeated)
+    traffic = TrafficFilter()
+    print(f"⏱️ Classificador de user-agent ({bots / len(repeated):.0%} bots):")
+    print(f"   user-agents repetidos (cache): {time_classifier(traffic, repeated) * 1e6:6.2f} µs")
+    print(f"   user-agents distintos:         {time_classifier(traffic, unique) * 1e6:6.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
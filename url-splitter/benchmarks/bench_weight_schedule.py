@@ -0,0 +1,139 @@
+"""
+Verificação e benchmark dos planos de pesos agendados
+
+Com um relógio simulado, percorre uma rampa linear (95/5 -> 50/50 em 24h) e
+um plano em degraus de três destinos, sorteando --picks vezes a cada hora, e
+confere se a distribuição realizada acompanha os pesos do plano (desvio de
+no máximo 5 erros-padrão por destino). No modo sticky confere que, com o
+peso de um destino só subindo, nenhum visitante sai dele. Por fim mede o
+custo do sorteio com e sem plano e o da troca de tabela a cada degrau.
+
+Sai com status 1 se alguma verificação falhar.
+
+Uso: python benchmarks/bench_weight_schedule.py [--picks 20000]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.split_cache import compile_split
+from src.services.weight_schedule import SCHEDULE_RESOLUTION
+
+HOUR = 3600.0
+START = 1_800_000_000.0
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def schedule_json(mode, points):
+    return {'mode': mode, 'points': [{'at': at, 'weights': weights} for at, weights in points]}
+
+
+def realized(split, clock, at, picks):
+    clock.now = at
+    counts = dict.fromkeys(split.destinations, 0)
+    for _ in range(picks):
+        counts[split.pick()] += 1
+    return [counts[dest] / picks for dest in split.destinations]
+
+
+def check_distribution(name, split, clock, hours, picks):
+    """Compara, hora a hora, a fração realizada com os pesos do plano"""
+    worst = 0.0
+    failures = 0
+    for hour in range(hours + 1):
+        at = START + hour * HOUR + 1
+        shares = realized(split, clock, at, picks)
+        expected, _ = split.schedule.at(at)
+        for share, p in zip(shares, expected):
+            sigma = math.sqrt(max(p * (1 - p), 1e-12) / picks)
+            deviation = abs(share - p) / sigma if p not in (0.0, 1.0) else abs(share - p) * picks
+            worst = max(worst, deviation)
+            if deviation > 5:
+                failures += 1
+                print(f"   ❌ {name} t+{hour}h: realizado {share:.4f}, esperado {p:.4f}")
+    status = '✅' if not failures else '❌'
+    print(f"{status} {name}: {hours + 1} instantes x {picks} sorteios, maior desvio {worst:.2f} erros-padrão")
+    return failures == 0
+
+
+def check_sticky(split, clock, visitors=20000):
+    """Com o peso de B só subindo, quem já caiu em B continua em B"""
+    previous = None
+    moved = 0
+    for hour in range(0, 25, 2):
+        clock.now = START + hour * HOUR + 1
+        assigned = {v: split.pick_sticky(f'visitante-{v}') for v in range(visitors)}
+        if previous is not None:
+            moved += sum(1 for v, dest in previous.items()
+                         if dest == split.destinations[1] and assigned[v] != dest)
+        previous = assigned
+    share = sum(1 for dest in previous.values() if dest == split.destinations[1]) / visitors
+    ok = moved == 0
+    print(f"{'✅' if ok else '❌'} sticky na rampa: {moved} visitantes saíram de B; "
+          f"B ao fim com {share:.1%} dos visitantes (esperado 50%)")
+    return ok
+
+
+def time_picks(split, rounds=500000):
+    pick = split.pick
+    start = time.perf_counter()
+    for _ in range(rounds):
+        pick()
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--picks', type=int, default=20000)
+    args = parser.parse_args()
+
+    destinations = ['https://a.example/atual', 'https://b.example/nova']
+    ramp = schedule_json('linear', [(START, [95, 5]), (START + 24 * HOUR, [50, 50])])
+    clock = FakeClock(START)
+    ramp_split = compile_split(1, 'rampa', destinations, [95, 5], weight_schedule=ramp)
+    ramp_split.clock = clock
+    ok = check_distribution('rampa linear 95/5 -> 50/50 em 24h', ramp_split, clock, 24, args.picks)
+
+    steps = schedule_json('step', [(START + 2 * HOUR, [80, 10, 10]), (START + 6 * HOUR, [40, 30, 30]),
+                                   (START + 10 * HOUR, [0, 50, 50])])
+    step_split = compile_split(2, 'degraus', destinations + ['https://c.example/outra'], [100, 0, 0],
+                               weight_schedule=steps)
+    step_split.clock = clock
+    ok &= check_distribution('degraus 100/0/0 -> 80/10/10 -> 40/30/30 -> 0/50/50', step_split, clock, 12,
+                             args.picks)
+
+    sticky_split = compile_split(3, 'rampa-sticky', destinations, [95, 5], 'cookie', weight_schedule=ramp)
+    sticky_split.clock = clock
+    ok &= check_sticky(sticky_split, clock)
+
+    plain = compile_split(4, 'fixo', destinations, [50, 50])
+    scheduled = compile_split(5, 'agendado', destinations, [95, 5], weight_schedule=schedule_json(
+        'linear', [(time.time() - HOUR, [95, 5]), (time.time() + HOUR, [50, 50])]))
+    churn = compile_split(6, 'troca', destinations, [95, 5], weight_schedule=ramp)
+    churn_clock = FakeClock(START)
+    churn.clock = churn_clock
+    rounds = int(24 * HOUR / SCHEDULE_RESOLUTION)  # um degrau novo a cada sorteio, dentro da rampa
+    start = time.perf_counter()
+    for i in range(rounds):
+        churn_clock.now = START + i * SCHEDULE_RESOLUTION
+        churn.pick()
+    rebuild = (time.perf_counter() - start) / rounds
+    print(f"⏱️ sorteio sem plano {time_picks(plain) * 1e6:.2f} µs   com plano {time_picks(scheduled) * 1e6:.2f} µs   "
+          f"troca de degrau (a cada {SCHEDULE_RESOLUTION:.0f}s) {rebuild * 1e6:.1f} µs")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
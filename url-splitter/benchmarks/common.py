@@ -0,0 +1,46 @@
+"""
+Utilitários compartilhados pelos benchmarks: app Flask isolada num SQLite temporário
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from src.models.user import db
+from src.models.migrations import upgrade_schema
+from src.routes.url_split import url_split_bp
+from src.routes.bulk import bulk_bp
+from src.services.split_cache import split_cache
+from src.services.click_writer import click_writer
+from src.services.bandit import bandit
+from src.services.database import configure_sqlite
+
+
+def make_app(db_path=None, **config):
+    """App com as rotas da API apontando para um banco descartável"""
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='url-splitter-bench-'), 'bench.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SPLIT_GENERATION_PATH'] = os.path.join(os.path.dirname(db_path), 'splits.generation')
+    app.config.update(config)
+    # WAL, pragmas e pool como em src/main.py
+    configure_sqlite(app)
+    if app.config.get('TRUSTED_PROXIES'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+    app.register_blueprint(url_split_bp, url_prefix='/api')
+    app.register_blueprint(bulk_bp, url_prefix='/api')
+    db.init_app(app)
+    split_cache.init_app(app)
+    click_writer.init_app(app)
+    bandit.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade_schema(db.engine)
+    app.db_path = db_path
+    return app
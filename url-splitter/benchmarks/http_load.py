@@ -0,0 +1,134 @@
+"""
+Gerador de carga HTTP/1.1 dos benchmarks (sem dependências externas)
+
+Conexões keep-alive em asyncio, espalhadas por processos de carga, que
+percorrem uma lista de caminhos e medem a latência de cada resposta. O
+servidor é um subprocesso local (gunicorn ou src/redirect_server.py).
+"""
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def gunicorn_command(factory, workers, port):
+    """gunicorn servindo `factory` (módulo:função() dentro de benchmarks/)"""
+    return [sys.executable, '-m', 'gunicorn', '--chdir', BENCH_DIR, '-w', str(workers),
+            '-b', f'127.0.0.1:{port}', '--log-level', 'warning', factory]
+
+
+def redirect_server_command(workers, port):
+    return [sys.executable, os.path.join(ROOT, 'src', 'redirect_server.py'),
+            '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)]
+
+
+def start_server(cmd, port, env=None, name='servidor'):
+    """Sobe o servidor e espera a porta aceitar conexões"""
+    process = subprocess.Popen(cmd, env=dict(os.environ, **(env or {})), cwd=ROOT)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            time.sleep(0.5)  # todos os workers de pé
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{name} não subiu na porta {port}')
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait(10)
+
+
+async def _connection(port, paths, deadline, latencies, counters, method='GET', expect=(302,)):
+    reader = writer = None
+    rng = random.Random()
+    expected = tuple(f' {status} '.encode() for status in expect)
+    while time.perf_counter() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        request = (f'{method} {rng.choice(paths)} HTTP/1.1\r\nHost: bench\r\n'
+                   f'User-Agent: bench\r\n\r\n').encode()
+        start = time.perf_counter()
+        try:
+            writer.write(request)
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            close = False
+            for line in head.split(b'\r\n')[1:]:
+                name, _, value = line.partition(b':')
+                name = name.strip().lower()
+                if name == b'content-length':
+                    length = int(value)
+                elif name == b'connection' and value.strip().lower() == b'close':
+                    close = True
+            if length and method != 'HEAD':
+                await reader.readexactly(length)
+        except (OSError, asyncio.IncompleteReadError):
+            counters['errors'] += 1
+            writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        status_line = head[:head.find(b'\r\n') + 1]
+        if not any(status in status_line for status in expected):
+            counters['errors'] += 1
+        if close:
+            # gunicorn sync não mantém conexão: o cliente reconecta (custo real)
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+def client_process(port, paths, connections, seconds, method='GET', expect=(302,)):
+    async def run():
+        latencies = []
+        counters = {'errors': 0}
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(_connection(port, paths, deadline, latencies, counters, method, expect)
+                               for _ in range(connections)))
+        return latencies, counters['errors']
+    return asyncio.run(run())
+
+
+def load(port, paths, connections, seconds, procs, method='GET', expect=(302,)):
+    """Dispara a carga; retorna (latências ordenadas, erros)"""
+    per_proc = max(1, connections // procs)
+    with multiprocessing.Pool(procs) as pool:
+        results = pool.starmap(client_process, [(port, paths, per_proc, seconds, method, expect)] * procs)
+    latencies = sorted(l for part, _ in results for l in part)
+    errors = sum(e for _, e in results)
+    return latencies, errors
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float('nan')
+
+
+def summarize(latencies, errors, seconds):
+    """Resumo de uma rodada (latências em ms)"""
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / seconds,
+        'p50_ms': percentile(latencies, 0.5) * 1e3,
+        'p90_ms': percentile(latencies, 0.9) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+        'max_ms': latencies[-1] * 1e3 if latencies else float('nan'),
+    }
@@ -0,0 +1,209 @@
+"""
+Suíte de benchmarks reprodutível (offline), com resultado em JSON
+
+1. Gera um banco determinístico (seed.py): --splits splits x --destinations
+   destinos e --clicks cliques.
+2. Micro-benchmarks: safe_json_parse, decode_json_list, compilação de split e
+   seleção ponderada (random.choices, tabela de alias, pick e pick_sticky).
+3. Carga HTTP contra servidores locais sobre o mesmo banco: redirecionamento
+   na rota Flask (gunicorn) e no servidor assíncrono, listagem paginada
+   (GET /api/splits com cursor, todos os campos e projeção) e estatísticas.
+
+Grava um JSON com o ambiente (commit, Python, CPUs) e os números de cada
+cenário em --output; com --compare <baseline.json> mostra a variação de
+cada métrica contra uma execução anterior.
+
+Uso: python benchmarks/run_suite.py [--splits 1000] [--clicks 100000] [--seconds 5] [--output r.json]
+     [--compare baseline.json] [--skip-http]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from common import make_app
+from http_load import (free_port, gunicorn_command, load, redirect_server_command, start_server, stop_server,
+                       summarize)
+from seed import destination_urls, generate, split_slug
+
+from src.routes.url_split import safe_json_parse
+from src.services.selection import AliasTable
+from src.services.split_cache import compile_split, decode_json_list
+
+# Métricas em que maior é melhor (nas demais, menor é melhor)
+HIGHER_IS_BETTER = ('rps',)
+
+
+def wsgi_app():
+    """Fábrica usada pelo gunicorn: as rotas da API sobre o banco da suíte"""
+    return make_app(os.environ['BENCH_DB_PATH'])
+
+
+def per_call(fn, number, repeat=5):
+    """Melhor de `repeat` rodadas, em nanossegundos por chamada"""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e9
+
+
+def micro_benchmarks(destinations, number):
+    urls = destination_urls(0, destinations)
+    weights = [random.Random(i).randint(1, 100) for i in range(destinations)]
+    raw_urls = json.dumps(urls)
+    raw_weights = json.dumps(weights)
+    table = AliasTable(weights)
+    split = compile_split(1, 'micro', raw_urls, raw_weights)
+    sticky = compile_split(2, 'micro-sticky', raw_urls, raw_weights, 'cookie')
+    visitors = [f'visitante-{i}' for i in range(1024)]
+    keys = iter(visitors * (number * 5 // len(visitors) + 2))
+
+    results = {
+        'safe_json_parse_str': per_call(lambda: safe_json_parse(raw_urls, 'destinations'), number),
+        'safe_json_parse_list': per_call(lambda: safe_json_parse(urls, 'destinations'), number),
+        'decode_json_list': per_call(lambda: decode_json_list(raw_urls), number),
+        'compile_split': per_call(lambda: compile_split(1, 'micro', raw_urls, raw_weights), number // 10),
+        'random_choices': per_call(lambda: random.choices(urls, weights=weights)[0], number),
+        'alias_sample': per_call(lambda: urls[table.sample()], number),
+        'pick': per_call(split.pick, number),
+        'pick_sticky': per_call(lambda: sticky.pick_sticky(next(keys)), number),
+    }
+    return {name: {'ns_per_op': value} for name, value in results.items()}
+
+
+def http_scenarios(split_ids, rng):
+    """(nome, servidor, caminhos, status esperados) de cada cenário de carga"""
+    redirect_paths = [f'/api/r/{split_slug(i)}' for i in range(len(split_ids))]
+    cursors = [rng.choice(split_ids) - 1 for _ in range(256)]
+    return [
+        ('redirect_flask', 'flask', redirect_paths, (302,)),
+        ('redirect_async', 'async', redirect_paths, (302,)),
+        ('list_splits', 'flask', [f'/api/splits?limit=100&cursor={c}' for c in cursors], (200,)),
+        ('list_splits_fields', 'flask', [f'/api/splits?limit=100&fields=slug,name&cursor={c}' for c in cursors],
+         (200,)),
+        ('split_stats', 'flask', [f'/api/splits/{rng.choice(split_ids)}/stats?granularity=day'
+                                  for _ in range(256)], (200,)),
+    ]
+
+
+def run_http(db_path, split_ids, args):
+    env = {'BENCH_DB_PATH': db_path, 'DATABASE_PATH': db_path, 'LOG_LEVEL': 'WARNING'}
+    scenarios = http_scenarios(split_ids, random.Random(args.seed))
+    results = {}
+    for kind in ('flask', 'async'):
+        port = free_port()
+        cmd = (gunicorn_command('run_suite:wsgi_app()', args.workers, port) if kind == 'flask'
+               else redirect_server_command(args.workers, port))
+        server = start_server(cmd, port, env=env, name=f'servidor {kind}')
+        try:
+            for name, server_kind, paths, expect in scenarios:
+                if server_kind != kind:
+                    continue
+                latencies, errors = load(port, paths, args.connections, args.seconds, args.client_procs,
+                                         expect=expect)
+                results[name] = summarize(latencies, errors, args.seconds)
+                print_http(name, results[name])
+        finally:
+            stop_server(server)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_http(name, result):
+    print(f"   {name:<20} {result['rps']:9.0f} req/s   p50 {result['p50_ms']:7.2f} ms   "
+          f"p99 {result['p99_ms']:7.2f} ms   erros {result['errors']}")
+
+
+def compare(results, baseline):
+    """Variação percentual de cada métrica contra a execução de referência"""
+    print(f"📊 Comparação com {baseline['meta'].get('timestamp')} (commit {baseline['meta'].get('commit')}):")
+    for section in ('seed', 'micro', 'http'):
+        for name, metrics in results.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if not isinstance(metrics, dict) or not isinstance(before, dict):
+                continue
+            for metric, value in metrics.items():
+                old = before.get(metric)
+                if metric in ('requests', 'errors') or not isinstance(old, (int, float)) or not old:
+                    continue
+                change = (value - old) / old
+                better = change > 0 if metric in HIGHER_IS_BETTER else change < 0
+                mark = '  ' if abs(change) < 0.05 else ('✅' if better else '⚠️')
+                print(f"   {mark} {section}.{name}.{metric}: {old:.2f} -> {value:.2f} ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--splits', type=int, default=1000)
+    parser.add_argument('--destinations', type=int, default=3)
+    parser.add_argument('--clicks', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--micro-calls', type=int, default=100000)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--client-procs', type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--output', default=os.path.join(
+        BENCH_DIR, 'results', datetime.now().strftime('suite-%Y%m%d-%H%M%S.json')))
+    parser.add_argument('--compare')
+    args = parser.parse_args()
+
+    started = datetime.now(timezone.utc)
+    db_path = os.path.join(tempfile.mkdtemp(prefix='url-splitter-suite-'), 'bench.db')
+    app = make_app(db_path, CLICK_LOGGING_ENABLED=False)
+    seeded = generate(app, args.splits, args.destinations, args.clicks, args.seed)
+    print(f"🌱 {args.splits} splits x {args.destinations} destinos em {seeded['splits_seconds']:.1f}s, "
+          f"{args.clicks:,} cliques em {seeded['clicks_seconds']:.1f}s")
+
+    print(f"⏱️ Micro-benchmarks ({args.micro_calls:,} chamadas, melhor de 5):")
+    micro = micro_benchmarks(args.destinations, args.micro_calls)
+    for name, result in micro.items():
+        print(f"   {name:<22} {result['ns_per_op']:9.0f} ns")
+
+    http = {}
+    if not args.skip_http:
+        print(f"⏱️ Carga HTTP: {args.connections} conexões, {args.seconds:.0f}s por cenário, "
+              f"{args.workers} worker(s), {args.client_procs} processo(s) de carga")
+        http = run_http(db_path, list(range(1, args.splits + 1)), args)
+
+    results = {
+        'meta': {
+            'timestamp': started.isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'seed': {'generation': {'splits_seconds': seeded['splits_seconds'],
+                                'clicks_seconds': seeded['clicks_seconds']}},
+        'micro': micro,
+        'http': http,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Resultados em {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
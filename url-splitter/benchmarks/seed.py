@@ -0,0 +1,157 @@
+"""
+Gerador determinístico de banco para benchmarks: N splits x M destinos, K cliques
+
+Os splits entram pelo mesmo caminho do import em massa (validate_split_row +
+insert_rows) e os cliques pelo mesmo do click writer (click_logs ou partição
+mensal, total_clicks e rollups por minuto), espalhados pelos últimos --days
+dias. Com a mesma --seed o conteúdo gerado é o mesmo (só os instantes dos
+cliques acompanham a data da execução).
+
+Uso: python benchmarks/seed.py bench.db [--splits 1000] [--destinations 3] [--clicks 100000] [--seed 42]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from common import make_app
+
+from src.models.user import db
+from src.models.url_split import ClickLog, URLSplit
+from src.routes.bulk import insert_rows, validate_split_row
+from src.services.click_archive import click_archive
+from src.services.click_stats import record_rollups
+
+BATCH = 5000
+
+_insert_clicks = ClickLog.__table__.insert()
+_increment_clicks = (
+    URLSplit.__table__.update()
+    .where(URLSplit.__table__.c.id == db.bindparam('split_id'))
+    .values(total_clicks=db.func.coalesce(URLSplit.__table__.c.total_clicks, 0) + db.bindparam('clicks'))
+)
+
+USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+)
+
+
+def split_slug(index):
+    return f'seed-{index}'
+
+
+def destination_urls(index, destinations):
+    return [f'https://lp{d}.example.com/c/{index}?utm_source=seed' for d in range(destinations)]
+
+
+def split_rows(splits, destinations, rng):
+    """Splits com pesos aleatórios; um em cada dez com modo sticky por cookie"""
+    for i in range(splits):
+        yield {
+            'slug': split_slug(i),
+            'name': f'Campanha {i}',
+            'destinations': destination_urls(i, destinations),
+            'weights': [rng.randint(1, 100) for _ in range(destinations)],
+            'sticky_mode': 'cookie' if i % 10 == 0 else None,
+        }
+
+
+def click_events(clicks, split_ids, destinations_of, start, days, rng):
+    """Cliques em ordem cronológica, com splits em distribuição de Zipf (poucos splits quentes)"""
+    cumulative = []
+    total = 0.0
+    for rank in range(1, len(split_ids) + 1):
+        total += 1.0 / rank
+        cumulative.append(total)
+    step = days * 86400 / max(clicks, 1)
+    for i in range(clicks):
+        split_id = rng.choices(split_ids, cum_weights=cumulative)[0]
+        yield {
+            'url_split_id': split_id,
+            'destination_url': rng.choice(destinations_of[split_id]),
+            'ip_address': f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+            'user_agent': rng.choice(USER_AGENTS),
+            'clicked_at': start + timedelta(seconds=i * step),
+        }
+
+
+def write_clicks(engine, batch):
+    """Grava um lote como o flush do click writer"""
+    if click_archive.enabled:
+        click_archive.write(batch)
+    with engine.begin() as conn:
+        if not click_archive.enabled:
+            conn.execute(_insert_clicks, batch)
+        conn.execute(_increment_clicks, [{'split_id': split_id, 'clicks': clicks} for split_id, clicks
+                                         in Counter(event['url_split_id'] for event in batch).items()])
+        record_rollups(conn, batch)
+
+
+def generate(app, splits=1000, destinations=3, clicks=100000, seed=42, days=30):
+    """Popula o banco do app; retorna um resumo com os tempos de cada etapa"""
+    rng = random.Random(seed)
+    summary = {'splits': splits, 'destinations': destinations, 'clicks': clicks, 'seed': seed}
+    with app.app_context():
+        start = time.perf_counter()
+        chunk = []
+        for data in split_rows(splits, destinations, rng):
+            row, error = validate_split_row(data)
+            if error:
+                raise ValueError(f'{data["slug"]}: {error}')
+            chunk.append(row)
+            if len(chunk) >= BATCH:
+                insert_rows(chunk)
+                chunk = []
+        if chunk:
+            insert_rows(chunk)
+        summary['splits_seconds'] = time.perf_counter() - start
+
+        ids = dict(db.session.query(URLSplit.slug, URLSplit.id))
+        split_ids = [ids[split_slug(i)] for i in range(splits)]
+        destinations_of = {split_id: destination_urls(i, destinations) for i, split_id in enumerate(split_ids)}
+        db.session.remove()
+
+        start = time.perf_counter()
+        engine = db.engine
+        begin = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(days=days)
+        batch = []
+        for event in click_events(clicks, split_ids, destinations_of, begin, days, rng):
+            batch.append(event)
+            if len(batch) >= BATCH:
+                write_clicks(engine, batch)
+                batch = []
+        if batch:
+            write_clicks(engine, batch)
+        summary['clicks_seconds'] = time.perf_counter() - start
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('db_path')
+    parser.add_argument('--splits', type=int, default=1000)
+    parser.add_argument('--destinations', type=int, default=3)
+    parser.add_argument('--clicks', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args()
+    if os.path.exists(args.db_path):
+        parser.error(f'{args.db_path} já existe')
+    os.makedirs(os.path.dirname(os.path.abspath(args.db_path)), exist_ok=True)
+
+    app = make_app(os.path.abspath(args.db_path), CLICK_LOGGING_ENABLED=False)
+    summary = generate(app, args.splits, args.destinations, args.clicks, args.seed, args.days)
+    print(f"🌱 {args.splits} splits x {args.destinations} destinos em {summary['splits_seconds']:.1f}s, "
+          f"{args.clicks:,} cliques em {summary['clicks_seconds']:.1f}s -> {args.db_path}")
+
+
+if __name__ == '__main__':
+    main()
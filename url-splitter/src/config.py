@@ -0,0 +1,123 @@
+"""
+Configuração do URL Splitter a partir do ambiente
+
+Fonte única das chaves e das regras de caminho (DATABASE_PATH ou DATA_DIR e
+os arquivos ao lado do banco) para a API Flask (src/main.py), o servidor de
+redirecionamento assíncrono e os processos auxiliares (split_loader,
+health_checker): todos abrem o mesmo SQLite e os mesmos arquivos de geração.
+"""
+import os
+
+
+def load_config(config=None):
+    """Dicionário de configuração do ambiente; `config` sobrescreve (e pode trazer DATABASE_PATH/DATA_DIR)"""
+    config = dict(config or {})
+    settings = {}
+    settings['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+
+    # Logging: nível, formato ('text' ou 'json'), amostragem das linhas de debug
+    # do redirecionamento e listagem de slugs no 404 (SPLIT_DEBUG_SLUGS)
+    settings['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    settings['LOG_FORMAT'] = os.environ.get('LOG_FORMAT', 'text')
+    settings['LOG_REDIRECT_SAMPLE_RATE'] = float(os.environ.get('LOG_REDIRECT_SAMPLE_RATE', 0.01))
+    settings['SPLIT_DEBUG_SLUGS'] = os.environ.get('SPLIT_DEBUG_SLUGS', '').lower() in ('1', 'true', 'yes')
+
+    # Banco: DATABASE_PATH ou url_splitter.db em DATA_DIR; os demais arquivos
+    # (geração, métricas, partições de cliques) ficam no mesmo diretório
+    db_path = os.path.abspath(config.get('DATABASE_PATH') or os.environ.get('DATABASE_PATH') or os.path.join(
+        config.get('DATA_DIR') or os.environ.get('DATA_DIR', '/app/data'), 'url_splitter.db'))
+    data_dir = os.path.dirname(db_path)
+    settings['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    settings['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    settings['DATABASE_PATH'] = db_path
+    settings['DATA_DIR'] = data_dir
+    # Backups online: diretório (padrão ao lado do diretório de dados), retenção (quantidade/idade) e compressão gzip
+    settings['BACKUP_DIR'] = os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(data_dir), 'backups'))
+    settings['BACKUP_KEEP'] = int(os.environ.get('BACKUP_KEEP', 5))
+    settings['BACKUP_MAX_AGE_DAYS'] = float(os.environ['BACKUP_MAX_AGE_DAYS']) if 'BACKUP_MAX_AGE_DAYS' in os.environ else None
+    settings['BACKUP_COMPRESS'] = os.environ.get('BACKUP_COMPRESS', '').lower() in ('1', 'true', 'yes')
+    # Partições de cliques copiadas junto (mês atual e o anterior; meses mais velhos não mudam mais e vão para o arquivo)
+    settings['BACKUP_CLICK_MONTHS'] = int(os.environ.get('BACKUP_CLICK_MONTHS', 2))
+    # Geração compartilhada entre workers para invalidar o cache de redirecionamento
+    settings['SPLIT_GENERATION_PATH'] = os.environ.get('SPLIT_GENERATION_PATH', os.path.join(data_dir, 'splits.generation'))
+    settings['SPLIT_CACHE_CHECK_INTERVAL'] = float(os.environ.get('SPLIT_CACHE_CHECK_INTERVAL', 1.0))
+    # Slugs inexistentes lembrados por worker (varredura de slugs aleatórios não vai ao banco)
+    settings['SPLIT_CACHE_NEGATIVE_SIZE'] = int(os.environ.get('SPLIT_CACHE_NEGATIVE_SIZE', 10000))
+    # Tabela compartilhada entre workers, publicada por src/split_loader.py (vazio = desligado)
+    settings['SPLIT_SHARED_TABLE'] = os.environ.get('SPLIT_SHARED_TABLE', '')
+    # Paginação da listagem de splits
+    settings['SPLITS_PAGE_SIZE'] = int(os.environ.get('SPLITS_PAGE_SIZE', 100))
+    settings['SPLITS_MAX_PAGE_SIZE'] = int(os.environ.get('SPLITS_MAX_PAGE_SIZE', 1000))
+    # Import/export em massa: linhas por lote/transação e limite do relatório de erros;
+    # itens por requisição na edição em lote (PATCH /api/splits)
+    settings['BULK_CHUNK_SIZE'] = int(os.environ.get('BULK_CHUNK_SIZE', 1000))
+    settings['BULK_MAX_ERRORS'] = int(os.environ.get('BULK_MAX_ERRORS', 1000))
+    settings['BATCH_MAX_ITEMS'] = int(os.environ.get('BATCH_MAX_ITEMS', 1000))
+    # Métricas: snapshot de cada worker em arquivo, somados em /api/metrics
+    settings['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(data_dir, 'metrics'))
+    settings['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 2.0))
+    # /api/health reaproveita a contagem de splits por este tempo (segundos)
+    settings['HEALTH_COUNT_TTL'] = float(os.environ.get('HEALTH_COUNT_TTL', 60))
+    # Gravação de cliques em lote: tamanho da fila, do lote, intervalo e 'drop' ou 'block' com fila cheia
+    settings['CLICK_QUEUE_SIZE'] = int(os.environ.get('CLICK_QUEUE_SIZE', 10000))
+    settings['CLICK_BATCH_SIZE'] = int(os.environ.get('CLICK_BATCH_SIZE', 500))
+    settings['CLICK_FLUSH_INTERVAL'] = float(os.environ.get('CLICK_FLUSH_INTERVAL', 1.0))
+    settings['CLICK_BACKPRESSURE'] = os.environ.get('CLICK_BACKPRESSURE', 'drop')
+    settings['CLICK_LOGGING_ENABLED'] = os.environ.get('CLICK_LOGGING_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    # Cliques brutos: um SQLite por mês fora do banco principal; meses além da retenção
+    # viram NDJSON comprimido (CLICK_PARTITION_DIR vazio = tabela click_logs no banco principal)
+    settings['CLICK_PARTITION_DIR'] = os.environ.get('CLICK_PARTITION_DIR', os.path.join(data_dir, 'clicks'))
+    settings['CLICK_ARCHIVE_DIR'] = os.environ.get('CLICK_ARCHIVE_DIR', '')
+    settings['CLICK_RETENTION_MONTHS'] = int(os.environ.get('CLICK_RETENTION_MONTHS', 6))
+    settings['CLICK_ARCHIVE_INTERVAL'] = float(os.environ.get('CLICK_ARCHIVE_INTERVAL', 3600))
+    # Redirecionamento: limites padrão em req/s (0 = sem limite), chaves por limitador e bots
+    # Proxies reversos confiáveis na frente do app: o IP do visitante é o N-ésimo valor do fim do
+    # X-Forwarded-For (0 = ignora o cabeçalho, que qualquer cliente pode enviar, e usa o IP da conexão)
+    settings['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', 0))
+    settings['RATE_LIMIT_IP'] = float(os.environ.get('RATE_LIMIT_IP', 0))
+    settings['RATE_LIMIT_IP_BURST'] = float(os.environ.get('RATE_LIMIT_IP_BURST', 0)) or None
+    settings['RATE_LIMIT_SPLIT'] = float(os.environ.get('RATE_LIMIT_SPLIT', 0))
+    settings['RATE_LIMIT_SPLIT_BURST'] = float(os.environ.get('RATE_LIMIT_SPLIT_BURST', 0)) or None
+    settings['RATE_LIMIT_MAX_KEYS'] = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+    settings['BOT_FILTER'] = os.environ.get('BOT_FILTER', 'skip')
+    settings['BOT_USER_AGENT_PATTERNS'] = os.environ.get('BOT_USER_AGENT_PATTERNS', '')
+    # max-age (segundos) do Cache-Control de splits com destino único (0 = no-store)
+    settings['REDIRECT_CACHE_MAX_AGE'] = int(os.environ.get('REDIRECT_CACHE_MAX_AGE', 60))
+    # Regras de direcionamento: faixas de IP -> país (CSV local) e cabeçalho de país do CDN/proxy, se houver
+    settings['GEOIP_RANGES_PATH'] = os.environ.get('GEOIP_RANGES_PATH', '')
+    settings['GEOIP_COUNTRY_HEADER'] = os.environ.get('GEOIP_COUNTRY_HEADER', '')
+    # Saúde dos destinos: estado publicado por src/health_checker.py (ausente = todos no ar)
+    settings['HEALTH_STATE_PATH'] = os.environ.get('HEALTH_STATE_PATH', os.path.join(data_dir, 'destination_health.json'))
+    # Verificador (src/health_checker.py): intervalo, timeout, concorrência total e por host,
+    # falhas seguidas até sair do ar, jitter, nova tentativa após falha e método da sonda
+    settings['HEALTH_CHECK_INTERVAL'] = float(os.environ.get('HEALTH_CHECK_INTERVAL', 30))
+    settings['HEALTH_CHECK_TIMEOUT'] = float(os.environ.get('HEALTH_CHECK_TIMEOUT', 5))
+    settings['HEALTH_CHECK_CONCURRENCY'] = int(os.environ.get('HEALTH_CHECK_CONCURRENCY', 200))
+    settings['HEALTH_CHECK_PER_HOST'] = int(os.environ.get('HEALTH_CHECK_PER_HOST', 8))
+    settings['HEALTH_CHECK_FAILURES'] = int(os.environ.get('HEALTH_CHECK_FAILURES', 2))
+    settings['HEALTH_CHECK_JITTER'] = float(os.environ.get('HEALTH_CHECK_JITTER', 0.2))
+    settings['HEALTH_CHECK_RETRY_INTERVAL'] = float(os.environ.get('HEALTH_CHECK_RETRY_INTERVAL', 10))
+    settings['HEALTH_CHECK_METHOD'] = os.environ.get('HEALTH_CHECK_METHOD', 'HEAD').upper()
+    # Modo bandit: segredo dos click ids, parâmetro acrescentado ao destino, intervalo de
+    # sincronização dos contadores, exploração padrão do epsilon_greedy e janela de conversão
+    settings['BANDIT_SECRET'] = os.environ.get('BANDIT_SECRET', settings['SECRET_KEY'])
+    settings['BANDIT_CLICK_PARAM'] = os.environ.get('BANDIT_CLICK_PARAM', 'click_id')
+    settings['BANDIT_SYNC_INTERVAL'] = float(os.environ.get('BANDIT_SYNC_INTERVAL', 10))
+    settings['BANDIT_EPSILON'] = float(os.environ.get('BANDIT_EPSILON', 0.1))
+    settings['BANDIT_CONVERSION_WINDOW'] = int(os.environ.get('BANDIT_CONVERSION_WINDOW', 7 * 86400))
+    settings['BANDIT_THOMPSON_DRAWS'] = int(os.environ.get('BANDIT_THOMPSON_DRAWS', 500))
+    # Conversões aguardando sincronização por worker; além disso (banco fora do ar) a postback recebe 503
+    settings['BANDIT_MAX_PENDING_CONVERSIONS'] = int(os.environ.get('BANDIT_MAX_PENDING_CONVERSIONS', 10000))
+    # Estatísticas: minutos viram horas após 48h e horas viram dias após 90 dias
+    settings['STATS_COMPACT_INTERVAL'] = float(os.environ.get('STATS_COMPACT_INTERVAL', 300))
+    settings['STATS_MINUTE_RETENTION'] = int(os.environ.get('STATS_MINUTE_RETENTION', 48 * 3600))
+    settings['STATS_HOUR_RETENTION'] = int(os.environ.get('STATS_HOUR_RETENTION', 90 * 86400))
+    # Backup na preparação (prepare_app) e pré-carga dos N splits mais acessados em cada worker (0 = desligada)
+    settings['BACKUP_ON_START'] = os.environ.get('BACKUP_ON_START', '1').lower() in ('1', 'true', 'yes')
+    settings['SPLIT_CACHE_WARMUP'] = int(os.environ.get('SPLIT_CACHE_WARMUP', 0))
+    # WAL, pragmas por conexão e pool (SQLITE_* podem vir do ambiente)
+    for key in ('SQLITE_BUSY_TIMEOUT', 'SQLITE_CACHE_SIZE', 'SQLITE_MMAP_SIZE', 'SQLITE_POOL_SIZE'):
+        if key in os.environ:
+            settings[key] = int(os.environ[key])
+    settings.update(config)
+    return settings
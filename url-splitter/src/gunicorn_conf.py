@@ -0,0 +1,24 @@
+"""
+Configuração do gunicorn para a API Flask
+
+Os passos únicos da inicialização (backup, tabelas, migrações) rodam uma vez
+no processo mestre, antes de criar os workers; cada worker só chama
+create_app(), que não toca no banco.
+
+Uso: gunicorn -c src/gunicorn_conf.py 'src.main:create_app()'
+     (com --preload e SPLIT_CACHE_WARMUP a pré-carga do cache também roda
+     uma vez no mestre e é herdada pelos workers)
+"""
+import os
+import sys
+
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+
+
+def on_starting(server):
+    from src.main import create_app, prepare_app
+    prepare_app(create_app({'SPLIT_CACHE_WARMUP': 0}))
@@ -0,0 +1,43 @@
+"""
+Verificador de saúde dos destinos (HEALTH_STATE_PATH)
+
+Rode um único processo deste script na mesma máquina/volume dos workers
+(src/main.py ou src/redirect_server.py). Ele sonda todos os destinos
+distintos dos splits e publica os que estão fora do ar; os workers desviam o
+tráfego deles para os destinos saudáveis do mesmo split.
+
+Uso: python src/health_checker.py [--once] [--state /app/data/destination_health.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.models.user import db
+from src.redirect_server import build_config_app
+from src.services.destination_health import HealthChecker, collect_destinations
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verificador de saúde dos destinos')
+    parser.add_argument('--database', default=None, help='caminho do SQLite (padrão: DATABASE_PATH)')
+    parser.add_argument('--state', default=None, help='arquivo de estado (padrão: HEALTH_STATE_PATH)')
+    parser.add_argument('--once', action='store_true', help='sonda todos os destinos uma vez e sai')
+    args = parser.parse_args()
+
+    app = build_config_app(args.database)
+    if args.state:
+        app.config['HEALTH_STATE_PATH'] = args.state
+    checker = HealthChecker.from_app(app, db.get_engine(app))
+    if args.once:
+        # Uma rodada só: uma falha já basta para marcar o destino
+        checker.failures = 1
+        checker.set_urls(collect_destinations(checker.engine))
+        asyncio.run(checker.check_once())
+        checker.publish()
+        print(json.dumps(checker.state(), indent=2, ensure_ascii=False))
+    else:
+        asyncio.run(checker.run_forever())
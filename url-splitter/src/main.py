@@ -1,134 +1,225 @@
+import argparse
 import os
 import sys
-import shutil
 import json
-from datetime import datetime
+import logging
+import time
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask, Response, request, send_from_directory
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+from src.config import load_config
 from src.models.user import db
+from src.models.migrations import upgrade_schema
+from src.services.database import configure_sqlite
+from src.services.backup import backup_manager
+from src.services.metrics import metrics
+from src.services.logging_setup import configure_logging
 from src.routes.user import user_bp
 from src.routes.url_split import url_split_bp
+from src.routes.bulk import bulk_bp
+from src.services.split_cache import split_cache
+from src.services.click_writer import click_writer
+from src.services.click_archive import click_archive
+from src.services.destination_health import destination_health
+from src.services.targeting import targeting
+from src.services.traffic_filter import traffic_filter
+from src.services.bandit import bandit
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+logger = logging.getLogger('url_splitter')
 
-# Configurar CORS para permitir acesso de qualquer origem
-CORS(app)
+# Contadores dos serviços no /api/metrics (singletons: registrados uma vez por processo)
+metrics.register_counter(lambda: [
+    ('split_cache_requests_total', {'result': 'hit'}, split_cache.hits),
+    ('split_cache_requests_total', {'result': 'miss'}, split_cache.misses),
+] + [
+    ('click_events_total', {'result': result}, click_writer.counters[result])
+    for result in ('queued', 'flushed', 'dropped', 'failed')
+])
+metrics.register_gauge(lambda: [('click_queue_depth', {}, click_writer.stats()['queue_depth']),
+                                ('unhealthy_destinations', {}, len(destination_health.current()))])
 
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(url_split_bp, url_prefix='/api')
 
-# Configuração PERSISTENTE do SQLite
-def setup_persistent_database():
-    """Configura banco SQLite com backup automático"""
-    
-    # Diretório para dados persistentes
-    data_dir = '/app/data'
-    backup_dir = '/app/backups'
-    
-    # Criar diretórios se não existirem
+def create_app(config=None):
+    """
+    Fábrica da aplicação: configuração do ambiente (`config` sobrescreve),
+    rotas e serviços. Não lê nem altera o banco; backup, tabelas e migrações
+    ficam em prepare_app, executado uma vez antes de subir os workers.
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config.update(load_config(config))
+    data_dir = os.path.dirname(app.config['DATABASE_PATH'])
+
+    configure_logging(app)
+
+    # IP do visitante a partir do X-Forwarded-For só atrás de proxies confiáveis
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+
+    # Configurar CORS para permitir acesso de qualquer origem
+    CORS(app)
+
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(url_split_bp, url_prefix='/api')
+    app.register_blueprint(bulk_bp, url_prefix='/api')
+
     os.makedirs(data_dir, exist_ok=True)
-    os.makedirs(backup_dir, exist_ok=True)
-    
-    # Caminho do banco principal
-    db_path = os.path.join(data_dir, 'url_splitter.db')
-    
-    print(f"📁 Banco de dados: {db_path}")
-    
-    return db_path
-
-def backup_database(db_path):
-    """Faz backup do banco de dados"""
-    try:
-        if os.path.exists(db_path):
-            backup_dir = '/app/backups'
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_path = os.path.join(backup_dir, f'backup_{timestamp}.db')
+    configure_sqlite(app)
+    db.init_app(app)
+    backup_manager.init_app(app)
+    split_cache.init_app(app)
+    click_archive.init_app(app)
+    click_writer.init_app(app)
+    traffic_filter.init_app(app)
+    targeting.init_app(app)
+    destination_health.init_app(app)
+    bandit.init_app(app)
+    metrics.init_app(app)
+    register_routes(app)
+
+    if app.config['SPLIT_CACHE_WARMUP'] > 0:
+        warm_split_cache(app)
+    return app
+
+
+def prepare_app(app):
+    """
+    Passos únicos da inicialização: backup, criação de tabelas, migrações e
+    cliques legados para as partições. Rodam uma vez por deploy
+    (`python src/main.py prepare` ou o hook on_starting de src/gunicorn_conf.py),
+    não em cada worker.
+    """
+    logger.info('📁 Banco de dados: %s', app.config['DATABASE_PATH'])
+    with app.app_context():
+        try:
+            # Fazer backup antes de qualquer operação (API online: seguro com outros workers escrevendo)
+            if app.config['BACKUP_ON_START']:
+                os.makedirs(app.config['BACKUP_DIR'], exist_ok=True)
+                backup_manager.backup_now()
             
-            shutil.copy2(db_path, backup_path)
-            print(f"✅ Backup criado: {backup_path}")
+            # Criar tabelas e aplicar colunas novas em bancos existentes
+            db.create_all()
+            applied = upgrade_schema(db.engine)
+            if applied:
+                logger.info('🔧 Schema atualizado: %s', applied)
+            moved = click_archive.migrate_legacy(db.engine)
+            if moved:
+                logger.info('🗄️ %d cliques movidos do banco principal para as partições mensais', moved)
+            logger.info('✅ Banco de dados inicializado!')
             
-            # Manter apenas os 5 backups mais recentes
-            backups = sorted([f for f in os.listdir(backup_dir) if f.startswith('backup_')])
-            if len(backups) > 5:
-                for old_backup in backups[:-5]:
-                    os.remove(os.path.join(backup_dir, old_backup))
-                    print(f"🗑️ Backup antigo removido: {old_backup}")
-                    
-    except Exception as e:
-        print(f"⚠️ Erro no backup: {e}")
-
-# Configurar banco de dados
-db_path = setup_persistent_database()
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-print("🗄️ Usando SQLite PERSISTENTE")
-
-db.init_app(app)
-
-with app.app_context():
-    try:
-        # Fazer backup antes de qualquer operação
-        backup_database(db_path)
-        
-        # Criar tabelas
-        db.create_all()
-        print("✅ Banco de dados inicializado!")
-        
-        # Verificar se há dados
-        from src.models.url_split import UrlSplit
-        count = UrlSplit.query.count()
-        print(f"📊 Splits existentes: {count}")
-        
-    except Exception as e:
-        print(f"❌ Erro no banco: {e}")
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
+            # Verificar se há dados
+            from src.models.url_split import URLSplit as UrlSplit
+            count = UrlSplit.query.count()
+            logger.info('📊 Splits existentes: %d', count)
+            
+        except Exception as e:
+            logger.exception('❌ Erro no banco: %s', e)
+        finally:
+            # O mestre do gunicorn não passa conexões abertas para os workers
+            db.session.remove()
+            db.engine.dispose()
+
+
+def warm_split_cache(app):
+    """Pré-carrega no cache de redirecionamento os SPLIT_CACHE_WARMUP splits mais acessados"""
+    with app.app_context():
+        try:
+            count = split_cache.warm(db.engine, app.config['SPLIT_CACHE_WARMUP'])
+            logger.info('🔥 Cache de splits pré-carregado: %d splits', count)
+        except Exception as e:
+            logger.warning('⚠️ Pré-carga do cache de splits falhou: %s', e)
+        finally:
+            # Com --preload a pré-carga roda no mestre: conexões não passam pelo fork
+            db.engine.dispose()
+
+
+def register_routes(app):
+    """Rotas da aplicação fora dos blueprints (frontend, backup, health, métricas)"""
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        static_folder_path = app.static_folder
+        if static_folder_path is None:
+                return "Static folder not configured", 404
+
+        if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
+            return send_from_directory(static_folder_path, path)
         else:
-            return "index.html not found", 404
-
-@app.route('/api/backup')
-def manual_backup():
-    """Endpoint para backup manual"""
-    try:
-        backup_database(db_path)
-        return {'status': 'success', 'message': 'Backup criado com sucesso'}
-    except Exception as e:
-        return {'status': 'error', 'message': str(e)}, 500
-
-@app.route('/api/health')
-def health_check():
-    """Endpoint para verificar saúde da aplicação"""
-    try:
-        from src.models.url_split import UrlSplit
-        count = UrlSplit.query.count()
-        return {
-            'status': 'ok', 
-            'database': 'connected',
-            'splits_count': count,
-            'database_path': db_path
-        }, 200
-    except Exception as e:
-        return {'status': 'error', 'database': str(e)}, 500
+            index_path = os.path.join(static_folder_path, 'index.html')
+            if os.path.exists(index_path):
+                return send_from_directory(static_folder_path, 'index.html')
+            else:
+                return "index.html not found", 404
+
+    @app.route('/api/backup', methods=['GET', 'POST'])
+    def manual_backup():
+        """Endpoint para backup manual (em segundo plano; retorna o id do job)"""
+        try:
+            compress = request.args.get('compress')
+            job = backup_manager.start(compress=None if compress is None else compress.lower() in ('1', 'true', 'yes'))
+            return {
+                'status': 'accepted',
+                'message': 'Backup iniciado',
+                'job_id': job['id'],
+                'job': job,
+                'status_url': f"/api/backup/{job['id']}"
+            }, 202
+        except Exception as e:
+            return {'status': 'error', 'message': str(e)}, 500
+
+    @app.route('/api/backup/<job_id>')
+    def backup_status(job_id):
+        """Progresso de um job de backup"""
+        job = backup_manager.get(job_id)
+        if not job:
+            return {'status': 'error', 'message': 'Job de backup não encontrado'}, 404
+        return job
+
+    # Contagem de splits reaproveitada entre probes de health
+    _health_count = {'value': None, 'expires': 0.0}
+    
+    @app.route('/api/health')
+    def health_check():
+        """Endpoint para verificar saúde da aplicação (sem consultar o banco a cada probe)"""
+        try:
+            now = time.monotonic()
+            if request.args.get('deep') or now >= _health_count['expires']:
+                from src.models.url_split import URLSplit as UrlSplit
+                _health_count['value'] = UrlSplit.query.count()
+                _health_count['expires'] = now + app.config['HEALTH_COUNT_TTL']
+            return {
+                'status': 'ok', 
+                'database': 'connected',
+                'splits_count': _health_count['value'],
+                'database_path': app.config['DATABASE_PATH'],
+                'clicks': click_writer.stats(),
+                'cache': split_cache.stats(),
+                'destination_health': destination_health.stats(),
+                'bandit': bandit.stats()
+            }, 200
+        except Exception as e:
+            return {'status': 'error', 'database': str(e)}, 500
+
+    @app.route('/api/metrics')
+    def metrics_endpoint():
+        """Métricas no formato texto do Prometheus (somadas entre workers)"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 
 if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 5000))
-    print(f"🚀 Iniciando aplicação na porta {port}")
-    print(f"💾 SQLite Persistente: {db_path}")
-    app.run(host='0.0.0.0', port=port, debug=False)
+    parser = argparse.ArgumentParser(description='URL Splitter (API Flask)')
+    parser.add_argument('command', nargs='?', default='run', choices=('run', 'prepare'),
+                        help='run: prepara o banco e sobe o servidor; prepare: só os passos únicos')
+    parser.add_argument('--skip-prepare', action='store_true', help='run sem os passos únicos (já executados)')
+    args = parser.parse_args()
+
+    app = create_app()
+    if args.command == 'prepare' or not args.skip_prepare:
+        prepare_app(app)
+    if args.command == 'run':
+        port = int(os.environ.get('PORT', 5000))
+        logger.info('🚀 Iniciando aplicação na porta %d', port)
+        logger.info('💾 SQLite Persistente: %s', app.config['DATABASE_PATH'])
+        app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,109 @@
+"""
+Migrações leves do schema SQLite
+
+`db.create_all()` só cria tabelas novas; colunas e índices adicionados depois
+aos modelos são aplicados aqui em bancos já existentes, assim como o reparo
+de dados de `repair_split_destinations`.
+"""
+import json
+
+from sqlalchemy import inspect, text
+
+from src.models.url_split import destination_rows
+
+# tabela -> [(coluna, DDL)]
+ADDED_COLUMNS = {
+    'url_splits': [
+        ('sticky_mode', 'VARCHAR(20)'),
+        ('sticky_param', 'VARCHAR(50)'),
+        ('rate_limit', 'FLOAT'),
+        ('ip_rate_limit', 'FLOAT'),
+        ('redirect_status', 'INTEGER'),
+        ('cache_max_age', 'INTEGER'),
+        ('weight_schedule', 'TEXT'),
+        ('bandit_mode', 'VARCHAR(20)'),
+        ('bandit_epsilon', 'FLOAT'),
+        ('targeting_rules', 'TEXT'),
+        ('version', 'INTEGER NOT NULL DEFAULT 1'),
+    ],
+}
+
+# (índice, tabela, colunas) criados depois da primeira versão do schema
+ADDED_INDEXES = [
+    ('ix_click_logs_split_clicked', 'click_logs', 'url_split_id, clicked_at'),
+]
+
+
+def upgrade_schema(engine):
+    """Adiciona colunas e índices faltantes; retorna a lista do que foi aplicado"""
+    applied = []
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table, columns in ADDED_COLUMNS.items():
+            if table not in tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table)}
+            for name, ddl in columns:
+                if name not in existing:
+                    conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+                    applied.append(f'{table}.{name}')
+        for name, table, columns in ADDED_INDEXES:
+            if table not in tables:
+                continue
+            if name not in {index['name'] for index in inspector.get_indexes(table)}:
+                conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+                applied.append(name)
+    if {'url_splits', 'split_destinations'} <= tables:
+        repaired = repair_split_destinations(engine)
+        if repaired:
+            applied.append(f'split_destinations ({repaired} splits)')
+    return applied
+
+
+def _decode_legacy_list(data):
+    """Lista de uma coluna JSON antiga, desfazendo a codificação dupla; None se ilegível"""
+    try:
+        parsed = json.loads(data)
+        if isinstance(parsed, str):
+            parsed = json.loads(parsed)
+    except (TypeError, ValueError):
+        return None
+    return parsed if isinstance(parsed, list) else None
+
+
+def repair_split_destinations(engine):
+    """
+    Migração de dados (uma vez por split): splits ainda sem linhas em
+    split_destinations têm as colunas JSON regravadas com codificação única
+    e os destinos copiados para a tabela filha. Pesos ausentes ou inválidos
+    viram distribuição uniforme, como o redirecionamento já os tratava.
+    Retorna quantos splits foram migrados.
+    """
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            'SELECT id, destinations, weights FROM url_splits '
+            'WHERE id NOT IN (SELECT url_split_id FROM split_destinations)'
+        )).fetchall()
+        repaired = 0
+        children = []
+        for split_id, destinations_raw, weights_raw in rows:
+            destinations = [str(d) for d in _decode_legacy_list(destinations_raw) or []]
+            if not destinations:
+                continue
+            weights = _decode_legacy_list(weights_raw) or []
+            if len(weights) != len(destinations) or not all(
+                    isinstance(w, (int, float)) and not isinstance(w, bool) and w >= 0 for w in weights):
+                weights = [round(100 / len(destinations), 1)] * len(destinations)
+            destinations_json = json.dumps(destinations)
+            weights_json = json.dumps(weights)
+            if destinations_json != destinations_raw or weights_json != weights_raw:
+                conn.execute(text('UPDATE url_splits SET destinations = :destinations, weights = :weights '
+                                  'WHERE id = :id'),
+                             {'id': split_id, 'destinations': destinations_json, 'weights': weights_json})
+            children.extend(destination_rows(split_id, destinations, weights))
+            repaired += 1
+        if children:
+            conn.execute(text('INSERT INTO split_destinations (url_split_id, position, url, weight, host) '
+                              'VALUES (:url_split_id, :position, :url, :weight, :host)'), children)
+    return repaired
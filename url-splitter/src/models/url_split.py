@@ -1,45 +1,98 @@
 from src.models.user import db
 from datetime import datetime
+from urllib.parse import urlsplit
 import json
 
+
+def destination_host(url):
+    """Host (minúsculo) de uma URL de destino, usado no filtro por host"""
+    try:
+        return (urlsplit(url).hostname or '')[:255] if isinstance(url, str) else ''
+    except ValueError:
+        return ''
+
+
+def destination_rows(split_id, destinations, weights):
+    """Linhas de split_destinations para um split (INSERT em lote)"""
+    return [
+        {'url_split_id': split_id, 'position': position, 'url': str(url),
+         'weight': float(weight), 'host': destination_host(url)}
+        for position, (url, weight) in enumerate(zip(destinations, weights))
+    ]
+
+
 class URLSplit(db.Model):
     __tablename__ = 'url_splits'
     
     id = db.Column(db.Integer, primary_key=True)
     slug = db.Column(db.String(100), unique=True, nullable=False)
     name = db.Column(db.String(200), nullable=False)
-    destinations = db.Column(db.Text, nullable=False)  # JSON string
-    weights = db.Column(db.Text, nullable=False)  # JSON string
+    # Cópia desnormalizada (lista JSON, codificada uma única vez) lida pelo
+    # redirecionamento; a forma normalizada fica em split_destinations
+    destinations = db.Column(db.Text, nullable=False)
+    weights = db.Column(db.Text, nullable=False)
     total_clicks = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Atribuição fixa por visitante: None, 'cookie', 'ip_ua' ou 'param'
+    sticky_mode = db.Column(db.String(20), nullable=True)
+    sticky_param = db.Column(db.String(50), nullable=True)  # nome do parâmetro no modo 'param'
+    # Limites de redirecionamento (req/s); None usa os padrões RATE_LIMIT_*
+    rate_limit = db.Column(db.Float, nullable=True)  # todas as requisições do split
+    ip_rate_limit = db.Column(db.Float, nullable=True)  # por IP, neste split
+    # Resposta do redirecionamento: status (302, 307 ou 308; None = 302) e, para
+    # splits de destino único, max-age do Cache-Control (None = padrão, 0 = no-store)
+    redirect_status = db.Column(db.Integer, nullable=True)
+    cache_max_age = db.Column(db.Integer, nullable=True)
+    # Plano de pesos agendado (JSON {"mode": "step"|"linear", "points": [{"at": epoch, "weights": [...]}]})
+    weight_schedule = db.Column(db.Text, nullable=True)
+    # Modo bandit: None, 'thompson' ou 'epsilon_greedy' (pesos calculados a partir das conversões)
+    bandit_mode = db.Column(db.String(20), nullable=True)
+    bandit_epsilon = db.Column(db.Float, nullable=True)  # exploração do epsilon_greedy (None = padrão)
+    # Regras de direcionamento em ordem (JSON [{"match": {"country"|"device"|"os"|"language": [...]},
+    # "destination": url}]); a primeira que casa vence, senão vale o sorteio pelos pesos
+    targeting_rules = db.Column(db.Text, nullable=True)
+    # Versão da linha, incrementada a cada edição pela API (ETag/If-Match: concorrência otimista)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    destination_rows = db.relationship('SplitDestination', order_by='SplitDestination.position',
+                                       cascade='all, delete-orphan')
+    bandit_arms = db.relationship('BanditArm', cascade='all, delete-orphan')
     
     def __init__(self, slug, name, destinations, weights):
+        """`destinations` e `weights` são listas (a codificação JSON é feita aqui)"""
         self.slug = slug
         self.name = name
-        self.destinations = json.dumps(destinations)
-        self.weights = json.dumps(weights)
+        self.set_destinations(destinations, weights)
     
     def get_destinations(self):
-        try:
-            return json.loads(self.destinations)
-        except:
-            return []
+        return json.loads(self.destinations)
     
     def get_weights(self):
-        try:
-            return json.loads(self.weights)
-        except:
-            return []
+        return json.loads(self.weights)
     
-    def set_destinations(self, destinations):
-        self.destinations = json.dumps(destinations)
+    def set_destinations(self, destinations, weights):
+        """Atualiza destinos e pesos juntos: colunas JSON e linhas de split_destinations"""
+        self.destinations = json.dumps(list(destinations))
+        self.weights = json.dumps(list(weights))
+        # Reaproveita as linhas por posição: o flush insere antes de apagar
+        # órfãos, e trocar a lista inteira violaria (url_split_id, position)
+        rows = self.destination_rows
+        for position, (url, weight) in enumerate(zip(destinations, weights)):
+            if position >= len(rows):
+                rows.append(SplitDestination(position=position))
+            row = rows[position]
+            row.url = url
+            row.weight = float(weight)
+            row.host = destination_host(url)
+        del rows[len(destinations):]
         self.updated_at = datetime.utcnow()
     
-    def set_weights(self, weights):
-        self.weights = json.dumps(weights)
-        self.updated_at = datetime.utcnow()
+    def get_weight_schedule(self):
+        return json.loads(self.weight_schedule) if self.weight_schedule else None
+    
+    def get_targeting_rules(self):
+        return json.loads(self.targeting_rules) if self.targeting_rules else None
     
     def to_dict(self):
         return {
@@ -51,11 +104,49 @@ class URLSplit(db.Model):
             'total_clicks': self.total_clicks,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'is_active': self.is_active
+            'is_active': self.is_active,
+            'sticky_mode': self.sticky_mode,
+            'sticky_param': self.sticky_param,
+            'rate_limit': self.rate_limit,
+            'ip_rate_limit': self.ip_rate_limit,
+            'redirect_status': self.redirect_status,
+            'cache_max_age': self.cache_max_age,
+            'weight_schedule': self.get_weight_schedule(),
+            'bandit_mode': self.bandit_mode,
+            'bandit_epsilon': self.bandit_epsilon,
+            'targeting_rules': self.get_targeting_rules(),
+            'version': self.version
+        }
+
+class SplitDestination(db.Model):
+    """Destino de um split, um por linha (consultas por host/URL sem decodificar JSON)"""
+    __tablename__ = 'split_destinations'
+    __table_args__ = (
+        db.UniqueConstraint('url_split_id', 'position', name='uq_split_destinations_position'),
+        db.Index('ix_split_destinations_host', 'host'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url_split_id = db.Column(db.Integer, db.ForeignKey('url_splits.id', ondelete='CASCADE'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    weight = db.Column(db.Float, nullable=False)
+    host = db.Column(db.String(255), nullable=False, default='')
+    
+    def to_dict(self):
+        return {
+            'url_split_id': self.url_split_id,
+            'position': self.position,
+            'url': self.url,
+            'weight': self.weight,
+            'host': self.host
         }
 
 class ClickLog(db.Model):
     __tablename__ = 'click_logs'
+    __table_args__ = (
+        db.Index('ix_click_logs_split_clicked', 'url_split_id', 'clicked_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     url_split_id = db.Column(db.Integer, db.ForeignKey('url_splits.id'), nullable=False)
@@ -80,3 +171,66 @@ class ClickLog(db.Model):
             'clicked_at': self.clicked_at.isoformat() if self.clicked_at else None
         }
 
+
+class BanditArm(db.Model):
+    """Tentativas (cliques) e sucessos (conversões) de um destino de split em modo bandit"""
+    __tablename__ = 'bandit_arms'
+    __table_args__ = (
+        db.UniqueConstraint('url_split_id', 'arm', name='uq_bandit_arms_arm'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url_split_id = db.Column(db.Integer, db.ForeignKey('url_splits.id', ondelete='CASCADE'), nullable=False)
+    arm = db.Column(db.Integer, nullable=False)  # crc32 da URL de destino (vai no click id)
+    destination_url = db.Column(db.String(500), nullable=True)
+    trials = db.Column(db.Integer, nullable=False, default=0)
+    successes = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'url_split_id': self.url_split_id,
+            'destination_url': self.destination_url,
+            'trials': self.trials,
+            'successes': self.successes,
+            'conversion_rate': self.successes / self.trials if self.trials else None
+        }
+
+
+class BanditConversion(db.Model):
+    """Click ids já convertidos (deduplicação das postbacks dentro da janela de conversão)"""
+    __tablename__ = 'bandit_conversions'
+    __table_args__ = (
+        db.Index('ix_bandit_conversions_converted', 'converted_at'),
+    )
+    
+    click_id = db.Column(db.String(80), primary_key=True)
+    url_split_id = db.Column(db.Integer, nullable=False)
+    arm = db.Column(db.Integer, nullable=False)
+    converted_at = db.Column(db.Integer, nullable=False)  # epoch UTC (segundos)
+
+
+class ClickRollup(db.Model):
+    """Contagem pré-agregada de cliques por destino e intervalo (minuto/hora/dia)"""
+    __tablename__ = 'click_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('url_split_id', 'destination_url', 'granularity', 'bucket_start',
+                            name='uq_click_rollups_bucket'),
+        db.Index('ix_click_rollups_split_bucket', 'url_split_id', 'bucket_start'),
+        db.Index('ix_click_rollups_granularity_bucket', 'granularity', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url_split_id = db.Column(db.Integer, db.ForeignKey('url_splits.id'), nullable=False)
+    destination_url = db.Column(db.String(500), nullable=False)
+    granularity = db.Column(db.String(10), nullable=False)  # 'minute', 'hour' ou 'day'
+    bucket_start = db.Column(db.Integer, nullable=False)  # epoch UTC (segundos) do início do intervalo
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'url_split_id': self.url_split_id,
+            'destination_url': self.destination_url,
+            'granularity': self.granularity,
+            'bucket_start': self.bucket_start,
+            'clicks': self.clicks
+        }
@@ -0,0 +1,434 @@
+"""
+Servidor assíncrono só de redirecionamento (GET/HEAD /api/r/<slug>)
+
+Um event loop asyncio por processo serve os redirecionamentos a partir de uma
+tabela em memória com todos os splits compilados (mesma tabela url_splits,
+lida via engine SQLAlchemy). A tabela é recarregada inteira, fora do loop,
+quando a geração publicada pela API Flask muda (SPLIT_GENERATION_PATH).
+Os cliques seguem para o mesmo click writer em lote. A API administrativa
+continua no Flask (src/main.py); o proxy encaminha /api/r/ para cá.
+
+Com vários workers e SPLIT_SHARED_TABLE (ou --shared-table), o processo pai
+vira o carregador único: publica a tabela num arquivo mapeado que todos os
+workers leem (memória constante com o número de workers, uma publicação
+por edição). Sem isso, cada worker mantém sua própria cópia.
+
+Uso: python src/redirect_server.py [--host 0.0.0.0] [--port 8080] [--workers N] [--shared-table PATH]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import math
+import os
+import signal
+import socket
+import sys
+import threading
+import uuid
+from urllib.parse import parse_qs, unquote
+
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask
+from werkzeug.urls import iri_to_uri
+
+from src.config import load_config
+from src.models.user import db
+from src.services.database import configure_sqlite
+from src.services.logging_setup import configure_logging
+from src.services.metrics import metrics
+from src.services.bandit import bandit, with_click_id
+from src.services.click_writer import click_writer
+from src.services.click_archive import click_archive
+from src.services.destination_health import destination_health, failover, probe_destination
+from src.services.shared_table import SharedSplitTable, SplitTablePublisher
+from src.services.split_cache import BanditSplit, GenerationFile, cache_control, load_split_table
+from src.services.targeting import targeting
+from src.services.traffic_filter import traffic_filter
+
+REDIRECT_PREFIX = '/api/r/'
+VISITOR_COOKIE = 'us_vid'
+MAX_HEADER_BYTES = 16384
+STATUS_LINES = {302: '302 Found', 307: '307 Temporary Redirect', 308: '308 Permanent Redirect'}
+
+logger = logging.getLogger('url_splitter.redirect_server')
+redirect_logger = logging.getLogger('url_splitter.redirect')
+
+
+def build_config_app(database_path=None):
+    """
+    App Flask usada só como contêiner de configuração (a mesma de src/main.py,
+    via load_config), para reaproveitar engine, logging e click writer.
+    """
+    app = Flask(__name__)
+    app.config.update(load_config({'DATABASE_PATH': database_path} if database_path else None))
+    # 'block' pararia o event loop inteiro: com fila cheia o clique é descartado
+    app.config['CLICK_BACKPRESSURE'] = 'drop'
+    configure_logging(app)
+    configure_sqlite(app)
+    db.init_app(app)
+    return app
+
+
+def _response(status, headers=(), body=b'', keep_alive=True, head=False):
+    lines = [f'HTTP/1.1 {status}']
+    lines += [f'{name}: {value}' for name, value in headers]
+    lines.append(f'Content-Length: {len(body)}')
+    if not keep_alive:
+        lines.append('Connection: close')
+    payload = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+    return payload if head else payload + body
+
+
+def _json_response(status, data, keep_alive=True, head=False):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    return _response(status, [('Content-Type', 'application/json')], body, keep_alive, head)
+
+
+_TOO_MANY_REQUESTS = json.dumps({'error': 'Muitas requisições'}, ensure_ascii=False).encode('utf-8')
+
+# Location já codificada por destino (URLs com caracteres não ASCII)
+_location = functools.lru_cache(maxsize=8192)(iri_to_uri)
+
+
+def _cookie(header, name):
+    for part in header.split(';'):
+        key, _, value = part.strip().partition('=')
+        if key == name:
+            return value
+    return None
+
+
+class RedirectTable:
+    """Todos os splits compilados em memória, trocados inteiros a cada geração"""
+
+    def __init__(self, engine, generation_path=None, check_interval=1.0):
+        self.engine = engine
+        self.generation_file = GenerationFile(generation_path)
+        self.check_interval = check_interval
+        self.splits = {}
+        self.loaded_generation = None
+        self.reloads = 0
+
+    def load(self):
+        """Lê e compila a tabela inteira (chamado fora do event loop)"""
+        generation = self.generation_file.read()
+        # Troca atômica: requisições em andamento seguem com a tabela antiga
+        self.splits = load_split_table(self.engine)
+        self.loaded_generation = generation
+        self.reloads += 1
+        return len(self.splits)
+
+    @property
+    def generation(self):
+        return self.loaded_generation
+
+    def get(self, slug):
+        """(encontrado, CompiledSplit ou None)"""
+        splits = self.splits
+        if slug not in splits:
+            return False, None
+        return True, splits[slug]
+
+    def __len__(self):
+        return len(self.splits)
+
+    async def watch(self):
+        """Recarrega a tabela quando a geração muda"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            if self.generation_file.read() == self.loaded_generation:
+                continue
+            try:
+                count = await loop.run_in_executor(None, self.load)
+                logger.info('🔄 Tabela de redirecionamento recarregada: %d splits', count)
+            except Exception as e:
+                logger.error('❌ Erro ao recarregar splits: %s', e)
+
+
+class RedirectProtocol(asyncio.Protocol):
+    """HTTP/1.1 mínimo com keep-alive e pipelining (só GET/HEAD)"""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.peer_ip = None
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+        peer = transport.get_extra_info('peername')
+        self.peer_ip = peer[0] if peer else None
+
+    def data_received(self, data):
+        self.buffer += data
+        while self.transport is not None:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(self.buffer) > MAX_HEADER_BYTES:
+                    self.transport.write(_json_response('431 Request Header Fields Too Large',
+                                                        {'error': 'Cabeçalhos grandes demais'}, False))
+                    self.transport.close()
+                return
+            head = self.buffer[:end].decode('latin-1')
+            self.buffer = self.buffer[end + 4:]
+            response, keep_alive = self.server.handle(head, self.peer_ip)
+            self.transport.write(response)
+            if not keep_alive:
+                self.transport.close()
+                return
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+
+class RedirectServer:
+    """Tratamento das requisições sobre a RedirectTable"""
+
+    def __init__(self, table, cache_max_age=60):
+        self.table = table
+        self.cache_max_age = cache_max_age
+
+    def handle(self, head, peer_ip):
+        """Recebe o cabeçalho bruto; retorna (bytes da resposta, manter conexão)"""
+        request_line, _, header_block = head.partition('\r\n')
+        try:
+            method, target, version = request_line.split(' ', 2)
+        except ValueError:
+            return _json_response('400 Bad Request', {'error': 'Requisição inválida'}, False), False
+
+        headers = {}
+        for line in header_block.split('\r\n'):
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        if 'content-length' in headers or 'transfer-encoding' in headers:
+            # Corpo não é lido: fechar evita interpretar o corpo como nova requisição
+            keep_alive = False
+        head_only = method == 'HEAD'
+        if method not in ('GET', 'HEAD'):
+            return _json_response('405 Method Not Allowed', {'error': 'Método não permitido'},
+                                  False), False
+
+        path, _, query = target.partition('?')
+        if path.startswith(REDIRECT_PREFIX):
+            try:
+                return self.redirect(unquote(path[len(REDIRECT_PREFIX):]), query, headers,
+                                     peer_ip, keep_alive, head_only), keep_alive
+            except Exception as e:
+                logger.exception('❌ Erro crítico no redirecionamento: %s', e)
+                return _json_response('500 Internal Server Error', {'error': 'Erro interno do servidor'},
+                                      keep_alive, head_only), keep_alive
+        if path == '/api/health':
+            return _json_response('200 OK', {
+                'status': 'ok',
+                'splits_count': len(self.table),
+                'generation': self.table.generation,
+                'shared': isinstance(self.table, SharedSplitTable),
+                'clicks': click_writer.stats(),
+                'traffic_filter': traffic_filter.stats(),
+                'targeting': targeting.stats(),
+                'destination_health': destination_health.stats(),
+                'bandit': bandit.stats(),
+            }, keep_alive, head_only), keep_alive
+        return _json_response('404 Not Found', {'error': 'Not found'}, keep_alive, head_only), keep_alive
+
+    def redirect(self, slug, query, headers, peer_ip, keep_alive, head_only):
+        found, compiled = self.table.get(slug)
+        if not found:
+            redirect_logger.info("❌ Split '%s' não encontrado", slug)
+            return _json_response('404 Not Found', {'error': 'Split not found'}, keep_alive, head_only)
+        if compiled is None:
+            redirect_logger.warning("❌ Nenhum destino válido no split '%s'", slug)
+            return _json_response('404 Not Found', {'error': 'Nenhum destino válido'}, keep_alive, head_only)
+
+        status = STATUS_LINES[compiled.redirect_status]
+        policy = cache_control(compiled, self.cache_max_age)
+        if head_only:
+            # Sondagem (unfurlers, monitores): um destino válido, sem registrar clique
+            metrics.inc('redirect_probes_total', slug=slug)
+            headers = [('Location', _location(probe_destination(compiled, destination_health.current()))),
+                       ('Cache-Control', policy)]
+            return _response(status, headers, keep_alive=keep_alive, head=True)
+
+        ip = traffic_filter.client_ip(peer_ip, headers.get('x-forwarded-for'))
+        user_agent = headers.get('user-agent')
+        limited = traffic_filter.check(compiled, ip)
+        if limited:
+            scope, retry_after = limited
+            metrics.inc('redirects_limited_total', scope=scope)
+            return _response('429 Too Many Requests',
+                             [('Content-Type', 'application/json'), ('Retry-After', math.ceil(retry_after))],
+                             _TOO_MANY_REQUESTS, keep_alive, head_only)
+        is_bot = traffic_filter.is_bot(user_agent)
+
+        extra_headers = [('Cache-Control', policy)]
+        visitor_key = None
+        unhealthy = destination_health.current()
+        targeted_url = targeting.route(compiled.rules, ip, headers) if compiled.rules else None
+        if targeted_url in unhealthy:
+            targeted_url = None
+        if targeted_url:
+            chosen_url = targeted_url
+            metrics.inc('targeted_redirects_total', slug=slug)
+        elif compiled.sticky_mode and compiled.destination_count > 1:
+            if compiled.sticky_mode == 'cookie':
+                visitor_key = _cookie(headers.get('cookie', ''), VISITOR_COOKIE)
+                if not visitor_key:
+                    visitor_key = uuid.uuid4().hex
+                    extra_headers.append(('Set-Cookie', f'{VISITOR_COOKIE}={visitor_key}; '
+                                          f'Max-Age={365 * 24 * 3600}; HttpOnly; Path=/; SameSite=Lax'))
+            elif compiled.sticky_mode == 'param':
+                values = parse_qs(query).get(compiled.sticky_param or 'vid')
+                visitor_key = values[0] if values else None
+            elif compiled.sticky_mode == 'ip_ua':
+                visitor_key = f"{ip}|{user_agent or ''}"
+            chosen_url = compiled.pick_sticky(visitor_key)
+        else:
+            chosen_url = compiled.pick()
+        if chosen_url in unhealthy and not targeted_url:
+            healthy_url = failover(compiled, unhealthy, visitor_key)
+            if healthy_url:
+                chosen_url = healthy_url
+                metrics.inc('failover_redirects_total', slug=slug)
+
+        redirect_logger.debug('🔗 Redirecionando %s -> %s (bot=%s)', slug, chosen_url, is_bot)
+        metrics.inc('redirects_total', slug=slug, destination=chosen_url)
+        if is_bot:
+            metrics.inc('bot_redirects_total', slug=slug)
+        record_click = not traffic_filter.skip_click(is_bot)
+        if record_click:
+            click_writer.record(compiled.id, chosen_url, ip, user_agent)
+
+        location = _location(chosen_url)
+        if isinstance(compiled, BanditSplit) and not targeted_url:
+            click_id = bandit.track(compiled.arms, chosen_url, count_trial=record_click)
+            location = with_click_id(location, bandit.param, click_id)
+        return _response(status, [('Location', location)] + extra_headers,
+                         keep_alive=keep_alive, head=head_only)
+
+
+def serve(sock, app, shared_path=None):
+    """Roda um event loop servindo no socket já aberto (um por processo)"""
+    click_archive.init_app(app)
+    click_writer.init_app(app)
+    traffic_filter.init_app(app)
+    targeting.init_app(app)
+    destination_health.init_app(app)
+    bandit.init_app(app)
+    metrics.directory = app.config.get('METRICS_DIR')
+    metrics.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', metrics.flush_interval)
+    if metrics.directory:
+        os.makedirs(metrics.directory, exist_ok=True)
+
+    check_interval = app.config.get('SPLIT_CACHE_CHECK_INTERVAL', 1.0)
+    if shared_path:
+        # Só leitura: o carregador (processo pai) publica, o worker mapeia
+        table = SharedSplitTable(shared_path, check_interval)
+        table.refresh(force=True)
+    else:
+        table = RedirectTable(db.get_engine(app), app.config.get('SPLIT_GENERATION_PATH'), check_interval)
+        table.load()
+    logger.info('🚀 Worker %d servindo %d splits%s', os.getpid(), len(table),
+                ' (tabela compartilhada)' if shared_path else '')
+    server = RedirectServer(table, app.config.get('REDIRECT_CACHE_MAX_AGE', 60))
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        stop = loop.create_future()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, lambda: stop.done() or stop.set_result(None))
+        listener = await loop.create_server(lambda: RedirectProtocol(server), sock=sock)
+        watcher = asyncio.ensure_future(table.watch()) if not shared_path else None
+        await stop
+        if watcher is not None:
+            watcher.cancel()
+        listener.close()
+        await listener.wait_closed()
+
+    asyncio.run(main())
+    click_writer.drain()
+    bandit.drain()
+    metrics.flush()
+
+
+def run(host='0.0.0.0', port=8080, workers=1, database_path=None, shared_path=None):
+    """
+    Abre o socket e serve com `workers` processos (fork compartilhando o socket).
+    Com `shared_path` e mais de um worker, o processo pai publica a tabela
+    compartilhada e os workers só a mapeiam.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+
+    app = build_config_app(database_path)
+    shared_path = shared_path or app.config.get('SPLIT_SHARED_TABLE') or None
+    logger.info('🚀 Servidor de redirecionamento em %s:%d (%d workers)', host, port, workers)
+    if workers <= 1:
+        serve(sock, app)
+        return
+
+    publisher = None
+    if shared_path:
+        engine = db.get_engine(app)
+        publisher = SplitTablePublisher(engine, shared_path, app.config.get('SPLIT_GENERATION_PATH'),
+                                        app.config.get('SPLIT_CACHE_CHECK_INTERVAL', 1.0))
+        publisher.publish()
+        # Conexões do pool não podem ser herdadas pelos filhos
+        engine.dispose()
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve(sock, app, shared_path)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    stop = threading.Event()
+    if publisher is not None:
+        threading.Thread(target=publisher.run_forever, args=(stop,), name='split-table-publisher',
+                         daemon=True).start()
+
+    def _forward(signum, frame):
+        stop.set()
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _forward)
+    signal.signal(signal.SIGINT, _forward)
+    for child in children:
+        while True:
+            try:
+                os.waitpid(child, 0)
+                break
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor assíncrono de redirecionamento')
+    parser.add_argument('--host', default=os.environ.get('REDIRECT_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('REDIRECT_PORT', 8080)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('REDIRECT_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--database', default=None, help='caminho do SQLite (padrão: DATABASE_PATH)')
+    parser.add_argument('--shared-table', default=None,
+                        help='arquivo da tabela compartilhada entre workers (padrão: SPLIT_SHARED_TABLE)')
+    args = parser.parse_args()
+    run(args.host, args.port, args.workers, args.database, args.shared_table)
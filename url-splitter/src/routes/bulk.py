@@ -0,0 +1,496 @@
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.url_split import URLSplit as UrlSplit, SplitDestination, destination_rows
+from src.routes.url_split import (normalize_weights, parse_bandit_options, parse_rate_limits,
+                                  parse_redirect_options, parse_sticky_options, parse_targeting_rules,
+                                  parse_time_arg, parse_weight_schedule, replace_destination_rows,
+                                  split_ids_with_host, write_split)
+from src.services.click_archive import click_archive
+from src.services.split_cache import split_cache, decode_json_list, VALID_PREFIXES
+from datetime import datetime, timedelta
+import csv
+import io
+import json
+import logging
+
+bulk_bp = Blueprint('bulk', __name__)
+logger = logging.getLogger('url_splitter.routes')
+
+# Colunas do CSV; listas (destinos/pesos) separadas por '|', weight_schedule e targeting_rules em JSON
+CSV_FIELDS = ['slug', 'name', 'destinations', 'weights', 'sticky_mode', 'sticky_param',
+              'rate_limit', 'ip_rate_limit', 'redirect_status', 'cache_max_age', 'weight_schedule',
+              'bandit_mode', 'bandit_epsilon', 'targeting_rules']
+EXPORT_COLUMNS = [UrlSplit.id, UrlSplit.slug, UrlSplit.name, UrlSplit.destinations, UrlSplit.weights,
+                  UrlSplit.sticky_mode, UrlSplit.sticky_param, UrlSplit.rate_limit, UrlSplit.ip_rate_limit,
+                  UrlSplit.redirect_status, UrlSplit.cache_max_age, UrlSplit.weight_schedule,
+                  UrlSplit.bandit_mode, UrlSplit.bandit_epsilon, UrlSplit.targeting_rules,
+                  UrlSplit.is_active, UrlSplit.total_clicks]
+
+_insert_splits = UrlSplit.__table__.insert()
+_insert_destinations = SplitDestination.__table__.insert()
+
+def validate_split_row(data):
+    """Valida e normaliza um split do import; retorna (linha para INSERT, erro)"""
+    if not isinstance(data, dict):
+        return None, 'Linha deve ser um objeto'
+    if not data.get('slug'):
+        return None, 'Slug é obrigatório'
+    if not data.get('name'):
+        return None, 'Nome é obrigatório'
+    
+    destinations = data.get('destinations')
+    if isinstance(destinations, str):
+        destinations = [destinations]
+    if not destinations:
+        return None, 'Pelo menos um destino é obrigatório'
+    for url in destinations:
+        if not isinstance(url, str) or not url.startswith(VALID_PREFIXES):
+            return None, f'URL inválida: {url}'
+    
+    weights = data.get('weights') or []
+    if len(weights) != len(destinations):
+        weights = [round(100 / len(destinations), 1)] * len(destinations)
+    if not all(isinstance(w, (int, float)) and not isinstance(w, bool) and w >= 0 for w in weights):
+        return None, 'Pesos devem ser números não negativos'
+    
+    sticky_mode, sticky_param, error = parse_sticky_options(data)
+    if error:
+        return None, error
+    rate_limit, ip_rate_limit, error = parse_rate_limits(data)
+    if error:
+        return None, error
+    redirect_status, cache_max_age, error = parse_redirect_options(data)
+    if error:
+        return None, error
+    weight_schedule, error = parse_weight_schedule(data, len(destinations))
+    if error:
+        return None, error
+    bandit_mode, bandit_epsilon, error = parse_bandit_options(data)
+    if error:
+        return None, error
+    targeting_rules, error = parse_targeting_rules(data)
+    if error:
+        return None, error
+    
+    return {
+        'slug': str(data['slug']),
+        'name': str(data['name']),
+        'destinations': json.dumps(destinations),
+        'weights': json.dumps(weights),
+        'sticky_mode': sticky_mode,
+        'sticky_param': sticky_param,
+        'rate_limit': rate_limit,
+        'ip_rate_limit': ip_rate_limit,
+        'redirect_status': redirect_status,
+        'cache_max_age': cache_max_age,
+        'weight_schedule': weight_schedule,
+        'bandit_mode': bandit_mode,
+        'bandit_epsilon': bandit_epsilon,
+        'targeting_rules': targeting_rules,
+    }, None
+
+def iter_ndjson(stream):
+    """(número da linha, objeto ou erro) para cada linha do NDJSON"""
+    for line_no, raw in enumerate(stream, start=1):
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line), None
+        except ValueError as e:
+            yield line_no, None, f'JSON inválido: {e}'
+
+def iter_csv(stream):
+    """(número da linha, objeto ou erro) para cada linha do CSV (com cabeçalho)"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    reader = csv.DictReader(text)
+    for line_no, row in enumerate(reader, start=2):
+        try:
+            destinations = [d for d in (row.get('destinations') or '').split('|') if d]
+            weights = [float(w) for w in (row.get('weights') or '').split('|') if w]
+        except ValueError:
+            yield line_no, None, 'Pesos devem ser números'
+            continue
+        numbers = {}
+        try:
+            for field, kind in (('rate_limit', float), ('ip_rate_limit', float),
+                                ('redirect_status', int), ('cache_max_age', int), ('bandit_epsilon', float)):
+                numbers[field] = kind(row[field]) if row.get(field) else None
+        except ValueError:
+            yield line_no, None, f'{field} deve ser um número'
+            continue
+        yield line_no, dict(row, destinations=destinations, weights=weights, **numbers), None
+
+def insert_rows(rows):
+    """INSERT dos splits e, na mesma transação, das suas linhas em split_destinations"""
+    db.session.execute(_insert_splits, rows)
+    ids = dict(db.session.query(UrlSplit.slug, UrlSplit.id)
+               .filter(UrlSplit.slug.in_([row['slug'] for row in rows])))
+    children = []
+    for row in rows:
+        children.extend(destination_rows(ids[row['slug']], json.loads(row['destinations']),
+                                         json.loads(row['weights'])))
+    db.session.execute(_insert_destinations, children)
+    db.session.commit()
+
+def insert_chunk(chunk, errors):
+    """
+    Insere um lote validado. Slugs já existentes são detectados com um único
+    SELECT ... IN; se outra escrita concorrente vencer a corrida, o lote é
+    refeito linha a linha para isolar o conflito.
+    """
+    slugs = [row['slug'] for _, row in chunk]
+    existing = {slug for (slug,) in db.session.query(UrlSplit.slug).filter(UrlSplit.slug.in_(slugs))}
+    
+    rows = []
+    for line_no, row in chunk:
+        if row['slug'] in existing:
+            errors.append({'line': line_no, 'slug': row['slug'], 'error': 'Slug já existe'})
+        else:
+            rows.append((line_no, row))
+    if not rows:
+        return 0
+    
+    try:
+        insert_rows([row for _, row in rows])
+        return len(rows)
+    except IntegrityError:
+        db.session.rollback()
+    
+    inserted = 0
+    for line_no, row in rows:
+        try:
+            insert_rows([row])
+            inserted += 1
+        except IntegrityError:
+            db.session.rollback()
+            errors.append({'line': line_no, 'slug': row['slug'], 'error': 'Slug já existe'})
+    return inserted
+
+# Colunas lidas (uma consulta por lote) para validar as edições da PATCH em lote
+PATCH_COLUMNS = [UrlSplit.id, UrlSplit.slug, UrlSplit.version, UrlSplit.destinations, UrlSplit.weights,
+                 UrlSplit.weight_schedule]
+
+def validate_patch_item(item, current):
+    """
+    Valida uma edição de pesos/destinos contra a linha atual do split.
+    Retorna (destinos, pesos normalizados, erro).
+    """
+    destinations = item.get('destinations')
+    weights = item.get('weights')
+    if destinations is None and weights is None:
+        return None, None, 'Informe weights e/ou destinations'
+    old_destinations = decode_json_list(current.destinations)
+    if destinations is None:
+        destinations = old_destinations
+    else:
+        if isinstance(destinations, str):
+            destinations = [destinations]
+        if not isinstance(destinations, list) or not destinations:
+            return None, None, 'Pelo menos um destino é obrigatório'
+        for url in destinations:
+            if not isinstance(url, str) or not url.startswith(VALID_PREFIXES):
+                return None, None, f'URL inválida: {url}'
+    if weights is None:
+        if len(destinations) == len(old_destinations):
+            weights = decode_json_list(current.weights)
+        else:
+            weights = [round(100 / len(destinations), 1)] * len(destinations)
+    elif not isinstance(weights, list) or len(weights) != len(destinations):
+        return None, None, f'weights deve ter {len(destinations)} valores, um por destino'
+    if not all(isinstance(w, (int, float)) and not isinstance(w, bool) and w >= 0 for w in weights):
+        return None, None, 'Pesos devem ser números não negativos'
+    if not sum(weights) > 0:
+        return None, None, 'Pelo menos um peso deve ser positivo'
+    if current.weight_schedule and len(destinations) != len(old_destinations):
+        _, error = parse_weight_schedule({'weight_schedule': current.weight_schedule}, len(destinations))
+        if error:
+            return None, None, f'O plano de pesos do split não vale para {len(destinations)} destinos ({error})'
+    return destinations, normalize_weights(weights), None
+
+def load_patch_targets(items):
+    """Linhas atuais dos splits do lote, por id e por slug (um SELECT ... IN para cada)"""
+    ids = [item['id'] for item in items if isinstance(item, dict) and isinstance(item.get('id'), int)]
+    slugs = [item['slug'] for item in items
+             if isinstance(item, dict) and 'id' not in item and isinstance(item.get('slug'), str)]
+    by_id, by_slug = {}, {}
+    if ids:
+        for row in db.session.query(*PATCH_COLUMNS).filter(UrlSplit.id.in_(ids)):
+            by_id[row.id] = row
+    if slugs:
+        for row in db.session.query(*PATCH_COLUMNS).filter(UrlSplit.slug.in_(slugs)):
+            by_slug[row.slug] = row
+    return by_id, by_slug
+
+@bulk_bp.route('/splits', methods=['PATCH'])
+def patch_splits():
+    """
+    Edição em lote de pesos/destinos numa transação, com resultado por item.
+
+    Cada item identifica o split por `id` ou `slug` e pode trazer `version`
+    (a do GET/listagem): o item só é aplicado se o split ainda estiver nessa
+    versão. Sem `version`, vale a versão lida no início do lote, então uma
+    edição concorrente nunca é sobrescrita em silêncio. Com `atomic: true`,
+    qualquer falha desfaz o lote inteiro.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if isinstance(data, list):
+            data = {'items': data}
+        items = data.get('items') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Envie {"items": [{"id" ou "slug", "weights", "destinations", "version"}, ...]}'}), 400
+        max_items = current_app.config.get('BATCH_MAX_ITEMS', 1000)
+        if len(items) > max_items:
+            return jsonify({'error': f'No máximo {max_items} itens por lote'}), 400
+        atomic = bool(data.get('atomic'))
+        
+        by_id, by_slug = load_patch_targets(items)
+        results = []
+        seen = set()
+        writes = []
+        for index, item in enumerate(items):
+            result = {'index': index}
+            results.append(result)
+            if not isinstance(item, dict):
+                result.update(status='invalid', error='Item deve ser um objeto')
+                continue
+            if 'id' in item:
+                current = by_id.get(item['id'])
+            else:
+                current = by_slug.get(item.get('slug'))
+            if current is None:
+                result.update(id=item.get('id'), slug=item.get('slug'), status='not_found',
+                              error='Split não encontrado')
+                continue
+            result.update(id=current.id, slug=current.slug)
+            if current.id in seen:
+                result.update(status='invalid', error='Split repetido no lote')
+                continue
+            seen.add(current.id)
+            version = item.get('version', current.version)
+            if not isinstance(version, int) or isinstance(version, bool):
+                result.update(status='invalid', error='version deve ser um inteiro')
+                continue
+            if version != current.version:
+                result.update(status='conflict', version=current.version,
+                              error='Split alterado por outra requisição')
+                continue
+            destinations, weights, error = validate_patch_item(item, current)
+            if error:
+                result.update(status='invalid', error=error)
+                continue
+            writes.append((result, current, version, destinations, weights))
+        
+        failed = len(results) - len(writes)
+        if atomic and failed:
+            for result, *_ in writes:
+                result['status'] = 'not_applied'
+            return jsonify({'updated': 0, 'failed': failed, 'results': results}), 409
+        
+        # Uma transação: cada UPDATE é condicionado à versão lida (sem lost update)
+        applied = {}
+        for result, current, version, destinations, weights in writes:
+            if write_split(current.id, {'destinations': json.dumps(destinations), 'weights': json.dumps(weights)},
+                           version):
+                applied[current.id] = (destinations, weights)
+                result.update(status='updated', version=version + 1, destinations=destinations, weights=weights)
+            else:
+                result.update(status='conflict', error='Split alterado por outra requisição')
+        conflicts = len(writes) - len(applied)
+        if atomic and conflicts:
+            db.session.rollback()
+            for result, *_ in writes:
+                if result['status'] == 'updated':
+                    result['status'] = 'not_applied'
+                    del result['version'], result['destinations'], result['weights']
+            return jsonify({'updated': 0, 'failed': conflicts, 'results': results}), 409
+        replace_destination_rows(applied)
+        db.session.commit()
+        if applied:
+            split_cache.invalidate(*(result['slug'] for result, *_ in writes if result['status'] == 'updated'))
+        
+        logger.info('✏️ Edição em lote: %d splits atualizados, %d com erro', len(applied), failed + conflicts)
+        
+        return jsonify({'updated': len(applied), 'failed': failed + conflicts, 'results': results}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('❌ Erro na edição em lote: %s', e)
+        return jsonify({'error': str(e)}), 500
+
+@bulk_bp.route('/splits/import', methods=['POST'])
+def import_splits():
+    """Importar splits em massa (NDJSON ou CSV) com relatório de erros por linha"""
+    try:
+        fmt = request.args.get('format') or ('csv' if 'csv' in (request.content_type or '') else 'ndjson')
+        if fmt not in ('ndjson', 'csv'):
+            return jsonify({'error': f'Formato inválido: {fmt}'}), 400
+        
+        chunk_size = current_app.config.get('BULK_CHUNK_SIZE', 1000)
+        max_errors = current_app.config.get('BULK_MAX_ERRORS', 1000)
+        rows = iter_csv(request.stream) if fmt == 'csv' else iter_ndjson(request.stream)
+        
+        imported = 0
+        failed = 0
+        errors = []
+        seen_slugs = set()
+        chunk = []
+        
+        def flush():
+            nonlocal imported, failed, chunk
+            before = len(errors)
+            imported += insert_chunk(chunk, errors)
+            failed += len(errors) - before
+            chunk = []
+        
+        for line_no, data, error in rows:
+            row = None
+            if error is None:
+                row, error = validate_split_row(data)
+            if error is None and row['slug'] in seen_slugs:
+                error = 'Slug repetido no arquivo'
+            if error is not None:
+                failed += 1
+                slug = data.get('slug') if isinstance(data, dict) else None
+                errors.append({'line': line_no, 'slug': slug, 'error': error})
+            else:
+                seen_slugs.add(row['slug'])
+                chunk.append((line_no, row))
+                if len(chunk) >= chunk_size:
+                    flush()
+            del errors[max_errors:]
+        if chunk:
+            flush()
+        
+        if imported:
+            split_cache.invalidate()
+        
+        logger.info('📦 Import em massa: %d criados, %d com erro', imported, failed)
+        
+        return jsonify({
+            'imported': imported,
+            'failed': failed,
+            'errors': errors[:max_errors],
+            'errors_truncated': failed > len(errors)
+        }), 200 if imported or not failed else 400
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('❌ Erro no import em massa: %s', e)
+        return jsonify({'error': str(e)}), 500
+
+def iter_export_rows(page_size, host=None):
+    """Percorre a tabela por páginas (keyset em id) sem materializá-la inteira"""
+    cursor = 0
+    while True:
+        query = db.session.query(*EXPORT_COLUMNS).filter(UrlSplit.id > cursor)
+        if host:
+            query = query.filter(UrlSplit.id.in_(split_ids_with_host(host)))
+        rows = (query
+                .order_by(UrlSplit.id)
+                .limit(page_size)
+                .all())
+        if not rows:
+            return
+        for row in rows:
+            yield {
+                'slug': row.slug,
+                'name': row.name,
+                'destinations': decode_json_list(row.destinations),
+                'weights': decode_json_list(row.weights),
+                'sticky_mode': row.sticky_mode,
+                'sticky_param': row.sticky_param,
+                'rate_limit': row.rate_limit,
+                'ip_rate_limit': row.ip_rate_limit,
+                'redirect_status': row.redirect_status,
+                'cache_max_age': row.cache_max_age,
+                'weight_schedule': json.loads(row.weight_schedule) if row.weight_schedule else None,
+                'bandit_mode': row.bandit_mode,
+                'bandit_epsilon': row.bandit_epsilon,
+                'targeting_rules': json.loads(row.targeting_rules) if row.targeting_rules else None,
+                'is_active': row.is_active,
+                'total_clicks': row.total_clicks,
+            }
+        cursor = rows[-1].id
+
+@bulk_bp.route('/splits/export', methods=['GET'])
+def export_splits():
+    """Exportar todos os splits em streaming (NDJSON ou CSV); `host` filtra por host de destino"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': f'Formato inválido: {fmt}'}), 400
+    page_size = current_app.config.get('BULK_CHUNK_SIZE', 1000)
+    host = request.args.get('host', '').strip().lower()
+    
+    def generate_ndjson():
+        for item in iter_export_rows(page_size, host):
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+    
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for item in iter_export_rows(page_size, host):
+            writer.writerow(dict(item,
+                                 destinations='|'.join(item['destinations']),
+                                 weights='|'.join(str(w) for w in item['weights']),
+                                 weight_schedule=json.dumps(item['weight_schedule'])
+                                 if item['weight_schedule'] else '',
+                                 targeting_rules=json.dumps(item['targeting_rules'], ensure_ascii=False)
+                                 if item['targeting_rules'] else ''))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    
+    if fmt == 'csv':
+        return Response(stream_with_context(generate_csv()), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=splits.csv'})
+    return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=splits.ndjson'})
+
+@bulk_bp.route('/clicks/partitions', methods=['GET'])
+def click_partitions():
+    """Meses de cliques disponíveis (partições vivas e arquivos comprimidos)"""
+    if not click_archive.enabled:
+        return jsonify({'error': 'Particionamento de cliques desativado (CLICK_PARTITION_DIR)'}), 400
+    return jsonify({
+        'retention_months': click_archive.retention_months,
+        'partitions': click_archive.partitions()
+    })
+
+@bulk_bp.route('/clicks/archive', methods=['POST'])
+def archive_clicks():
+    """Arquiva agora as partições além da retenção"""
+    if not click_archive.enabled:
+        return jsonify({'error': 'Particionamento de cliques desativado (CLICK_PARTITION_DIR)'}), 400
+    try:
+        archived = click_archive.archive()
+        return jsonify({'archived': [f'{year:04d}-{month:02d}' for year, month in archived]})
+    except Exception as e:
+        logger.exception('❌ Erro ao arquivar cliques: %s', e)
+        return jsonify({'error': str(e)}), 500
+
+@bulk_bp.route('/splits/<int:split_id>/clicks/export', methods=['GET'])
+def export_clicks(split_id):
+    """Exportar os cliques brutos de um split em streaming (NDJSON), inclusive meses arquivados"""
+    if not click_archive.enabled:
+        return jsonify({'error': 'Particionamento de cliques desativado (CLICK_PARTITION_DIR)'}), 400
+    try:
+        until = parse_time_arg('until')
+        since = parse_time_arg('since')
+    except ValueError:
+        return jsonify({'error': 'since/until devem ser epoch ou data ISO 8601'}), 400
+    until = datetime.utcfromtimestamp(until) if until is not None else datetime.utcnow() + timedelta(seconds=1)
+    since = datetime.utcfromtimestamp(since) if since is not None else until - timedelta(days=30)
+    if since >= until:
+        return jsonify({'error': 'since deve ser anterior a until'}), 400
+    
+    def generate():
+        for click in click_archive.iter_clicks(since, until, split_id):
+            yield json.dumps(click, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename=clicks_{split_id}.ndjson'})
@@ -1,75 +1,343 @@
-from flask import Blueprint, request, jsonify, redirect
+from flask import Blueprint, current_app, request, jsonify, redirect, url_for
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 from src.models.user import db
-from src.models.url_split import URLSplit as UrlSplit
-import random
+from src.models.url_split import URLSplit as UrlSplit, BanditArm, SplitDestination, destination_rows
+from src.services.bandit import BANDIT_MODES, arm_hash, bandit, with_click_id
+from src.services.split_cache import (split_cache, cache_control, decode_json_list, BanditSplit,
+                                      REDIRECT_STATUSES, STICKY_MODES)
+from src.services.click_writer import click_writer
+from src.services.click_stats import GRANULARITIES, query_stats
+from src.services.destination_health import destination_health, failover, probe_destination
+from src.services.metrics import metrics
+from src.services.targeting import normalize_rules, targeting
+from src.services.traffic_filter import traffic_filter
+from src.services.weight_schedule import normalize_schedule
+from datetime import datetime, timezone
 import json
+import logging
+import math
+import uuid
+import zlib
 
 url_split_bp = Blueprint('url_split', __name__)
+logger = logging.getLogger('url_splitter.routes')
+redirect_logger = logging.getLogger('url_splitter.redirect')
+
+def client_ip():
+    """IP do visitante (X-Forwarded-For só vale atrás de TRUSTED_PROXIES, via ProxyFix em create_app)"""
+    return request.remote_addr
+
+VISITOR_COOKIE = 'us_vid'
+
+def sticky_visitor_key(compiled):
+    """
+    Chave do visitante para o modo sticky. Retorna (chave, novo_cookie);
+    novo_cookie é preenchido quando o visitante ainda não tem o cookie.
+    """
+    if compiled.sticky_mode == 'cookie':
+        visitor_id = request.cookies.get(VISITOR_COOKIE)
+        if visitor_id:
+            return visitor_id, None
+        visitor_id = uuid.uuid4().hex
+        return visitor_id, visitor_id
+    if compiled.sticky_mode == 'param':
+        return request.args.get(compiled.sticky_param or 'vid'), None
+    if compiled.sticky_mode == 'ip_ua':
+        return f"{client_ip()}|{request.headers.get('User-Agent', '')}", None
+    return None, None
+
+def parse_sticky_options(data):
+    """Valida sticky_mode/sticky_param do payload; retorna (modo, param, erro)"""
+    mode = data.get('sticky_mode') or None
+    param = data.get('sticky_param') or None
+    if mode is not None and mode not in STICKY_MODES:
+        return None, None, f'sticky_mode inválido: {mode} (use {", ".join(STICKY_MODES)})'
+    if mode == 'param' and not param:
+        return None, None, 'sticky_param é obrigatório no modo param'
+    return mode, param, None
+
+def parse_rate_limits(data):
+    """Valida rate_limit/ip_rate_limit (req/s, vazio = padrão global); retorna (split, ip, erro)"""
+    limits = []
+    for field in ('rate_limit', 'ip_rate_limit'):
+        value = data.get(field)
+        if value in (None, '', 0):
+            limits.append(None)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+            limits.append(float(value))
+        else:
+            return None, None, f'{field} deve ser um número positivo (requisições por segundo)'
+    return limits[0], limits[1], None
+
+def parse_redirect_options(data):
+    """Valida redirect_status/cache_max_age do payload; retorna (status, max_age, erro)"""
+    status = data.get('redirect_status') or None
+    max_age = data.get('cache_max_age')
+    if max_age == '':
+        max_age = None
+    if status is not None and status not in REDIRECT_STATUSES:
+        return None, None, f'redirect_status inválido: {status} (use {", ".join(map(str, REDIRECT_STATUSES))})'
+    if max_age is not None and (not isinstance(max_age, int) or isinstance(max_age, bool) or max_age < 0):
+        return None, None, 'cache_max_age deve ser um inteiro não negativo (segundos)'
+    return status, max_age, None
+
+def parse_weight_schedule(data, destination_count):
+    """Valida weight_schedule (plano de pesos); retorna (JSON para a coluna ou None, erro)"""
+    schedule, error = normalize_schedule(data.get('weight_schedule'), destination_count)
+    if error:
+        return None, error
+    return (json.dumps(schedule) if schedule else None), None
+
+def parse_targeting_rules(data):
+    """Valida targeting_rules (regras de direcionamento); retorna (JSON para a coluna ou None, erro)"""
+    rules, error = normalize_rules(data.get('targeting_rules'))
+    if error:
+        return None, error
+    return (json.dumps(rules) if rules else None), None
+
+def parse_bandit_options(data):
+    """Valida bandit_mode/bandit_epsilon do payload; retorna (modo, epsilon, erro)"""
+    mode = data.get('bandit_mode') or None
+    epsilon = data.get('bandit_epsilon')
+    if epsilon == '':
+        epsilon = None
+    if mode is not None and mode not in BANDIT_MODES:
+        return None, None, f'bandit_mode inválido: {mode} (use {", ".join(BANDIT_MODES)})'
+    if epsilon is not None and (not isinstance(epsilon, (int, float)) or isinstance(epsilon, bool)
+                                or not 0 <= epsilon <= 1):
+        return None, None, 'bandit_epsilon deve ser um número entre 0 e 1'
+    if mode is not None and data.get('weight_schedule'):
+        return None, None, 'bandit_mode e weight_schedule não podem ser usados juntos'
+    return mode, epsilon, None
+
+def normalize_weights(weights):
+    """Pesos proporcionais somando 100 (uma casa decimal), como a edição sempre gravou"""
+    total = sum(weights)
+    if total == 100:
+        return list(weights)
+    return [round((w / total) * 100, 1) for w in weights]
+
+def split_etag(version):
+    """ETag de um split: a versão da linha"""
+    return f'v{version}'
+
+def parse_if_match(data=None):
+    """
+    Versão esperada pelo cliente: If-Match ("v3", de GET/PUT) ou o campo
+    `version` do payload. Retorna (versão ou None = sem condição, erro).
+    """
+    tags = request.if_match.as_set(include_weak=True)
+    if tags:
+        if len(tags) > 1:
+            return None, 'If-Match aceita uma única versão'
+        tag = next(iter(tags))
+        if not tag.startswith('v') or not tag[1:].isdigit():
+            return None, f'If-Match inválido: {tag}'
+        return int(tag[1:]), None
+    version = (data or {}).get('version')
+    if version is None:
+        return None, None
+    if not isinstance(version, int) or isinstance(version, bool):
+        return None, 'version deve ser um inteiro'
+    return version, None
+
+_update_splits = UrlSplit.__table__.update()
+_delete_destinations = SplitDestination.__table__.delete()
+_insert_destinations = SplitDestination.__table__.insert()
+
+def write_split(split_id, values, expected_version=None):
+    """
+    UPDATE de um split sem carregar a linha: condicionado à versão esperada
+    (se houver) e incrementando a versão. Não faz commit. Retorna True se a
+    linha foi alterada (False: split inexistente ou versão diferente).
+    """
+    condition = UrlSplit.id == split_id
+    if expected_version is not None:
+        condition = condition & (UrlSplit.version == expected_version)
+    values = dict(values, version=UrlSplit.version + 1)
+    return db.session.execute(_update_splits.where(condition).values(**values)).rowcount > 0
+
+def replace_destination_rows(split_destinations):
+    """Regrava split_destinations de {split_id: (destinos, pesos)} com um DELETE e um INSERT em lote"""
+    if not split_destinations:
+        return
+    db.session.execute(_delete_destinations.where(SplitDestination.url_split_id.in_(list(split_destinations))))
+    rows = []
+    for split_id, (destinations, weights) in split_destinations.items():
+        rows.extend(destination_rows(split_id, destinations, weights))
+    db.session.execute(_insert_destinations, rows)
+
+def precondition_failed(current_version):
+    response = jsonify({'error': 'Split alterado por outra requisição: recarregue e tente de novo',
+                        'version': current_version})
+    response.status_code = 412
+    response.set_etag(split_etag(current_version))
+    return response
 
 def safe_json_parse(data, field_name="campo"):
     """
-    Função para fazer parse seguro de JSON, tratando casos de JSON duplo
+    Função para fazer parse seguro de uma coluna JSON de lista (codificação única)
     """
     try:
         if data is None:
-            print(f"⚠️ {field_name} é None")
+            logger.debug('⚠️ %s é None', field_name)
             return []
         
         if isinstance(data, list):
-            print(f"✅ {field_name} já é lista: {data}")
+            logger.debug('✅ %s já é lista: %s', field_name, data)
             return data
         
         if isinstance(data, str):
-            print(f"🔍 {field_name} é string, fazendo parse: {data[:100]}...")
+            logger.debug('🔍 %s é string, fazendo parse: %.100s...', field_name, data)
             parsed = json.loads(data)
             
-            # Se o resultado ainda for string, fazer parse novamente (JSON duplo)
-            if isinstance(parsed, str):
-                print(f"🔄 {field_name} é JSON duplo, fazendo segundo parse")
-                parsed = json.loads(parsed)
-            
             if isinstance(parsed, list):
-                print(f"✅ {field_name} parseado com sucesso: {len(parsed)} itens")
+                logger.debug('✅ %s parseado com sucesso: %d itens', field_name, len(parsed))
                 return parsed
             else:
-                print(f"❌ {field_name} não é lista após parse: {type(parsed)}")
+                logger.debug('❌ %s não é lista após parse: %s', field_name, type(parsed))
                 return []
         
-        print(f"❌ {field_name} tipo não suportado: {type(data)}")
+        logger.debug('❌ %s tipo não suportado: %s', field_name, type(data))
         return []
         
     except json.JSONDecodeError as e:
-        print(f"❌ Erro JSON em {field_name}: {e}")
+        logger.warning('❌ Erro JSON em %s: %s', field_name, e)
         return []
     except Exception as e:
-        print(f"❌ Erro geral em {field_name}: {e}")
+        logger.warning('❌ Erro geral em %s: %s', field_name, e)
         return []
 
+# Campos que a listagem pode projetar (?fields=id,slug,name)
+LIST_FIELDS = {
+    'id': UrlSplit.id,
+    'slug': UrlSplit.slug,
+    'name': UrlSplit.name,
+    'destinations': UrlSplit.destinations,
+    'weights': UrlSplit.weights,
+    'sticky_mode': UrlSplit.sticky_mode,
+    'sticky_param': UrlSplit.sticky_param,
+    'rate_limit': UrlSplit.rate_limit,
+    'ip_rate_limit': UrlSplit.ip_rate_limit,
+    'redirect_status': UrlSplit.redirect_status,
+    'cache_max_age': UrlSplit.cache_max_age,
+    'weight_schedule': UrlSplit.weight_schedule,
+    'bandit_mode': UrlSplit.bandit_mode,
+    'bandit_epsilon': UrlSplit.bandit_epsilon,
+    'targeting_rules': UrlSplit.targeting_rules,
+    'version': UrlSplit.version,
+    'is_active': UrlSplit.is_active,
+    'created_at': UrlSplit.created_at,
+    'updated_at': UrlSplit.updated_at,
+}
+DEFAULT_LIST_FIELDS = ('id', 'slug', 'name', 'destinations', 'weights', 'sticky_mode', 'sticky_param', 'version')
+JSON_LIST_FIELDS = ('destinations', 'weights')
+
+def parse_list_args():
+    """Lê limit/cursor/fields/q da query string; retorna (opções, erro)"""
+    max_limit = current_app.config.get('SPLITS_MAX_PAGE_SIZE', 1000)
+    try:
+        limit = int(request.args.get('limit', current_app.config.get('SPLITS_PAGE_SIZE', 100)))
+        cursor = int(request.args.get('cursor', 0))
+    except ValueError:
+        return None, 'limit e cursor devem ser inteiros'
+    if limit < 1:
+        return None, 'limit deve ser positivo'
+    
+    fields = request.args.get('fields')
+    if fields:
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in LIST_FIELDS]
+        if unknown:
+            return None, f'Campos desconhecidos: {", ".join(unknown)}'
+        if 'id' not in fields:
+            fields.insert(0, 'id')  # necessário para o cursor
+    else:
+        fields = list(DEFAULT_LIST_FIELDS)
+    
+    return {
+        'limit': min(limit, max_limit),
+        'cursor': cursor,
+        'fields': fields,
+        'q': request.args.get('q', '').strip(),
+        'host': request.args.get('host', '').strip().lower(),
+    }, None
+
+def like_prefix(value):
+    """Padrão LIKE para busca por prefixo, escapando curingas"""
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'{escaped}%'
+
+def split_ids_with_host(host):
+    """Subconsulta: ids dos splits com algum destino no host (índice em split_destinations.host)"""
+    return db.session.query(SplitDestination.url_split_id).filter(SplitDestination.host == host)
+
+def query_split_page(options, columns):
+    """Página (keyset por id) da tabela de splits; retorna (linhas, próximo cursor)"""
+    query = db.session.query(*columns).filter(UrlSplit.id > options['cursor'])
+    if options['q']:
+        pattern = like_prefix(options['q'])
+        query = query.filter(or_(UrlSplit.slug.like(pattern, escape='\\'),
+                                 UrlSplit.name.like(pattern, escape='\\')))
+    if options['host']:
+        query = query.filter(UrlSplit.id.in_(split_ids_with_host(options['host'])))
+    rows = query.order_by(UrlSplit.id).limit(options['limit'] + 1).all()
+    
+    next_cursor = None
+    if len(rows) > options['limit']:
+        rows = rows[:options['limit']]
+        next_cursor = rows[-1].id
+    return rows, next_cursor
+
+def listing_etag(options):
+    """ETag da listagem: geração global dos splits + parâmetros da consulta"""
+    generation = split_cache.generation.read()
+    params = f"{options['limit']}|{options['cursor']}|{','.join(options['fields'])}|{options['q']}|{options['host']}"
+    return f'{generation:x}-{zlib.crc32(params.encode()):08x}'
+
+def serialize_value(field, value):
+    if field in JSON_LIST_FIELDS:
+        return decode_json_list(value)
+    if field in ('weight_schedule', 'targeting_rules'):
+        return json.loads(value) if value else None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
 @url_split_bp.route('/splits', methods=['GET'])
 def get_splits():
-    """Listar todos os splits"""
+    """Listar splits (paginação por cursor, projeção de campos e busca por prefixo)"""
     try:
-        splits = UrlSplit.query.all()
-        splits_data = []
-        
-        print(f"🔍 Encontrados {len(splits)} splits no banco")
-        
-        for split in splits:
-            # Parse seguro dos dados JSON
-            destinations = safe_json_parse(split.destinations, "destinations")
-            weights = safe_json_parse(split.weights, "weights")
-            
-            splits_data.append({
-                'id': split.id,
-                'slug': split.slug,
-                'name': split.name,
-                'destinations': destinations,
-                'weights': weights
-            })
-        
-        return jsonify(splits_data)
+        options, error = parse_list_args()
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Listagem inalterada desde a última consulta do cliente: 304 sem tocar no banco
+        etag = listing_etag(options)
+        if etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        
+        fields = options['fields']
+        rows, next_cursor = query_split_page(options, [LIST_FIELDS[f] for f in fields])
+        splits_data = [
+            {field: serialize_value(field, value) for field, value in zip(fields, row)}
+            for row in rows
+        ]
+        
+        response = jsonify(splits_data)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        if next_cursor is not None:
+            response.headers['X-Next-Cursor'] = str(next_cursor)
+            args = request.args.to_dict()
+            args['cursor'] = next_cursor
+            response.headers['Link'] = f'<{url_for(".get_splits", **args)}>; rel="next"'
+        return response
     except Exception as e:
-        print(f"❌ Erro ao buscar splits: {e}")
+        logger.exception('❌ Erro ao buscar splits: %s', e)
         return jsonify({'error': str(e)}), 500
 
 @url_split_bp.route('/splits', methods=['POST'])
@@ -88,10 +356,17 @@ def create_split():
         if not data.get('destinations') or len(data['destinations']) == 0:
             return jsonify({'error': 'Pelo menos um destino é obrigatório'}), 400
         
-        # Verificar se slug já existe
-        existing = UrlSplit.query.filter_by(slug=data['slug']).first()
-        if existing:
-            return jsonify({'error': 'Slug já existe'}), 400
+        sticky_mode, sticky_param, error = parse_sticky_options(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        rate_limit, ip_rate_limit, error = parse_rate_limits(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        redirect_status, cache_max_age, error = parse_redirect_options(data)
+        if error:
+            return jsonify({'error': error}), 400
         
         # Garantir que destinations é uma lista
         destinations = data['destinations']
@@ -103,47 +378,87 @@ def create_split():
         if not weights or len(weights) != len(destinations):
             weights = [round(100 / len(destinations), 1)] * len(destinations)
         
-        print(f"📝 Criando split:")
-        print(f"   Slug: {data['slug']}")
-        print(f"   Destinations: {destinations}")
-        print(f"   Weights: {weights}")
+        weight_schedule, error = parse_weight_schedule(data, len(destinations))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        bandit_mode, bandit_epsilon, error = parse_bandit_options(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        targeting_rules, error = parse_targeting_rules(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        logger.debug('📝 Criando split: slug=%s destinations=%s weights=%s',
+                     data['slug'], destinations, weights)
         
-        # Criar novo split (APENAS com parâmetros básicos)
+        # Criar novo split (o modelo codifica as listas uma única vez)
         new_split = UrlSplit(
             slug=data['slug'],
             name=data['name'],
-            destinations=json.dumps(destinations),  # Garantir que é JSON válido
-            weights=json.dumps(weights)  # Garantir que é JSON válido
+            destinations=destinations,
+            weights=weights
         )
-        
+        new_split.sticky_mode = sticky_mode
+        new_split.sticky_param = sticky_param
+        new_split.rate_limit = rate_limit
+        new_split.ip_rate_limit = ip_rate_limit
+        new_split.redirect_status = redirect_status
+        new_split.cache_max_age = cache_max_age
+        new_split.weight_schedule = weight_schedule
+        new_split.bandit_mode = bandit_mode
+        new_split.bandit_epsilon = bandit_epsilon
+        new_split.targeting_rules = targeting_rules
+        
+        # Slug repetido: a restrição UNIQUE decide (sem SELECT prévio, que corre entre workers)
         db.session.add(new_split)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'Slug já existe'}), 400
+        split_cache.invalidate(new_split.slug)
         
-        print(f"✅ Split criado: {data['slug']} (ID: {new_split.id})")
+        logger.info('✅ Split criado: %s (ID: %s)', new_split.slug, new_split.id)
         
-        return jsonify({
+        response = jsonify({
             'id': new_split.id,
             'slug': new_split.slug,
             'name': new_split.name,
+            'version': new_split.version,
             'message': 'Split criado com sucesso'
-        }), 201
+        })
+        response.status_code = 201
+        response.set_etag(split_etag(new_split.version))
+        return response
         
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Erro ao criar split: {e}")
+        logger.exception('❌ Erro ao criar split: %s', e)
         return jsonify({'error': str(e)}), 500
 
+@url_split_bp.route('/splits/<int:split_id>', methods=['GET'])
+def get_split(split_id):
+    """Um split, com ETag da versão (para o If-Match da edição)"""
+    split = UrlSplit.query.get(split_id)
+    if not split:
+        return jsonify({'error': 'Split não encontrado'}), 404
+    etag = split_etag(split.version)
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(split.to_dict())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @url_split_bp.route('/splits/<int:split_id>', methods=['PUT'])
 def update_split(split_id):
-    """Editar split existente"""
+    """Editar split existente (If-Match ou `version` no payload: só se ninguém editou antes)"""
     try:
         data = request.get_json()
         
-        # Buscar split
-        split = UrlSplit.query.get(split_id)
-        if not split:
-            return jsonify({'error': 'Split não encontrado'}), 404
-        
         # Validações
         if not data.get('name'):
             return jsonify({'error': 'Nome é obrigatório'}), 400
@@ -151,6 +466,22 @@ def update_split(split_id):
         if not data.get('destinations') or len(data['destinations']) == 0:
             return jsonify({'error': 'Pelo menos um destino é obrigatório'}), 400
         
+        expected_version, error = parse_if_match(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        sticky_mode, sticky_param, error = parse_sticky_options(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        rate_limit, ip_rate_limit, error = parse_rate_limits(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        redirect_status, cache_max_age, error = parse_redirect_options(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
         # Validar URLs
         for url in data['destinations']:
             if not url.startswith(('http://', 'https://')):
@@ -162,33 +493,75 @@ def update_split(split_id):
             # Se não tiver pesos ou quantidade diferente, distribuir igualmente
             weights = [round(100 / len(data['destinations']), 1)] * len(data['destinations'])
         
-        # Garantir que soma dos pesos seja 100%
-        total_weight = sum(weights)
-        if total_weight != 100:
-            # Ajustar proporcionalmente
-            weights = [round((w / total_weight) * 100, 1) for w in weights]
-        
-        # Atualizar split
-        split.name = data['name']
-        split.destinations = json.dumps(data['destinations'])
-        split.weights = json.dumps(weights)
-        
+        # Garantir que soma dos pesos seja 100% (ajuste proporcional)
+        weights = normalize_weights(weights)
+        
+        weight_schedule, error = parse_weight_schedule(data, len(data['destinations']))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        bandit_mode, bandit_epsilon, error = parse_bandit_options(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        targeting_rules, error = parse_targeting_rules(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Atualizar split: UPDATE condicional direto, sem carregar a linha inteira
+        updated = write_split(split_id, {
+            'name': data['name'],
+            'destinations': json.dumps(list(data['destinations'])),
+            'weights': json.dumps(weights),
+            'sticky_mode': sticky_mode,
+            'sticky_param': sticky_param,
+            'rate_limit': rate_limit,
+            'ip_rate_limit': ip_rate_limit,
+            'redirect_status': redirect_status,
+            'cache_max_age': cache_max_age,
+            'weight_schedule': weight_schedule,
+            'bandit_mode': bandit_mode,
+            'bandit_epsilon': bandit_epsilon,
+            'targeting_rules': targeting_rules,
+        }, expected_version)
+        current = db.session.query(UrlSplit.slug, UrlSplit.version).filter(UrlSplit.id == split_id).first()
+        if current is None:
+            db.session.rollback()
+            return jsonify({'error': 'Split não encontrado'}), 404
+        if not updated:
+            db.session.rollback()
+            return precondition_failed(current.version)
+        replace_destination_rows({split_id: (data['destinations'], weights)})
         db.session.commit()
+        split_cache.invalidate(current.slug)
         
-        print(f"✅ Split editado: {split.slug}")
+        logger.info('✅ Split editado: %s (versão %d)', current.slug, current.version)
         
-        return jsonify({
-            'id': split.id,
-            'slug': split.slug,
-            'name': split.name,
+        response = jsonify({
+            'id': split_id,
+            'slug': current.slug,
+            'name': data['name'],
             'destinations': data['destinations'],
             'weights': weights,
+            'sticky_mode': sticky_mode,
+            'sticky_param': sticky_param,
+            'rate_limit': rate_limit,
+            'ip_rate_limit': ip_rate_limit,
+            'redirect_status': redirect_status,
+            'cache_max_age': cache_max_age,
+            'weight_schedule': json.loads(weight_schedule) if weight_schedule else None,
+            'bandit_mode': bandit_mode,
+            'bandit_epsilon': bandit_epsilon,
+            'targeting_rules': json.loads(targeting_rules) if targeting_rules else None,
+            'version': current.version,
             'message': 'Split atualizado com sucesso'
         })
+        response.set_etag(split_etag(current.version))
+        return response
         
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Erro ao editar split: {e}")
+        logger.exception('❌ Erro ao editar split: %s', e)
         return jsonify({'error': str(e)}), 500
 
 @url_split_bp.route('/splits/<int:split_id>', methods=['DELETE'])
@@ -199,119 +572,243 @@ def delete_split(split_id):
         if not split:
             return jsonify({'error': 'Split não encontrado'}), 404
         
+        expected_version, error = parse_if_match()
+        if error:
+            return jsonify({'error': error}), 400
+        if expected_version is not None and expected_version != split.version:
+            return precondition_failed(split.version)
+        
         slug = split.slug
         db.session.delete(split)
         db.session.commit()
+        split_cache.invalidate(slug)
         
-        print(f"🗑️ Split deletado: {slug}")
+        logger.info('🗑️ Split deletado: %s', slug)
         
         return jsonify({'message': 'Split deletado com sucesso'})
         
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Erro ao deletar split: {e}")
+        logger.exception('❌ Erro ao deletar split: %s', e)
         return jsonify({'error': str(e)}), 500
 
 @url_split_bp.route('/r/<slug>')
 def redirect_split(slug):
-    """Redirecionamento do split - VERSÃO CORRIGIDA PARA JSON"""
+    """Redirecionamento do split - servido a partir do cache compilado"""
     try:
-        print(f"🔍 Buscando split com slug: '{slug}'")
-        
-        # Buscar split no banco de dados
-        split = UrlSplit.query.filter_by(slug=slug).first()
-        
-        if not split:
-            print(f"❌ Split '{slug}' não encontrado no banco")
-            # Listar todos os splits para debug
-            all_splits = UrlSplit.query.all()
-            print(f"📋 Splits disponíveis: {[s.slug for s in all_splits]}")
+        found, compiled = split_cache.get(slug)
+        
+        if not found:
+            redirect_logger.info("❌ Split '%s' não encontrado no banco", slug)
+            # Listar splits para debug: só com SPLIT_DEBUG_SLUGS (um 404 não pode custar um full scan)
+            if current_app.config.get('SPLIT_DEBUG_SLUGS'):
+                sample = UrlSplit.query.with_entities(UrlSplit.slug).limit(50).all()
+                logger.debug('📋 Splits disponíveis (até 50): %s', [s.slug for s in sample])
             return jsonify({'error': 'Split not found'}), 404
         
-        print(f"✅ Split encontrado: {split.slug} (ID: {split.id})")
-        print(f"📊 Dados brutos do banco:")
-        print(f"   destinations: {split.destinations}")
-        print(f"   weights: {split.weights}")
-        
-        # Parse seguro dos dados JSON
-        destinations = safe_json_parse(split.destinations, "destinations")
-        weights = safe_json_parse(split.weights, "weights")
-        
-        print(f"📍 Destinos parseados: {destinations}")
-        print(f"⚖️ Pesos parseados: {weights}")
-        
-        if not destinations or len(destinations) == 0:
-            print("❌ Nenhum destino válido encontrado")
-            return jsonify({'error': 'Nenhum destino configurado'}), 404
-        
-        # Validar que destinations é realmente uma lista de URLs
-        valid_destinations = []
-        for dest in destinations:
-            if isinstance(dest, str) and (dest.startswith('http://') or dest.startswith('https://')):
-                valid_destinations.append(dest)
-            else:
-                print(f"⚠️ Destino inválido ignorado: {dest}")
-        
-        if not valid_destinations:
-            print("❌ Nenhum destino válido após validação")
+        if compiled is None:
+            redirect_logger.warning("❌ Nenhum destino válido no split '%s'", slug)
             return jsonify({'error': 'Nenhum destino válido'}), 404
         
-        print(f"✅ Destinos válidos: {valid_destinations}")
-        
-        # Escolher destino baseado nos pesos
-        try:
-            if (len(weights) == len(valid_destinations) and 
-                all(isinstance(w, (int, float)) and w > 0 for w in weights)):
-                chosen_url = random.choices(valid_destinations, weights=weights)[0]
-                print(f"🎯 URL escolhida com peso: {chosen_url}")
+        policy = cache_control(compiled, current_app.config.get('REDIRECT_CACHE_MAX_AGE', 60))
+        if request.method == 'HEAD':
+            # Sondagem (unfurlers, monitores): um destino válido, sem registrar clique
+            metrics.inc('redirect_probes_total', slug=slug)
+            response = current_app.response_class(status=compiled.redirect_status)
+            response.headers['Cache-Control'] = policy
+            response.headers['Location'] = probe_destination(compiled, destination_health.current())
+            return response
+        
+        ip = client_ip()
+        user_agent = request.headers.get('User-Agent')
+        limited = traffic_filter.check(compiled, ip)
+        if limited:
+            scope, retry_after = limited
+            metrics.inc('redirects_limited_total', scope=scope)
+            response = jsonify({'error': 'Muitas requisições'})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(math.ceil(retry_after))
+            return response
+        is_bot = traffic_filter.is_bot(user_agent)
+        
+        new_visitor_id = None
+        visitor_key = None
+        unhealthy = destination_health.current()
+        # Regras de direcionamento antes dos pesos: a primeira que casa decide
+        targeted_url = targeting.route(compiled.rules, ip, request.headers) if compiled.rules else None
+        if targeted_url in unhealthy:
+            targeted_url = None
+        if targeted_url:
+            chosen_url = targeted_url
+            metrics.inc('targeted_redirects_total', slug=slug)
+        else:
+            if compiled.sticky_mode and compiled.destination_count > 1:
+                visitor_key, new_visitor_id = sticky_visitor_key(compiled)
+                chosen_url = compiled.pick_sticky(visitor_key)
             else:
-                chosen_url = random.choice(valid_destinations)
-                print(f"🎯 URL escolhida aleatoriamente: {chosen_url}")
-        except Exception as e:
-            print(f"❌ Erro ao escolher URL: {e}")
-            chosen_url = valid_destinations[0]  # Fallback para primeira URL
-            print(f"🔄 Fallback para primeira URL: {chosen_url}")
-        
-        print(f"🔗 Redirecionando {slug} -> {chosen_url}")
+                chosen_url = compiled.pick()
+            if chosen_url in unhealthy:
+                # Destino fora do ar: sorteio entre os saudáveis (todos fora do ar: mantém o sorteio)
+                healthy_url = failover(compiled, unhealthy, visitor_key)
+                if healthy_url:
+                    chosen_url = healthy_url
+                    metrics.inc('failover_redirects_total', slug=slug)
+        redirect_logger.debug('🔗 Redirecionando %s -> %s (bot=%s)', slug, chosen_url, is_bot)
+        metrics.inc('redirects_total', slug=slug, destination=chosen_url)
+        if is_bot:
+            metrics.inc('bot_redirects_total', slug=slug)
+        
+        # Registrar clique de forma assíncrona (gravação em lote em segundo plano)
+        record_click = not traffic_filter.skip_click(is_bot)
+        if record_click:
+            click_writer.record(compiled.id, chosen_url, ip, user_agent)
+        
+        location = chosen_url
+        if isinstance(compiled, BanditSplit) and not targeted_url:
+            # Tentativa do braço + click id para a postback de conversão
+            click_id = bandit.track(compiled.arms, chosen_url, count_trial=record_click)
+            location = with_click_id(chosen_url, bandit.param, click_id)
         
         # Fazer redirecionamento
-        return redirect(chosen_url, code=302)
+        response = redirect(location, code=compiled.redirect_status)
+        response.headers['Cache-Control'] = policy
+        if new_visitor_id:
+            response.set_cookie(VISITOR_COOKIE, new_visitor_id, max_age=365 * 24 * 3600,
+                                httponly=True, samesite='Lax')
+        return response
         
     except Exception as e:
-        print(f"❌ Erro crítico no redirecionamento: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('❌ Erro crítico no redirecionamento: %s', e)
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@url_split_bp.route('/destinations/health', methods=['GET'])
+def get_destinations_health():
+    """Destinos fora do ar segundo o verificador de saúde (src/health_checker.py)"""
+    report = destination_health.report()
+    if report is None:
+        return jsonify({'error': 'Verificador de saúde sem estado publicado'}), 404
+    # Estado velho (verificador parado) é ignorado no redirecionamento
+    report['stale'] = destination_health.is_stale(report)
+    return jsonify(report)
+
+@url_split_bp.route('/conversions', methods=['GET', 'POST'])
+def record_conversion():
+    """Postback de conversão de um split em modo bandit (click_id na query, form ou JSON)"""
+    data = request.get_json(silent=True) or {}
+    click_id = data.get('click_id') or request.values.get('click_id') or request.values.get(bandit.param)
+    if not click_id:
+        return jsonify({'error': 'click_id é obrigatório'}), 400
+    status = bandit.record_conversion(click_id)
+    metrics.inc('conversions_total', status=status)
+    if status == 'invalid':
+        return jsonify({'error': 'click_id inválido'}), 400
+    if status == 'expired':
+        return jsonify({'error': 'click_id fora da janela de conversão'}), 410
+    if status == 'dropped':
+        # Fila de conversões cheia (banco indisponível): o remetente da postback tenta de novo
+        response = jsonify({'error': 'Conversões pendentes demais, tente novamente'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(math.ceil(bandit.sync_interval))
+        return response
+    # Repetições são descartadas aqui ('duplicate') ou na sincronização (chave primária em bandit_conversions)
+    return jsonify({'status': status}), 202
+
+@url_split_bp.route('/splits/<int:split_id>/bandit', methods=['GET'])
+def get_split_bandit(split_id):
+    """Tentativas, conversões e pesos do bandit de um split"""
+    split = UrlSplit.query.get(split_id)
+    if not split:
+        return jsonify({'error': 'Split não encontrado'}), 404
+    arms = {arm.arm: arm for arm in BanditArm.query.filter_by(url_split_id=split_id)}
+    found, compiled = split_cache.get(split.slug)
+    weights = {}
+    if isinstance(compiled, BanditSplit):
+        weights = dict(zip(compiled.arms.urls, compiled.arms.weights))  # última sincronização deste worker
+    destinations = []
+    for url in dict.fromkeys(split.get_destinations()):
+        row = arms.pop(arm_hash(url), None)
+        destinations.append({
+            'destination_url': url,
+            'trials': row.trials if row else 0,
+            'successes': row.successes if row else 0,
+            'conversion_rate': row.successes / row.trials if row and row.trials else None,
+            'weight': weights.get(url),
+        })
+    return jsonify({
+        'split_id': split_id,
+        'bandit_mode': split.bandit_mode,
+        'bandit_epsilon': split.bandit_epsilon,
+        'destinations': destinations,
+        'removed_destinations': [arm.to_dict() for arm in arms.values()],
+    })
+
+def parse_time_arg(name):
+    """Lê um instante da query string (epoch em segundos ou ISO 8601 em UTC)"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
 @url_split_bp.route('/splits/<int:split_id>/stats', methods=['GET'])
 def get_split_stats(split_id):
-    """Obter estatísticas do split"""
+    """Obter estatísticas do split (cliques por destino por minuto/hora/dia)"""
     try:
-        split = UrlSplit.query.get(split_id)
+        split = (UrlSplit.query
+                 .with_entities(UrlSplit.id, UrlSplit.slug, UrlSplit.name, UrlSplit.destinations,
+                                UrlSplit.weights, UrlSplit.total_clicks)
+                 .filter_by(id=split_id)
+                 .first())
         if not split:
             return jsonify({'error': 'Split não encontrado'}), 404
         
-        destinations = safe_json_parse(split.destinations, "destinations")
-        weights = safe_json_parse(split.weights, "weights")
+        granularity = request.args.get('granularity', 'hour')
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f'granularity inválida: {granularity} (use {", ".join(GRANULARITIES)})'}), 400
+        try:
+            since = parse_time_arg('since')
+            until = parse_time_arg('until')
+        except ValueError:
+            return jsonify({'error': 'since/until devem ser epoch ou data ISO 8601'}), 400
+        
+        buckets, totals, used_granularity = query_stats(
+            db.session, split.id, granularity, since, until,
+            minute_retention=current_app.config.get('STATS_MINUTE_RETENTION', 48 * 3600),
+            hour_retention=current_app.config.get('STATS_HOUR_RETENTION', 90 * 86400))
         
         return jsonify({
             'id': split.id,
             'slug': split.slug,
             'name': split.name,
-            'destinations': destinations,
-            'weights': weights
+            'destinations': decode_json_list(split.destinations),
+            'weights': decode_json_list(split.weights),
+            'total_clicks': split.total_clicks or 0,
+            # Pode ser mais grossa que a pedida: minutos/horas antigos já foram compactados
+            'granularity': used_granularity,
+            'requested_granularity': granularity,
+            'totals': totals,
+            'buckets': buckets
         })
         
     except Exception as e:
-        print(f"❌ Erro ao buscar estatísticas: {e}")
+        logger.exception('❌ Erro ao buscar estatísticas: %s', e)
         return jsonify({'error': str(e)}), 500
 
 # Endpoint de debug para verificar splits
 @url_split_bp.route('/debug/splits', methods=['GET'])
 def debug_splits():
-    """Endpoint de debug para verificar splits no banco"""
+    """Endpoint de debug para verificar splits no banco (paginado como /splits)"""
     try:
-        splits = UrlSplit.query.all()
+        options, error = parse_list_args()
+        if error:
+            return jsonify({'error': error}), 400
+        
+        splits, next_cursor = query_split_page(
+            options, [UrlSplit.id, UrlSplit.slug, UrlSplit.name, UrlSplit.destinations, UrlSplit.weights])
         debug_data = []
         
         for split in splits:
@@ -336,10 +833,10 @@ def debug_splits():
             })
         
         return jsonify({
-            'total_splits': len(splits),
+            'total_splits': db.session.query(db.func.count(UrlSplit.id)).scalar(),
+            'next_cursor': next_cursor,
             'splits': debug_data
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-
@@ -0,0 +1,300 @@
+"""
+Backup online do SQLite em segundo plano (API de backup do sqlite3)
+
+A cópia é feita em passos de N páginas por uma thread, então redirecionamentos
+e escritas continuam durante o backup. Cada backup é um job com id e
+progresso consultável; a retenção é por quantidade e por idade.
+
+As partições mensais de cliques (CLICK_PARTITION_DIR) dos últimos
+BACKUP_CLICK_MONTHS meses vão junto, em backup_<...>.clicks/ ao lado do banco;
+a retenção trata o banco e as partições de um backup como um grupo.
+
+O estado dos jobs fica em BACKUP_DIR/jobs/<id>.json e um lock de arquivo
+(BACKUP_DIR/.lock) garante um backup por vez entre todos os workers: qualquer
+worker responde pelo progresso de um job iniciado em outro.
+"""
+import fcntl
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from src.services.click_archive import add_months, month_of
+
+logger = logging.getLogger('url_splitter.backup')
+
+JOB_ID_RE = re.compile(r'^[0-9a-f]{12}$')
+# Histórico de jobs mantido em BACKUP_DIR/jobs
+JOB_HISTORY = 20
+# Intervalo mínimo entre gravações do progresso no arquivo do job
+PROGRESS_SAVE_INTERVAL = 0.5
+
+
+class _BackupRestarted(Exception):
+    """O banco foi alterado durante a cópia incremental vezes demais"""
+
+
+class BackupManager:
+    """Executa e acompanha jobs de backup (um de cada vez entre processos)"""
+
+    def __init__(self, db_path=None, backup_dir=None, keep=5, max_age_days=None,
+                 pages_per_step=1024, step_sleep=0.005, compress=False, max_restarts=3,
+                 partition_dir=None, click_months=2):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.partition_dir = partition_dir
+        self.click_months = click_months
+        self.keep = keep
+        self.max_age_days = max_age_days
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.compress = compress
+        self.max_restarts = max_restarts
+
+    def init_app(self, app):
+        self.db_path = app.config.get('DATABASE_PATH', self.db_path)
+        self.backup_dir = app.config.get('BACKUP_DIR', self.backup_dir)
+        self.keep = app.config.get('BACKUP_KEEP', self.keep)
+        self.max_age_days = app.config.get('BACKUP_MAX_AGE_DAYS', self.max_age_days)
+        self.pages_per_step = app.config.get('BACKUP_PAGES_PER_STEP', self.pages_per_step)
+        self.compress = app.config.get('BACKUP_COMPRESS', self.compress)
+        self.partition_dir = app.config.get('CLICK_PARTITION_DIR', self.partition_dir) or None
+        self.click_months = app.config.get('BACKUP_CLICK_MONTHS', self.click_months)
+
+    @property
+    def jobs_dir(self):
+        return os.path.join(self.backup_dir, 'jobs')
+
+    def start(self, compress=None):
+        """Agenda um backup em segundo plano; retorna o job (ou o que já está rodando em algum worker)"""
+        lock_file = self._acquire(blocking=False)
+        if lock_file is None:
+            return self._running_job()
+        try:
+            job = self._new_job(self.compress if compress is None else compress)
+            threading.Thread(target=self._run, args=(job, lock_file), name='db-backup', daemon=True).start()
+        except BaseException:
+            self._release(lock_file)
+            raise
+        return dict(job)
+
+    def backup_now(self, compress=None):
+        """Backup síncrono (usado na inicialização); espera o backup de outro processo terminar"""
+        lock_file = self._acquire(blocking=True)
+        job = self._new_job(self.compress if compress is None else compress)
+        self._run(job, lock_file)
+        return self.get(job['id'])
+
+    def get(self, job_id):
+        if not JOB_ID_RE.match(job_id):
+            return None
+        try:
+            with open(os.path.join(self.jobs_dir, f'{job_id}.json')) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job['status'] in ('queued', 'running') and not self._is_locked():
+            # O processo que fazia o backup morreu sem concluir (o lock cai junto com ele)
+            job.update(status='error', error='Backup interrompido')
+        return job
+
+    def _acquire(self, blocking):
+        """Lock de arquivo entre processos; retorna o arquivo aberto ou None se outro processo já o detém"""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        lock_file = open(os.path.join(self.backup_dir, '.lock'), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    @staticmethod
+    def _release(lock_file):
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+    def _is_locked(self):
+        lock_file = self._acquire(blocking=False)
+        if lock_file is None:
+            return True
+        self._release(lock_file)
+        return False
+
+    def _running_job(self):
+        """Job de quem detém o lock; o ponteiro pode ainda não ter sido gravado por ele"""
+        deadline = time.monotonic() + 2.0
+        while True:
+            try:
+                with open(os.path.join(self.jobs_dir, 'running')) as f:
+                    job = self.get(f.read().strip())
+            except OSError:
+                job = None
+            if job and job['status'] in ('queued', 'running') or time.monotonic() > deadline:
+                if job is None:
+                    raise RuntimeError('Backup em andamento em outro processo')
+                return job
+            time.sleep(0.05)
+
+    def _save(self, job):
+        """Grava o estado do job (atômico: os outros workers nunca leem um JSON pela metade)"""
+        path = os.path.join(self.jobs_dir, f"{job['id']}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(job, f)
+        os.replace(path + '.tmp', path)
+
+    def _new_job(self, compress):
+        """Cria o job já com o lock em mãos e aponta `jobs/running` para ele"""
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'status': 'queued',
+            'progress': 0.0,
+            'pages_total': None,
+            'pages_remaining': None,
+            'compress': bool(compress),
+            'path': None,
+            'click_partitions': [],
+            'size_bytes': None,
+            'error': None,
+            'created_at': datetime.utcnow().isoformat(),
+            'finished_at': None,
+        }
+        self._save(job)
+        pointer = os.path.join(self.jobs_dir, 'running')
+        with open(pointer + '.tmp', 'w') as f:
+            f.write(job['id'])
+        os.replace(pointer + '.tmp', pointer)
+
+        # Manter só o histórico recente de jobs
+        history = sorted((os.path.join(self.jobs_dir, f) for f in os.listdir(self.jobs_dir) if f.endswith('.json')),
+                         key=os.path.getmtime)
+        for old_path in history[:-JOB_HISTORY]:
+            os.remove(old_path)
+        return job
+
+    def _run(self, job, lock_file):
+        job['status'] = 'running'
+        try:
+            self._save(job)
+            if not self.db_path or not os.path.exists(self.db_path):
+                raise FileNotFoundError(f'Banco não encontrado: {self.db_path}')
+
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            stem = os.path.join(self.backup_dir, f"backup_{timestamp}_{job['id']}")
+            # Partições primeiro: o banco principal é gravado por último e marca o backup como completo
+            partitions = self._copy_partitions(job, stem + '.clicks')
+            path = self._store(job, self.db_path, stem + '.db')
+
+            size = os.path.getsize(path) + sum(os.path.getsize(p) for p in partitions)
+            job.update(status='done', progress=1.0, path=path, click_partitions=partitions, size_bytes=size)
+            logger.info('✅ Backup criado: %s', path)
+            self.apply_retention()
+        except Exception as e:
+            job.update(status='error', error=str(e))
+            logger.warning('⚠️ Erro no backup: %s', e)
+        finally:
+            job['finished_at'] = datetime.utcnow().isoformat()
+            try:
+                self._save(job)
+            finally:
+                self._release(lock_file)
+
+    def _store(self, job, source_path, path, track_progress=True):
+        """Copia `source_path` para `path` (via .tmp, comprimindo se pedido); retorna o caminho final"""
+        tmp_path = path + '.tmp'
+        self._copy(job, source_path, tmp_path, track_progress)
+        if job['compress']:
+            with open(tmp_path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.remove(tmp_path)
+            tmp_path, path = path + '.gz.tmp', path + '.gz'
+        os.replace(tmp_path, path)
+        return path
+
+    def _copy_partitions(self, job, directory):
+        """Copia as partições de cliques dos últimos `click_months` meses que existirem"""
+        if not self.partition_dir or self.click_months <= 0:
+            return []
+        current = month_of(datetime.utcnow())
+        names = [f'clicks_{year:04d}_{number:02d}.db'
+                 for year, number in (add_months(current, -i) for i in range(self.click_months))]
+        sources = [(name, os.path.join(self.partition_dir, name)) for name in names]
+        sources = [(name, source) for name, source in sources if os.path.exists(source)]
+        if not sources:
+            return []
+        tmp_dir = directory + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        stored = [self._store(job, source, os.path.join(tmp_dir, name), track_progress=False)
+                  for name, source in sources]
+        os.replace(tmp_dir, directory)
+        return [os.path.join(directory, os.path.basename(path)) for path in stored]
+
+    def _copy(self, job, source_path, dest_path, track_progress=True):
+        """
+        Cópia incremental. Se o banco mudar no meio (a cópia recomeça) mais de
+        max_restarts vezes, faz uma cópia única: em WAL isso é só uma transação
+        de leitura e não bloqueia os escritores.
+        """
+        state = {'restarts': 0, 'last_remaining': None, 'saved_at': 0.0}
+
+        def progress(status, remaining, total):
+            if state['last_remaining'] is not None and remaining > state['last_remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > self.max_restarts:
+                    raise _BackupRestarted()
+            state['last_remaining'] = remaining
+            if not track_progress:
+                return
+            job.update(pages_total=total, pages_remaining=remaining,
+                       progress=round((total - remaining) / total, 4) if total else 1.0)
+            if time.monotonic() - state['saved_at'] >= PROGRESS_SAVE_INTERVAL:
+                state['saved_at'] = time.monotonic()
+                self._save(job)
+
+        source = sqlite3.connect(source_path, timeout=30)
+        try:
+            for pages in (self.pages_per_step, -1):
+                if os.path.exists(dest_path):
+                    os.remove(dest_path)
+                dest = sqlite3.connect(dest_path)
+                try:
+                    source.backup(dest, pages=pages, progress=progress, sleep=self.step_sleep)
+                    return
+                except _BackupRestarted:
+                    logger.info('🔄 Banco alterado durante o backup, fazendo cópia única')
+                finally:
+                    dest.close()
+        finally:
+            source.close()
+
+    def apply_retention(self):
+        """Remove backups além de `keep` e mais antigos que `max_age_days` (banco e partições juntos)"""
+        groups = {}
+        for name in os.listdir(self.backup_dir):
+            if name.startswith('backup_') and not name.endswith('.tmp'):
+                groups.setdefault(name.split('.')[0], []).append(name)
+        backups = sorted(groups)
+        expired = backups[:-self.keep] if self.keep and len(backups) > self.keep else []
+        if self.max_age_days:
+            limit = time.time() - timedelta(days=self.max_age_days).total_seconds()
+            expired += [stem for stem in backups[-self.keep:] if stem not in expired
+                        and max(os.path.getmtime(os.path.join(self.backup_dir, name)) for name in groups[stem]) < limit]
+        for stem in expired:
+            for name in groups[stem]:
+                path = os.path.join(self.backup_dir, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            logger.info('🗑️ Backup antigo removido: %s', stem)
+
+
+backup_manager = BackupManager()
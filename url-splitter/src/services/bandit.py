@@ -0,0 +1,356 @@
+"""
+Modo bandit: splits que ajustam os próprios pesos pelas conversões
+
+Cada destino de um split em modo bandit é um braço com tentativas (cliques
+redirecionados) e sucessos (conversões). O redirecionamento só incrementa
+um contador em memória e acrescenta ao destino um click id assinado
+(BANDIT_CLICK_PARAM), que carrega split, braço e instante; a postback de
+conversão devolve esse id e não precisa de consulta para ser validada.
+
+Uma thread por processo sincroniza a cada BANDIT_SYNC_INTERVAL segundos:
+soma os contadores locais em bandit_arms (UPSERT), grava as conversões em
+bandit_conversions (a chave primária descarta postbacks repetidas, de
+qualquer worker), relê os totais e recalcula os pesos só dos splits cujos
+totais mudaram. O split compilado troca a tabela de alias quando a versão
+dos pesos muda, então o sorteio continua O(1).
+
+- 'thompson': peso de cada braço = probabilidade de ser o melhor sob
+  posteriors Beta(1 + sucessos, 1 + fracassos), estimada por Monte Carlo
+  (probability matching, a alocação esperada do Thompson sampling);
+- 'epsilon_greedy': BANDIT_EPSILON (ou bandit_epsilon do split) dividido
+  igualmente e o resto para a melhor taxa; uniforme enquanto houver braço
+  sem tentativa.
+
+Até a primeira sincronização o split serve pesos uniformes.
+
+As conversões pendentes ficam num dicionário por click id (uma postback
+repetida antes da sincronização não ocupa outra entrada) limitado a
+BANDIT_MAX_PENDING_CONVERSIONS: com o banco fora do ar, o excesso é recusado
+e contado em dropped_conversions, como os cliques descartados do click writer.
+"""
+import atexit
+import hashlib
+import hmac
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+
+from sqlalchemy import select, text
+
+from src.models.user import db
+from src.models.url_split import BanditArm
+
+BANDIT_MODES = ('thompson', 'epsilon_greedy')
+CLICK_ID_MAX_LENGTH = 80
+
+logger = logging.getLogger('url_splitter.bandit')
+
+_upsert_arms = text('''
+    INSERT INTO bandit_arms (url_split_id, arm, destination_url, trials, successes)
+    VALUES (:split_id, :arm, :url, :trials, :successes)
+    ON CONFLICT (url_split_id, arm) DO UPDATE SET
+        trials = trials + excluded.trials,
+        successes = successes + excluded.successes,
+        destination_url = COALESCE(excluded.destination_url, destination_url)
+''')
+
+_insert_conversion = text('''
+    INSERT INTO bandit_conversions (click_id, url_split_id, arm, converted_at)
+    VALUES (:click_id, :split_id, :arm, :converted_at)
+    ON CONFLICT (click_id) DO NOTHING
+''')
+
+_purge_conversions = text('DELETE FROM bandit_conversions WHERE converted_at < :cutoff')
+
+
+def arm_hash(url):
+    """Identificador do braço: crc32 da URL (estável entre edições e workers)"""
+    return zlib.crc32(url.encode('utf-8'))
+
+
+def with_click_id(url, param, click_id):
+    """Acrescenta o click id à query string do destino (antes do fragmento)"""
+    base, hash_sign, fragment = url.partition('#')
+    separator = '&' if '?' in base else '?'
+    return f'{base}{separator}{param}={click_id}{hash_sign}{fragment}'
+
+
+def compute_weights(mode, trials, successes, epsilon=0.1, draws=500, rng=random):
+    """Pesos de serviço de cada braço a partir dos totais"""
+    n = len(trials)
+    if mode == 'epsilon_greedy':
+        if not all(trials):
+            return [1.0 / n] * n
+        rates = [s / t for s, t in zip(successes, trials)]
+        best = max(range(n), key=rates.__getitem__)
+        return [epsilon / n + (1.0 - epsilon if i == best else 0.0) for i in range(n)]
+
+    betavariate = rng.betavariate
+    params = [(1.0 + s, 1.0 + max(t - s, 0)) for s, t in zip(successes, trials)]
+    wins = [0] * n
+    for _ in range(draws):
+        best, best_value = 0, -1.0
+        for i, (alpha, beta) in enumerate(params):
+            value = betavariate(alpha, beta)
+            if value > best_value:
+                best, best_value = i, value
+        wins[best] += 1
+    # Suavização de Laplace: nenhum braço fica sem tráfego entre duas sincronizações
+    return [(w + 1.0) / (draws + n) for w in wins]
+
+
+class SplitArms:
+    """Braços (URLs distintas) de um split, com totais, contadores locais e pesos atuais"""
+
+    __slots__ = ('split_id', 'mode', 'epsilon', 'urls', 'hashes', 'positions', 'trials', 'successes',
+                 'pending_trials', 'weights', 'version')
+
+    def __init__(self, split_id, urls, mode, epsilon):
+        self.split_id = split_id
+        self.mode = mode
+        self.epsilon = epsilon
+        self.urls = urls
+        self.hashes = tuple(arm_hash(url) for url in urls)
+        self.positions = {url: i for i, url in enumerate(urls)}
+        self.trials = [0] * len(urls)
+        self.successes = [0] * len(urls)
+        self.pending_trials = [0] * len(urls)
+        self.weights = tuple(1.0 / len(urls) for _ in urls)
+        self.version = 0
+
+
+class Bandit:
+    """Contadores em memória, click ids e sincronização periódica com o banco"""
+
+    def __init__(self, sync_interval=10.0, epsilon=0.1, conversion_window=7 * 86400, draws=500,
+                 max_pending=10000):
+        self.sync_interval = sync_interval
+        self.epsilon = epsilon
+        self.conversion_window = conversion_window
+        self.draws = draws
+        self.max_pending = max_pending
+        self.param = 'click_id'
+        self._key = b''
+        self._get_engine = None
+        self._arms = {}
+        self._conversions = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.counters = Counter()
+
+    def init_app(self, app):
+        self.configure(
+            lambda: db.get_engine(app),
+            secret=app.config.get('BANDIT_SECRET') or app.config.get('SECRET_KEY') or '',
+            param=app.config.get('BANDIT_CLICK_PARAM', self.param),
+            sync_interval=app.config.get('BANDIT_SYNC_INTERVAL', self.sync_interval),
+            epsilon=app.config.get('BANDIT_EPSILON', self.epsilon),
+            conversion_window=app.config.get('BANDIT_CONVERSION_WINDOW', self.conversion_window),
+            draws=app.config.get('BANDIT_THOMPSON_DRAWS', self.draws),
+            max_pending=app.config.get('BANDIT_MAX_PENDING_CONVERSIONS', self.max_pending),
+        )
+
+    def configure(self, get_engine, secret='', param='click_id', sync_interval=10.0, epsilon=0.1,
+                  conversion_window=7 * 86400, draws=500, max_pending=10000):
+        if not 0.0 <= epsilon <= 1.0:
+            raise ValueError(f'BANDIT_EPSILON inválido: {epsilon}')
+        self._get_engine = get_engine
+        self._key = hashlib.sha256(secret.encode('utf-8')).digest()
+        self.param = param
+        self.sync_interval = sync_interval
+        self.epsilon = epsilon
+        self.conversion_window = conversion_window
+        self.draws = draws
+        self.max_pending = max_pending
+
+    def arms_for(self, split_id, destinations, mode, epsilon=None):
+        """
+        Braços do split (reaproveitados enquanto destinos e modo forem os
+        mesmos); ao mudar, os totais e contadores das URLs mantidas passam
+        para os braços novos
+        """
+        urls = tuple(dict.fromkeys(destinations))
+        epsilon = self.epsilon if epsilon is None else epsilon
+        with self._lock:
+            arms = self._arms.get(split_id)
+            if arms is not None and arms.urls == urls and arms.mode == mode and arms.epsilon == epsilon:
+                return arms
+            fresh = SplitArms(split_id, urls, mode, epsilon)
+            if arms is not None:
+                for i, url in enumerate(urls):
+                    old = arms.positions.get(url)
+                    if old is not None:
+                        fresh.trials[i] = arms.trials[old]
+                        fresh.successes[i] = arms.successes[old]
+                        fresh.pending_trials[i] = arms.pending_trials[old]
+                if any(fresh.trials):
+                    fresh.weights = tuple(compute_weights(mode, fresh.trials, fresh.successes, epsilon,
+                                                          self.draws))
+            self._arms[split_id] = fresh
+            return fresh
+
+    def _sign(self, payload):
+        return hashlib.blake2b(payload.encode('ascii'), key=self._key, digest_size=8).hexdigest()
+
+    def track(self, arms, url, count_trial=True, now=None):
+        """Conta a tentativa do destino sorteado e retorna o click id do redirecionamento"""
+        index = arms.positions[url]
+        if count_trial:
+            self._ensure_started()
+            with self._lock:
+                arms.pending_trials[index] += 1
+        payload = (f'{arms.split_id:x}.{arms.hashes[index]:x}.'
+                   f'{int(now if now is not None else time.time()):x}.{random.getrandbits(32):x}')
+        return f'{payload}.{self._sign(payload)}'
+
+    def record_conversion(self, click_id, now=None):
+        """
+        Valida a assinatura e a janela do click id e enfileira a conversão.
+        Retorna 'accepted', 'duplicate' (já pendente neste processo),
+        'dropped' (fila cheia), 'invalid' ou 'expired'; repetições entre
+        sincronizações ou workers são descartadas pela chave primária.
+        """
+        if not isinstance(click_id, str) or len(click_id) > CLICK_ID_MAX_LENGTH:
+            return 'invalid'
+        payload, _, signature = click_id.rpartition('.')
+        if not hmac.compare_digest(self._sign(payload), signature):
+            return 'invalid'
+        try:
+            split_id, arm, issued_at, _ = (int(part, 16) for part in payload.split('.'))
+        except ValueError:
+            return 'invalid'
+        now = now if now is not None else time.time()
+        if now - issued_at > self.conversion_window:
+            return 'expired'
+        self._ensure_started()
+        with self._lock:
+            if click_id in self._conversions:
+                self.counters['duplicate_conversions'] += 1
+                return 'duplicate'
+            if len(self._conversions) >= self.max_pending:
+                self.counters['dropped_conversions'] += 1
+                return 'dropped'
+            self._conversions[click_id] = {'click_id': click_id, 'split_id': split_id, 'arm': arm,
+                                           'converted_at': int(now)}
+        return 'accepted'
+
+    def _ensure_started(self):
+        # Após fork (gunicorn) a thread do processo pai não existe no filho
+        if self._pid == os.getpid() or self._get_engine is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._conversions = {}
+            for arms in self._arms.values():
+                arms.pending_trials = [0] * len(arms.urls)
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='bandit-sync', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.drain)
+
+    def _run(self):
+        while not self._stop.wait(self.sync_interval):
+            self.sync()
+        self.sync()
+
+    def sync(self, now=None):
+        """Grava contadores e conversões pendentes, relê os totais e recalcula os pesos"""
+        if self._get_engine is None:
+            return False
+        now = now if now is not None else time.time()
+        with self._lock:
+            arms_by_split = dict(self._arms)
+            rows = []
+            for arms in arms_by_split.values():
+                for i, trials in enumerate(arms.pending_trials):
+                    if trials:
+                        rows.append({'split_id': arms.split_id, 'arm': arms.hashes[i], 'url': arms.urls[i],
+                                     'trials': trials, 'successes': 0})
+                arms.pending_trials = [0] * len(arms.urls)
+            conversions, self._conversions = list(self._conversions.values()), {}
+
+        table = BanditArm.__table__
+        try:
+            with self._get_engine().begin() as conn:
+                converted = Counter()
+                for conversion in conversions:
+                    if conn.execute(_insert_conversion, conversion).rowcount:
+                        converted[(conversion['split_id'], conversion['arm'])] += 1
+                upserts = rows + [
+                    {'split_id': split_id, 'arm': arm, 'url': None, 'trials': 0, 'successes': count}
+                    for (split_id, arm), count in converted.items()
+                ]
+                if upserts:
+                    conn.execute(_upsert_arms, upserts)
+                conn.execute(_purge_conversions, {'cutoff': int(now - self.conversion_window)})
+                totals = {}
+                if arms_by_split:
+                    for split_id, arm, trials, successes in conn.execute(
+                            select(table.c.url_split_id, table.c.arm, table.c.trials, table.c.successes)
+                            .where(table.c.url_split_id.in_(list(arms_by_split)))):
+                        totals[(split_id, arm)] = (trials, successes)
+        except Exception as e:
+            with self._lock:
+                for row in rows:
+                    arms = self._arms.get(row['split_id'])
+                    index = arms.positions.get(row['url']) if arms is not None else None
+                    if index is not None:
+                        arms.pending_trials[index] += row['trials']
+                # De volta na frente da fila, sem repetir click ids nem passar do limite
+                pending = {conversion['click_id']: conversion for conversion in conversions}
+                for click_id, conversion in self._conversions.items():
+                    if click_id in pending:
+                        self.counters['duplicate_conversions'] += 1
+                    else:
+                        pending[click_id] = conversion
+                if len(pending) > self.max_pending:
+                    self.counters['dropped_conversions'] += len(pending) - self.max_pending
+                    pending = dict(list(pending.items())[:self.max_pending])
+                self._conversions = pending
+            self.counters['sync_failures'] += 1
+            logger.error('❌ Erro ao sincronizar o bandit: %s', e)
+            return False
+
+        self.counters['syncs'] += 1
+        self.counters['conversions'] += sum(converted.values())
+        self.counters['duplicate_conversions'] += len(conversions) - sum(converted.values())
+        for arms in arms_by_split.values():
+            trials = [totals.get((arms.split_id, h), (0, 0))[0] for h in arms.hashes]
+            successes = [totals.get((arms.split_id, h), (0, 0))[1] for h in arms.hashes]
+            if trials == arms.trials and successes == arms.successes and arms.version:
+                continue
+            weights = compute_weights(arms.mode, trials, successes, arms.epsilon, self.draws)
+            arms.trials, arms.successes = trials, successes
+            arms.weights = tuple(weights)
+            arms.version += 1  # depois dos pesos: quem vê a versão nova vê os pesos novos
+        return True
+
+    def drain(self, timeout=5.0):
+        """Sincroniza o que está pendente e encerra a thread (chamado no shutdown)"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return
+        self._stop.set()
+        thread.join(timeout)
+
+    def stats(self):
+        return {
+            'splits': len(self._arms),
+            'pending_conversions': len(self._conversions),
+            'syncs': self.counters['syncs'],
+            'sync_failures': self.counters['sync_failures'],
+            'conversions': self.counters['conversions'],
+            'duplicate_conversions': self.counters['duplicate_conversions'],
+            'dropped_conversions': self.counters['dropped_conversions'],
+        }
+
+
+bandit = Bandit()
@@ -0,0 +1,316 @@
+"""
+Cliques particionados por mês em arquivos SQLite próprios e arquivamento
+
+Os cliques brutos não ficam no banco principal: cada mês (UTC) tem seu
+arquivo em CLICK_PARTITION_DIR/clicks_AAAA_MM.db, com a mesma tabela
+click_logs. O banco principal guarda só splits, contadores e rollups, então
+o backup e o VACUUM dele não crescem com o histórico de cliques.
+
+Meses mais antigos que CLICK_RETENTION_MONTHS são arquivados em NDJSON
+comprimido (CLICK_ARCHIVE_DIR/clicks_AAAA_MM.ndjson.gz, uma linha por
+clique) e o arquivo SQLite do mês é removido. Consultas e export abrem
+apenas os meses do intervalo pedido, lendo a partição ou o arquivo.
+
+Arquivamento e migração do legado (click_logs no banco principal) rodam
+com um lock de arquivo: com vários workers só um faz o trabalho.
+"""
+import fcntl
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, Text, create_engine, select
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger('url_splitter.click_archive')
+
+PARTITION_RE = re.compile(r'^clicks_(\d{4})_(\d{2})\.db$')
+ARCHIVE_RE = re.compile(r'^clicks_(\d{4})_(\d{2})\.ndjson\.gz$')
+
+_metadata = MetaData()
+# Mesmo formato de ClickLog, sem a FK (url_splits fica no banco principal)
+partition_table = Table(
+    'click_logs', _metadata,
+    Column('id', Integer, primary_key=True),
+    Column('url_split_id', Integer, nullable=False),
+    Column('destination_url', String(500), nullable=False),
+    Column('ip_address', String(45)),
+    Column('user_agent', Text),
+    Column('clicked_at', DateTime),
+    Index('ix_click_logs_split_clicked', 'url_split_id', 'clicked_at'),
+)
+_insert_clicks = partition_table.insert()
+
+
+def month_of(value):
+    """(ano, mês) de um datetime"""
+    return value.year, value.month
+
+
+def add_months(month, delta):
+    year, number = month
+    index = year * 12 + (number - 1) + delta
+    return index // 12, index % 12 + 1
+
+
+def months_between(since, until):
+    """Meses (ano, mês) que cobrem [since, until)"""
+    month, last = month_of(since), month_of(until)
+    months = []
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def _serialize(row):
+    return {
+        'id': row['id'],
+        'url_split_id': row['url_split_id'],
+        'destination_url': row['destination_url'],
+        'ip_address': row['ip_address'],
+        'user_agent': row['user_agent'],
+        'clicked_at': row['clicked_at'].isoformat() if row['clicked_at'] else None,
+    }
+
+
+class ClickArchive:
+    """Partições mensais de cliques, arquivamento e leitura por intervalo"""
+
+    def __init__(self, directory=None, archive_dir=None, retention_months=6):
+        self.directory = directory
+        self.archive_dir = archive_dir
+        self.retention_months = retention_months
+        self._engines = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def init_app(self, app):
+        self.configure(app.config.get('CLICK_PARTITION_DIR'), app.config.get('CLICK_ARCHIVE_DIR'),
+                       app.config.get('CLICK_RETENTION_MONTHS', self.retention_months))
+
+    def configure(self, directory, archive_dir=None, retention_months=6):
+        self.dispose()
+        self.directory = directory or None
+        self.archive_dir = archive_dir or (os.path.join(directory, 'archive') if directory else None)
+        self.retention_months = max(1, int(retention_months))
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            os.makedirs(self.archive_dir, exist_ok=True)
+
+    def partition_path(self, month):
+        return os.path.join(self.directory, f'clicks_{month[0]:04d}_{month[1]:02d}.db')
+
+    def archive_path(self, month):
+        return os.path.join(self.archive_dir, f'clicks_{month[0]:04d}_{month[1]:02d}.ndjson.gz')
+
+    def _engine(self, month, create=True):
+        """Engine da partição do mês (uma por processo; None se não existe e create=False)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Após fork as conexões do pai não podem ser reaproveitadas
+                self._engines = {}
+                self._pid = os.getpid()
+            path = self.partition_path(month)
+            exists = os.path.exists(path)
+            engine = self._engines.get(month)
+            if engine is not None:
+                if exists:
+                    return engine
+                # Arquivada por outro processo: abrir de novo criaria um arquivo vazio
+                self._engines.pop(month).dispose()
+            if not create and not exists:
+                return None
+            engine = create_engine(f'sqlite:///{path}', poolclass=QueuePool, pool_size=1, max_overflow=4,
+                                   connect_args={'check_same_thread': False, 'timeout': 30})
+            _metadata.create_all(engine)
+            self._engines[month] = engine
+            return engine
+
+    def dispose(self, month=None):
+        with self._lock:
+            months = [month] if month is not None else list(self._engines)
+            for key in months:
+                engine = self._engines.pop(key, None)
+                if engine is not None:
+                    engine.dispose()
+
+    def write(self, events):
+        """Grava eventos de clique (dicts do click writer) nas partições dos seus meses"""
+        by_month = {}
+        for event in events:
+            by_month.setdefault(month_of(event['clicked_at']), []).append(event)
+        for month, rows in by_month.items():
+            with self._engine(month).begin() as conn:
+                conn.execute(_insert_clicks, rows)
+        return len(by_month)
+
+    def partitions(self):
+        """Meses disponíveis: partições vivas e arquivos, do mais antigo ao mais novo"""
+        found = {}
+        for directory, pattern, status in ((self.archive_dir, ARCHIVE_RE, 'archived'),
+                                           (self.directory, PARTITION_RE, 'live')):
+            if not directory or not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                match = pattern.match(name)
+                if match:
+                    path = os.path.join(directory, name)
+                    found[(int(match.group(1)), int(match.group(2)))] = {
+                        'month': f'{match.group(1)}-{match.group(2)}',
+                        'status': status,
+                        'path': path,
+                        'size_bytes': os.path.getsize(path),
+                    }
+        return [found[month] for month in sorted(found)]
+
+    def iter_clicks(self, since, until, split_id=None):
+        """Cliques em [since, until) (datetimes UTC ingênuos), só dos meses do intervalo"""
+        for month in months_between(since, until):
+            if os.path.exists(self.partition_path(month)):
+                yield from self._iter_partition(month, since, until, split_id)
+            elif os.path.exists(self.archive_path(month)):
+                yield from self._iter_archive(month, since, until, split_id)
+
+    def _iter_partition(self, month, since, until, split_id, page_size=5000):
+        engine = self._engine(month, create=False)
+        if engine is None:
+            return
+        table = partition_table
+        query = select(table).where(table.c.clicked_at >= since, table.c.clicked_at < until)
+        if split_id is not None:
+            query = query.where(table.c.url_split_id == split_id)
+        last_id = 0
+        while True:
+            with engine.connect() as conn:
+                rows = conn.execute(query.where(table.c.id > last_id)
+                                    .order_by(table.c.id).limit(page_size)).mappings().all()
+            if not rows:
+                return
+            for row in rows:
+                yield _serialize(row)
+            last_id = rows[-1]['id']
+
+    def _iter_archive(self, month, since, until, split_id):
+        since_iso, until_iso = since.isoformat(), until.isoformat()
+        with gzip.open(self.archive_path(month), 'rt', encoding='utf-8') as f:
+            for line in f:
+                click = json.loads(line)
+                if split_id is not None and click['url_split_id'] != split_id:
+                    continue
+                # isoformat sem fuso compara na ordem cronológica
+                if since_iso <= (click['clicked_at'] or '') < until_iso:
+                    yield click
+
+    @contextmanager
+    def _exclusive(self):
+        """Lock de arquivo entre processos; produz False se outro processo já o detém"""
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def archive(self, now=None):
+        """Arquiva as partições além da retenção; retorna os meses arquivados"""
+        if not self.enabled:
+            return []
+        cutoff = add_months(month_of(now or datetime.utcnow()), -(self.retention_months - 1))
+        archived = []
+        with self._exclusive() as acquired:
+            if not acquired:
+                return []
+            for name in sorted(os.listdir(self.directory)):
+                match = PARTITION_RE.match(name)
+                if not match:
+                    continue
+                month = (int(match.group(1)), int(match.group(2)))
+                if month >= cutoff:
+                    continue
+                count = self._archive_month(month)
+                archived.append(month)
+                logger.info('🗄️ Cliques de %04d-%02d arquivados: %d linhas', month[0], month[1], count)
+        return archived
+
+    def _archive_month(self, month):
+        path = self.archive_path(month)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        count = 0
+        # Um arquivo de um arquivamento anterior interrompido é regravado por inteiro
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            if os.path.exists(path):
+                with gzip.open(path, 'rt', encoding='utf-8') as previous:
+                    for line in previous:
+                        f.write(line)
+                        count += 1
+            engine = self._engine(month, create=False)
+            table = partition_table
+            last_id = 0
+            while True:
+                with engine.connect() as conn:
+                    rows = conn.execute(select(table).where(table.c.id > last_id)
+                                        .order_by(table.c.id).limit(5000)).mappings().all()
+                if not rows:
+                    break
+                for row in rows:
+                    f.write(json.dumps(_serialize(row), ensure_ascii=False) + '\n')
+                count += len(rows)
+                last_id = rows[-1]['id']
+        os.replace(tmp_path, path)
+        self.dispose(month)
+        partition = self.partition_path(month)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(partition + suffix):
+                os.remove(partition + suffix)
+        return count
+
+    def migrate_legacy(self, engine, chunk_size=10000):
+        """
+        Move os cliques da tabela click_logs do banco principal para as
+        partições (uma vez, em lotes) e faz VACUUM para devolver o espaço.
+        Retorna quantos cliques foram movidos.
+        """
+        if not self.enabled:
+            return 0
+        moved = 0
+        with self._exclusive() as acquired:
+            if not acquired:
+                return 0
+            legacy = partition_table
+            while True:
+                with engine.begin() as conn:
+                    rows = conn.execute(select(legacy.c.url_split_id, legacy.c.destination_url,
+                                               legacy.c.ip_address, legacy.c.user_agent,
+                                               legacy.c.clicked_at, legacy.c.id)
+                                        .order_by(legacy.c.id).limit(chunk_size)).mappings().all()
+                    if not rows:
+                        break
+                    events = [dict(row, clicked_at=row['clicked_at'] or datetime.utcnow()) for row in rows]
+                    for event in events:
+                        del event['id']
+                    # A partição é gravada antes de apagar do principal: numa falha o lote
+                    # pode ser copiado de novo, mas nunca perdido
+                    self.write(events)
+                    conn.execute(legacy.delete().where(legacy.c.id <= rows[-1]['id']))
+                moved += len(rows)
+            if moved:
+                with engine.connect() as conn:
+                    conn.exec_driver_sql('VACUUM')
+        return moved
+
+
+click_archive = ClickArchive()
@@ -0,0 +1,134 @@
+"""
+Estatísticas de cliques por intervalo a partir de rollups pré-agregados
+
+Cada flush do click writer soma os cliques do lote em intervalos de um
+minuto (um UPSERT por split/destino/minuto). A compactação periódica move
+minutos antigos para horas e horas antigas para dias, então a consulta de
+estatísticas lê um número de linhas limitado pelo período pedido, e não
+pela quantidade de cliques. Um período que alcança dados já compactados é
+respondido na granularidade que ainda existe para ele (nunca horas rotuladas
+como minutos).
+"""
+from collections import Counter
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+GRANULARITIES = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Janela padrão de cada granularidade quando `since` não é informado
+DEFAULT_WINDOWS = {'minute': 3600 * 6, 'hour': 86400 * 7, 'day': 86400 * 90}
+
+_upsert = text('''
+    INSERT INTO click_rollups (url_split_id, destination_url, granularity, bucket_start, clicks)
+    VALUES (:split_id, :destination, :granularity, :bucket_start, :clicks)
+    ON CONFLICT (url_split_id, destination_url, granularity, bucket_start)
+    DO UPDATE SET clicks = clicks + excluded.clicks
+''')
+
+_compact = text('''
+    INSERT INTO click_rollups (url_split_id, destination_url, granularity, bucket_start, clicks)
+    SELECT url_split_id, destination_url, :target, (bucket_start / :size) * :size, SUM(clicks)
+    FROM click_rollups
+    WHERE granularity = :source AND bucket_start < :cutoff
+    GROUP BY url_split_id, destination_url, (bucket_start / :size) * :size
+    ON CONFLICT (url_split_id, destination_url, granularity, bucket_start)
+    DO UPDATE SET clicks = clicks + excluded.clicks
+''')
+
+_delete_compacted = text('''
+    DELETE FROM click_rollups WHERE granularity = :source AND bucket_start < :cutoff
+''')
+
+_query = text('''
+    SELECT destination_url, (bucket_start / :size) * :size AS bucket, SUM(clicks) AS clicks
+    FROM click_rollups
+    WHERE url_split_id = :split_id AND bucket_start >= :since AND bucket_start < :until
+    GROUP BY destination_url, bucket
+    ORDER BY bucket, destination_url
+''')
+
+
+def to_epoch(value):
+    """datetime ingênuo em UTC (como clicked_at) -> epoch em segundos"""
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+def minute_rollups(events):
+    """Agrega eventos de clique em linhas de rollup por minuto"""
+    counts = Counter(
+        (event['url_split_id'], event['destination_url'], to_epoch(event['clicked_at']) // 60 * 60)
+        for event in events
+    )
+    return [
+        {'split_id': split_id, 'destination': destination, 'granularity': 'minute',
+         'bucket_start': bucket_start, 'clicks': clicks}
+        for (split_id, destination, bucket_start), clicks in counts.items()
+    ]
+
+
+def record_rollups(conn, events):
+    """Soma os eventos nos rollups por minuto (na transação de `conn`)"""
+    rows = minute_rollups(events)
+    if rows:
+        conn.execute(_upsert, rows)
+    return len(rows)
+
+
+def compact_rollups(conn, now=None, minute_retention=48 * 3600, hour_retention=90 * 86400):
+    """
+    Move minutos mais antigos que `minute_retention` para horas e horas mais
+    antigas que `hour_retention` para dias. Os cortes são alinhados ao
+    intervalo de destino para nunca dividir uma hora/dia entre níveis.
+    """
+    now = int(now if now is not None else datetime.utcnow().replace(tzinfo=timezone.utc).timestamp())
+    moved = 0
+    for source, target, retention in (('minute', 'hour', minute_retention), ('hour', 'day', hour_retention)):
+        size = GRANULARITIES[target]
+        cutoff = (now - retention) // size * size
+        params = {'source': source, 'target': target, 'size': size, 'cutoff': cutoff}
+        conn.execute(_compact, params)
+        moved += conn.execute(_delete_compacted, params).rowcount
+    return moved
+
+
+def stored_granularity(granularity, since, now, minute_retention=48 * 3600, hour_retention=90 * 86400):
+    """
+    Granularidade mais fina disponível a partir de `since`: antes dos cortes
+    de compactação (alinhados como em compact_rollups) os minutos já podem ter
+    virado horas e as horas, dias.
+    """
+    if since < (now - hour_retention) // GRANULARITIES['day'] * GRANULARITIES['day']:
+        required = 'day'
+    elif since < (now - minute_retention) // GRANULARITIES['hour'] * GRANULARITIES['hour']:
+        required = 'hour'
+    else:
+        required = 'minute'
+    return max(granularity, required, key=GRANULARITIES.get)
+
+
+def query_stats(conn, split_id, granularity='hour', since=None, until=None,
+                minute_retention=48 * 3600, hour_retention=90 * 86400):
+    """
+    Cliques por destino e intervalo; retorna (buckets, totais por destino,
+    granularidade usada), que pode ser mais grossa que a pedida se o período
+    alcançar rollups já compactados.
+    """
+    now = int(datetime.utcnow().replace(tzinfo=timezone.utc).timestamp())
+    until = until if until is not None else now + GRANULARITIES[granularity]
+    since = since if since is not None else until - DEFAULT_WINDOWS[granularity]
+    granularity = stored_granularity(granularity, since, now, minute_retention, hour_retention)
+    size = GRANULARITIES[granularity]
+    rows = conn.execute(_query, {'size': size, 'split_id': split_id,
+                                 'since': since // size * size, 'until': until}).fetchall()
+
+    buckets = []
+    totals = Counter()
+    for destination, bucket, clicks in rows:
+        buckets.append({
+            'start': datetime.fromtimestamp(bucket, tz=timezone.utc).isoformat(),
+            'destination': destination,
+            'clicks': clicks,
+        })
+        totals[destination] += clicks
+    return buckets, dict(totals), granularity
@@ -0,0 +1,230 @@
+"""
+Gravação assíncrona e em lote dos cliques (ClickLog + URLSplit.total_clicks)
+
+O redirecionamento apenas enfileira o evento numa fila limitada; uma thread
+por processo grava os eventos em lote (INSERT executemany) quando o lote
+enche ou o intervalo expira, com um único UPDATE agregado por split e os
+rollups por minuto das estatísticas. A mesma thread compacta os rollups
+periodicamente.
+
+Com CLICK_PARTITION_DIR os cliques brutos vão para a partição mensal
+(src/services/click_archive.py) em vez da tabela click_logs do banco
+principal, e a thread também arquiva as partições além da retenção.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from src.models.user import db
+from src.models.url_split import ClickLog, URLSplit
+from src.services.click_archive import click_archive
+from src.services.click_stats import compact_rollups, record_rollups
+
+BACKPRESSURE_MODES = ('drop', 'block')
+
+logger = logging.getLogger('url_splitter.click_writer')
+
+_insert_clicks = ClickLog.__table__.insert()
+_increment_clicks = (
+    URLSplit.__table__.update()
+    .where(URLSplit.__table__.c.id == bindparam('split_id'))
+    .values(total_clicks=db.func.coalesce(URLSplit.__table__.c.total_clicks, 0) + bindparam('clicks'))
+)
+
+
+class ClickWriter:
+    """Fila limitada + thread de gravação em lote"""
+
+    def __init__(self, max_queue=10000, batch_size=500, flush_interval=1.0,
+                 backpressure='drop', block_timeout=0.05, compact_interval=300,
+                 minute_retention=48 * 3600, hour_retention=90 * 86400, archive_interval=3600):
+        self.compact_interval = compact_interval
+        self.archive_interval = archive_interval
+        self.minute_retention = minute_retention
+        self.hour_retention = hour_retention
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+        self.enabled = True
+        self._get_engine = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.counters = Counter()
+
+    def init_app(self, app):
+        self.configure(
+            lambda: db.get_engine(app),
+            max_queue=app.config.get('CLICK_QUEUE_SIZE', self.max_queue),
+            batch_size=app.config.get('CLICK_BATCH_SIZE', self.batch_size),
+            flush_interval=app.config.get('CLICK_FLUSH_INTERVAL', self.flush_interval),
+            backpressure=app.config.get('CLICK_BACKPRESSURE', self.backpressure),
+            enabled=app.config.get('CLICK_LOGGING_ENABLED', True),
+        )
+        self.compact_interval = app.config.get('STATS_COMPACT_INTERVAL', self.compact_interval)
+        self.minute_retention = app.config.get('STATS_MINUTE_RETENTION', self.minute_retention)
+        self.hour_retention = app.config.get('STATS_HOUR_RETENTION', self.hour_retention)
+        self.archive_interval = app.config.get('CLICK_ARCHIVE_INTERVAL', self.archive_interval)
+
+    def configure(self, get_engine, max_queue=None, batch_size=None, flush_interval=None,
+                  backpressure=None, enabled=True):
+        if backpressure is not None and backpressure not in BACKPRESSURE_MODES:
+            raise ValueError(f'backpressure inválido: {backpressure} (use {BACKPRESSURE_MODES})')
+        self._get_engine = get_engine
+        self.max_queue = max_queue or self.max_queue
+        self.batch_size = batch_size or self.batch_size
+        self.flush_interval = flush_interval or self.flush_interval
+        self.backpressure = backpressure or self.backpressure
+        self.enabled = enabled
+
+    def _ensure_started(self):
+        # Após fork (gunicorn) a thread do processo pai não existe no filho
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='click-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.drain)
+
+    def record(self, split_id, destination_url, ip_address=None, user_agent=None):
+        """Enfileira um clique; retorna False se foi descartado"""
+        if not self.enabled or self._get_engine is None:
+            return False
+        self._ensure_started()
+        event = {
+            'url_split_id': split_id,
+            'destination_url': destination_url,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'clicked_at': datetime.utcnow(),
+        }
+        try:
+            if self.backpressure == 'block':
+                self._queue.put(event, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(event)
+        except queue.Full:
+            self.counters['dropped'] += 1
+            return False
+        self.counters['queued'] += 1
+        return True
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        next_compact = time.monotonic() + self.compact_interval
+        next_archive = time.monotonic() + self.archive_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+
+            stopping = self._stop.is_set()
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline or stopping:
+                if stopping:
+                    batch.extend(self._drain_queue())
+                if batch:
+                    self._flush(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+                if stopping:
+                    return
+                if time.monotonic() >= next_compact:
+                    self.compact()
+                    next_compact = time.monotonic() + self.compact_interval
+                if time.monotonic() >= next_archive:
+                    self.archive()
+                    next_archive = time.monotonic() + self.archive_interval
+
+    def _drain_queue(self):
+        pending = []
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                return pending
+
+    def _flush(self, batch):
+        clicks_per_split = Counter(event['url_split_id'] for event in batch)
+        try:
+            # Partição primeiro: uma falha no banco principal deixa o clique
+            # registrado sem contagem, nunca contado sem registro
+            if click_archive.enabled:
+                click_archive.write(batch)
+            with self._get_engine().begin() as conn:
+                if not click_archive.enabled:
+                    conn.execute(_insert_clicks, batch)
+                conn.execute(_increment_clicks, [
+                    {'split_id': split_id, 'clicks': clicks}
+                    for split_id, clicks in clicks_per_split.items()
+                ])
+                record_rollups(conn, batch)
+        except Exception as e:
+            self.counters['failed'] += len(batch)
+            logger.error('❌ Erro ao gravar %d cliques: %s', len(batch), e)
+            return
+        self.counters['flushed'] += len(batch)
+        self.counters['flushes'] += 1
+
+    def compact(self):
+        """Compacta rollups antigos (minuto -> hora -> dia)"""
+        try:
+            with self._get_engine().begin() as conn:
+                moved = compact_rollups(conn, minute_retention=self.minute_retention,
+                                        hour_retention=self.hour_retention)
+        except Exception as e:
+            logger.error('❌ Erro ao compactar estatísticas: %s', e)
+            return
+        self.counters['compactions'] += 1
+        if moved:
+            logger.info('🗜️ Estatísticas compactadas: %d intervalos', moved)
+
+    def archive(self):
+        """Arquiva partições de cliques além da retenção (só um processo por vez)"""
+        if not click_archive.enabled:
+            return
+        try:
+            click_archive.archive()
+        except Exception as e:
+            logger.error('❌ Erro ao arquivar cliques: %s', e)
+            return
+        self.counters['archive_runs'] += 1
+
+    def drain(self, timeout=5.0):
+        """Grava tudo o que está na fila e encerra a thread (chamado no shutdown)"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return
+        self._stop.set()
+        thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queued': self.counters['queued'],
+            'flushed': self.counters['flushed'],
+            'dropped': self.counters['dropped'],
+            'failed': self.counters['failed'],
+            'flushes': self.counters['flushes'],
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+click_writer = ClickWriter()
@@ -0,0 +1,65 @@
+"""
+Ajustes do SQLite para vários workers: WAL, pragmas por conexão e pool
+
+Em modo WAL leitores não bloqueiam o escritor (e vice-versa), então
+redirecionamentos e o flush de cliques deixam de serializar no arquivo.
+"""
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,          # ms esperando lock antes de "database is locked"
+    'cache_size': -64000,          # negativo = KiB (64 MB por conexão)
+    'mmap_size': 268435456,        # 256 MB mapeados em memória
+    'temp_store': 'MEMORY',
+}
+
+# Pragmas aplicados a toda nova conexão sqlite3 (ajustados por configure_sqlite)
+_pragmas = dict(DEFAULT_PRAGMAS)
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas=None):
+    """Executa os pragmas numa conexão sqlite3 já aberta"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in (pragmas or _pragmas).items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+@event.listens_for(Engine, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_sqlite_pragmas(dbapi_connection)
+
+
+def configure_sqlite(app):
+    """Define pragmas e opções de engine (pool, timeout) a partir do app.config"""
+    _pragmas.update({
+        'busy_timeout': app.config.get('SQLITE_BUSY_TIMEOUT', DEFAULT_PRAGMAS['busy_timeout']),
+        'cache_size': app.config.get('SQLITE_CACHE_SIZE', DEFAULT_PRAGMAS['cache_size']),
+        'mmap_size': app.config.get('SQLITE_MMAP_SIZE', DEFAULT_PRAGMAS['mmap_size']),
+        'synchronous': app.config.get('SQLITE_SYNCHRONOUS', DEFAULT_PRAGMAS['synchronous']),
+    })
+
+    if not app.config.get('SQLALCHEMY_DATABASE_URI', '').startswith('sqlite'):
+        return
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    # Sem pool explícito o Flask-SQLAlchemy usa NullPool no SQLite: uma conexão
+    # nova (e todos os pragmas) a cada requisição
+    options.setdefault('poolclass', QueuePool)
+    options.setdefault('pool_size', app.config.get('SQLITE_POOL_SIZE', 5))
+    options.setdefault('max_overflow', app.config.get('SQLITE_MAX_OVERFLOW', 10))
+    options.setdefault('pool_timeout', app.config.get('SQLITE_POOL_TIMEOUT', 10))
+    options.setdefault('pool_pre_ping', False)
+    connect_args = options.setdefault('connect_args', {})
+    connect_args.setdefault('timeout', _pragmas['busy_timeout'] / 1000)
+    # Conexões do pool são usadas por threads diferentes (requisições e click writer)
+    connect_args.setdefault('check_same_thread', False)
@@ -0,0 +1,426 @@
+"""
+Verificação de saúde dos destinos e failover no redirecionamento
+
+Um único processo verificador (src/health_checker.py) sonda todos os
+destinos distintos (split_destinations e destinos das regras de
+direcionamento, deduplicados por URL entre splits) num event loop asyncio:
+
+- concorrência limitada (HEALTH_CHECK_CONCURRENCY sondas ao mesmo tempo e
+  HEALTH_CHECK_PER_HOST por host) e DNS resolvido uma vez por host a cada
+  intervalo, então dezenas de milhares de URLs num mesmo domínio não viram
+  dezenas de milhares de consultas;
+- cada URL tem o próximo prazo sorteado em HEALTH_CHECK_INTERVAL ±
+  HEALTH_CHECK_JITTER, para as sondas se espalharem em vez de saírem em
+  rajadas; URLs com falha são sondadas de novo após HEALTH_CHECK_RETRY_INTERVAL;
+- a sonda é uma requisição (HEALTH_CHECK_METHOD, padrão HEAD) que só lê a
+  linha de status: erro de conexão, timeout, 5xx, 404 e 410 contam como
+  falha; o destino sai do ar após HEALTH_CHECK_FAILURES falhas seguidas e
+  volta no primeiro sucesso.
+
+O estado (URLs fora do ar) fica em memória e é publicado a cada rodada num
+JSON (HEALTH_STATE_PATH, escrita atômica). Cada worker relê o arquivo quando
+ele muda, no máximo a cada SPLIT_CACHE_CHECK_INTERVAL segundos; um estado
+mais velho que 3 intervalos (verificador parado) é ignorado e todos os
+destinos voltam a valer.
+
+No redirecionamento, um destino sorteado que esteja fora do ar é sorteado de
+novo (rejeição, que equivale a renormalizar os pesos entre os saudáveis); no
+modo sticky vence o próximo destino do rendezvous, então só os visitantes do
+destino fora do ar mudam de destino. Se todos estiverem fora do ar, o
+sorteio original é mantido.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import ssl
+import time
+from urllib.parse import urlsplit
+
+from sqlalchemy import select
+from werkzeug.urls import iri_to_uri
+
+from src.models.url_split import SplitDestination, URLSplit
+
+FAILOVER_ATTEMPTS = 32
+UNHEALTHY_STATUSES = (404, 410)
+STALE_INTERVALS = 3
+USER_AGENT = 'url-splitter-health/1.0'
+
+logger = logging.getLogger('url_splitter.destination_health')
+
+
+def failover(compiled, unhealthy, visitor_key=None):
+    """
+    Destino saudável no lugar de um sorteado fora do ar. Sorteia de novo até
+    FAILOVER_ATTEMPTS vezes (depois, uniforme entre os saudáveis); no modo
+    sticky, rendezvous sem os destinos fora do ar. None se todos estiverem
+    fora do ar.
+    """
+    destinations = compiled.destinations
+    excluded = frozenset(i for i, dest in enumerate(destinations) if dest in unhealthy)
+    if len(excluded) == len(destinations):
+        return None
+    if compiled.sticky_mode and visitor_key and len(destinations) > 1:
+        return compiled.pick_sticky_excluding(visitor_key, excluded)
+    for _ in range(FAILOVER_ATTEMPTS):
+        dest = compiled.pick()
+        if dest not in unhealthy:
+            return dest
+    return random.choice([dest for i, dest in enumerate(destinations) if i not in excluded])
+
+
+def probe_destination(compiled, unhealthy):
+    """
+    Destino do `Location` numa sondagem HEAD: sorteio pelos pesos, sem sticky,
+    regras nem registro de clique/tentativa de bandit, evitando destinos fora do ar.
+    """
+    dest = compiled.pick()
+    if dest in unhealthy:
+        dest = failover(compiled, unhealthy) or dest
+    return dest
+
+
+class DestinationHealth:
+    """Lado do worker: conjunto de URLs fora do ar, relido do arquivo de estado"""
+
+    def __init__(self, path=None, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.unhealthy = frozenset()
+        self.checked_at = None
+        self._mtime = None
+        self._next_check = 0.0
+
+    def init_app(self, app):
+        self.path = app.config.get('HEALTH_STATE_PATH') or None
+        self.check_interval = app.config.get('SPLIT_CACHE_CHECK_INTERVAL', self.check_interval)
+        self.unhealthy = frozenset()
+        self.checked_at = None
+        self._mtime = None
+        self._next_check = 0.0
+
+    def current(self):
+        """URLs fora do ar (frozenset; vazio sem verificador ou com estado velho)"""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self._reload()
+        return self.unhealthy
+
+    def _reload(self):
+        if not self.path:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self.unhealthy = frozenset()
+            self._mtime = None
+            return
+        if mtime != self._mtime:
+            # Marca a versão antes de ler: um arquivo ilegível gera um aviso só
+            self._mtime = mtime
+            try:
+                with open(self.path) as f:
+                    state = json.load(f)
+                self.unhealthy = frozenset(state['unhealthy'])
+                self.checked_at = state['checked_at']
+                self._state = state
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning('⚠️ Estado de saúde ilegível (%s): %s', self.path, e)
+                return
+        if self.unhealthy and self.is_stale(self._state):
+            logger.warning('⚠️ Estado de saúde sem atualização desde %s: failover desligado',
+                           time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.checked_at)))
+            self.unhealthy = frozenset()
+
+    @staticmethod
+    def is_stale(state):
+        """Estado sem atualização há mais de STALE_INTERVALS intervalos do verificador"""
+        return time.time() - state['checked_at'] > STALE_INTERVALS * state['interval']
+
+    def report(self):
+        """Estado completo publicado pelo verificador (None se não houver)"""
+        if not self.path:
+            return None
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def stats(self):
+        return {'unhealthy': len(self.unhealthy), 'checked_at': self.checked_at}
+
+
+class ProbeState:
+    """Situação de uma URL no verificador"""
+
+    __slots__ = ('next_due', 'failures', 'healthy', 'status', 'error', 'since', 'queued')
+
+    def __init__(self, next_due):
+        self.next_due = next_due
+        self.failures = 0
+        self.healthy = True
+        self.status = None
+        self.error = None
+        self.since = None
+        self.queued = False
+
+
+def collect_destinations(engine):
+    """URLs distintas de todos os splits (destinos e regras de direcionamento)"""
+    urls = set()
+    with engine.connect() as conn:
+        urls.update(conn.execute(select(SplitDestination.__table__.c.url).distinct()).scalars())
+        rules_column = URLSplit.__table__.c.targeting_rules
+        for raw in conn.execute(select(rules_column).where(rules_column.isnot(None))).scalars():
+            try:
+                urls.update(rule['destination'] for rule in json.loads(raw) or ())
+            except (ValueError, TypeError, KeyError):
+                continue
+    return urls
+
+
+class HealthChecker:
+    """Lado do verificador: sonda as URLs num event loop e publica o estado"""
+
+    def __init__(self, engine=None, state_path=None, interval=30.0, timeout=5.0, concurrency=200,
+                 per_host=8, failures=2, jitter=0.2, retry_interval=10.0, method='HEAD'):
+        self.engine = engine
+        self.state_path = state_path
+        self.interval = interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.failures = failures
+        self.jitter = jitter
+        self.retry_interval = retry_interval
+        self.method = method
+        self.states = {}
+        self.probes = 0
+        self._host_limits = {}
+        self._resolved = {}
+        self._ssl = ssl.create_default_context()
+
+    @classmethod
+    def from_app(cls, app, engine):
+        config = app.config
+        return cls(engine, config.get('HEALTH_STATE_PATH'), config.get('HEALTH_CHECK_INTERVAL', 30.0),
+                   config.get('HEALTH_CHECK_TIMEOUT', 5.0), config.get('HEALTH_CHECK_CONCURRENCY', 200),
+                   config.get('HEALTH_CHECK_PER_HOST', 8), config.get('HEALTH_CHECK_FAILURES', 2),
+                   config.get('HEALTH_CHECK_JITTER', 0.2), config.get('HEALTH_CHECK_RETRY_INTERVAL', 10.0),
+                   config.get('HEALTH_CHECK_METHOD', 'HEAD'))
+
+    def set_urls(self, urls, now=None):
+        """Passa a verificar `urls`; URLs novas têm a primeira sonda espalhada no intervalo de jitter"""
+        if now is None:
+            now = time.monotonic()
+        spread = self.interval * self.jitter
+        states = {}
+        for url in urls:
+            state = self.states.get(url)
+            states[url] = state if state is not None else ProbeState(now + random.uniform(0, spread))
+        self.states = states
+
+    @property
+    def unhealthy(self):
+        return {url: state for url, state in self.states.items() if not state.healthy}
+
+    def _reset_loop_state(self):
+        """Semáforos e resoluções em andamento pertencem ao event loop que os criou"""
+        self._host_limits = {}
+        self._resolved = {}
+
+    async def _resolve(self, host, port):
+        """Endereço do host, resolvido uma vez por intervalo (compartilhado entre as sondas)"""
+        key = (host, port)
+        entry = self._resolved.get(key)
+        now = time.monotonic()
+        if entry is None or entry[1] <= now:
+            loop = asyncio.get_running_loop()
+            future = loop.create_task(loop.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+            entry = (future, now + self.interval)
+            self._resolved[key] = entry
+        infos = await asyncio.shield(entry[0])
+        family, _, _, _, address = infos[0]
+        return family, address[0]
+
+    async def _exchange(self, host, port, https, request):
+        """Conecta, envia a requisição e devolve a linha de status"""
+        _, address = await self._resolve(host, port)
+        reader, writer = await asyncio.open_connection(address, port, ssl=self._ssl if https else None,
+                                                       server_hostname=host if https else None)
+        try:
+            writer.write(request)
+            return await reader.readline()
+        finally:
+            writer.close()
+
+    async def probe(self, url):
+        """(status ou None, erro ou None) de uma requisição à URL, lendo só a linha de status"""
+        parts = urlsplit(url)
+        https = parts.scheme == 'https'
+        try:
+            host = parts.hostname
+            port = parts.port or (443 if https else 80)
+            ascii_host = host.encode('idna').decode('ascii') if host else None
+        except (ValueError, UnicodeError) as e:
+            return None, f'URL inválida: {e}'
+        if not host:
+            return None, 'URL sem host'
+        target = iri_to_uri(parts.path or '/')
+        if parts.query:
+            target += '?' + iri_to_uri(parts.query)
+        host_header = ascii_host if parts.port is None else f'{ascii_host}:{parts.port}'
+        request = (f'{self.method} {target} HTTP/1.1\r\nHost: {host_header}\r\n'
+                   f'User-Agent: {USER_AGENT}\r\nAccept: */*\r\nConnection: close\r\n\r\n').encode('ascii')
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        async with limit:
+            try:
+                line = await asyncio.wait_for(self._exchange(ascii_host, port, https, request), self.timeout)
+                status = int(line.split(None, 2)[1])
+            except asyncio.TimeoutError:
+                return None, f'timeout ({self.timeout:g}s)'
+            except (OSError, ValueError, IndexError, UnicodeError) as e:
+                return None, f'{type(e).__name__}: {e}' if str(e) else type(e).__name__
+        return status, None
+
+    def _record(self, url, status, error, now):
+        state = self.states.get(url)
+        if state is None:
+            return
+        ok = status is not None and status < 500 and status not in UNHEALTHY_STATUSES
+        state.status = status
+        state.error = error if status is None else (None if ok else f'HTTP {status}')
+        if ok:
+            if not state.healthy:
+                logger.info('✅ Destino de volta: %s', url)
+            state.failures = 0
+            state.healthy = True
+            state.since = None
+            delay = self.interval
+        else:
+            state.failures += 1
+            if state.healthy and state.failures >= self.failures:
+                state.healthy = False
+                state.since = time.time()
+                logger.warning('🚫 Destino fora do ar: %s (%s)', url, state.error)
+            delay = min(self.retry_interval, self.interval)
+        state.next_due = now + delay * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+    async def _worker(self, queue):
+        while True:
+            url = await queue.get()
+            try:
+                status, error = await self.probe(url)
+                self.probes += 1
+                self._record(url, status, error, time.monotonic())
+            except Exception as e:
+                logger.error('❌ Erro na sonda de %s: %s', url, e)
+            finally:
+                state = self.states.get(url)
+                if state is not None:
+                    state.queued = False
+                queue.task_done()
+
+    def _enqueue_due(self, queue, now):
+        due = 0
+        for url, state in self.states.items():
+            if not state.queued and state.next_due <= now:
+                state.queued = True
+                queue.put_nowait(url)
+                due += 1
+        return due
+
+    async def check_once(self, urls=None):
+        """
+        Sonda todas as URLs (ou `urls`) uma vez, com a mesma concorrência do
+        laço contínuo; retorna {url: ProbeState} das que estão fora do ar.
+        """
+        if urls is not None:
+            self.set_urls(urls)
+        self._reset_loop_state()
+        queue = asyncio.Queue()
+        for state in self.states.values():
+            state.next_due = 0.0
+        self._enqueue_due(queue, time.monotonic())
+        workers = [asyncio.ensure_future(self._worker(queue)) for _ in range(self.concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return self.unhealthy
+
+    def state(self):
+        """Estado publicado para os workers"""
+        return {
+            'checked_at': time.time(),
+            'interval': self.interval,
+            'destinations': len(self.states),
+            'unhealthy': sorted(self.unhealthy),
+            'details': {url: {'status': state.status, 'error': state.error, 'since': state.since,
+                              'failures': state.failures}
+                        for url, state in self.unhealthy.items()},
+        }
+
+    def publish(self):
+        """Grava o estado (escrita atômica via rename)"""
+        if not self.state_path:
+            return
+        tmp_path = f'{self.state_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state(), f)
+        os.replace(tmp_path, self.state_path)
+
+    async def run_forever(self, stop=None):
+        """
+        Laço do verificador: relê as URLs do banco a cada intervalo, enfileira
+        as que venceram e publica o estado a cada segundo em que algo mudou
+        (e ao menos uma vez por intervalo). `stop` é um asyncio.Event opcional.
+        """
+        loop = asyncio.get_running_loop()
+        self._reset_loop_state()
+        queue = asyncio.Queue()
+        workers = [asyncio.ensure_future(self._worker(queue)) for _ in range(self.concurrency)]
+        next_reload = 0.0
+        next_publish = 0.0
+        published = None
+        try:
+            while stop is None or not stop.is_set():
+                now = time.monotonic()
+                if now >= next_reload and self.engine is not None:
+                    try:
+                        urls = await loop.run_in_executor(None, collect_destinations, self.engine)
+                        self.set_urls(urls, now)
+                    except Exception as e:
+                        logger.error('❌ Erro ao ler destinos: %s', e)
+                    next_reload = now + self.interval
+                    # Resoluções vencidas saem do cache (inclusive de hosts que saíram da lista)
+                    self._resolved = {key: value for key, value in self._resolved.items() if value[1] > now}
+                self._enqueue_due(queue, now)
+                unhealthy = frozenset(self.unhealthy)
+                if unhealthy != published or now >= next_publish:
+                    await loop.run_in_executor(None, self.publish)
+                    if unhealthy != published:
+                        logger.info('🩺 %d de %d destinos fora do ar', len(unhealthy), len(self.states))
+                    published = unhealthy
+                    next_publish = now + self.interval
+                await asyncio.sleep(1.0)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self):
+        return {'destinations': len(self.states), 'unhealthy': len(self.unhealthy),
+                'probes': self.probes}
+
+
+destination_health = DestinationHealth()
@@ -0,0 +1,124 @@
+"""
+Logging estruturado, com níveis, amostragem e I/O fora da thread da requisição
+
+As requisições só colocam o LogRecord numa fila limitada; uma thread
+(QueueListener) formata e escreve. Linhas de debug do caminho quente
+(logger 'url_splitter.redirect') são amostradas por LOG_REDIRECT_SAMPLE_RATE.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+ROOT_LOGGER = 'url_splitter'
+REDIRECT_LOGGER = 'url_splitter.redirect'
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar só uma fração dos registros abaixo de WARNING"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    QueueHandler que não formata na thread da requisição, descarta com a fila
+    cheia (contando os descartes) e religa o listener após fork (gunicorn).
+    """
+
+    def __init__(self, handlers, maxsize=10000):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.target_handlers = handlers
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=self.maxsize)
+            self._listener = QueueListener(self.queue, *self.target_handlers, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def prepare(self, record):
+        # A formatação fica para a thread do listener
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+def configure_logging(app):
+    """Configura o logger 'url_splitter' a partir de LOG_LEVEL, LOG_FORMAT etc."""
+    level = app.config.get('LOG_LEVEL', 'INFO')
+    fmt = app.config.get('LOG_FORMAT', 'text')
+
+    stream = logging.StreamHandler(sys.stdout)
+    if fmt == 'json':
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    for handler in list(root.handlers):
+        if isinstance(handler, AsyncQueueHandler):
+            handler.stop()
+        root.removeHandler(handler)
+
+    if app.config.get('LOG_ASYNC', True):
+        handler = AsyncQueueHandler([stream], maxsize=app.config.get('LOG_QUEUE_SIZE', 10000))
+    else:
+        handler = stream
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+
+    redirect_logger = logging.getLogger(REDIRECT_LOGGER)
+    redirect_logger.filters = [f for f in redirect_logger.filters if not isinstance(f, SamplingFilter)]
+    rate = app.config.get('LOG_REDIRECT_SAMPLE_RATE', 0.01)
+    if rate < 1:
+        redirect_logger.addFilter(SamplingFilter(rate))
+    return handler
@@ -0,0 +1,269 @@
+"""
+Métricas do caminho quente no formato texto do Prometheus
+
+Cada processo acumula contadores e histogramas em memória e grava um
+snapshot em METRICS_DIR/metrics_<pid>.json a cada METRICS_FLUSH_INTERVAL
+segundos. /api/metrics soma os snapshots de todos os workers, então
+qualquer worker do gunicorn responde com o total. Gauges (ex.: profundidade
+de fila) só entram se o processo dono ainda estiver vivo.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PREFIX = 'url_splitter_'
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+logger = logging.getLogger('url_splitter.metrics')
+
+HELP = {
+    'http_request_duration_seconds': 'Latência por rota, método e status',
+    'redirects_total': 'Redirecionamentos por slug e destino',
+    'redirects_limited_total': 'Redirecionamentos recusados pelo limite de taxa (ip/split)',
+    'bot_redirects_total': 'Redirecionamentos de bots por slug',
+    'targeted_redirects_total': 'Redirecionamentos decididos por regra de direcionamento, por slug',
+    'failover_redirects_total': 'Redirecionamentos desviados de um destino fora do ar, por slug',
+    'redirect_probes_total': 'Requisições HEAD ao redirecionamento (sem sorteio nem clique)',
+    'conversions_total': 'Postbacks de conversão do modo bandit por resultado',
+    'split_cache_requests_total': 'Consultas ao cache de splits (hit/miss)',
+    'db_query_duration_seconds': 'Tempo de execução das queries SQL',
+    'click_events_total': 'Eventos de clique no click writer por resultado',
+    'click_queue_depth': 'Cliques aguardando gravação',
+    'unhealthy_destinations': 'Destinos fora do ar segundo o verificador de saúde',
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metrics:
+    """Registro de métricas por processo com agregação via arquivos"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.directory = None
+        self.flush_interval = 2.0
+        self.stale_after = 86400
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauge_collectors = []
+        self._counter_collectors = []
+        self._pid = None
+
+    def init_app(self, app):
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', self.flush_interval)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        @app.before_request
+        def _start_timer():
+            request._metrics_start = time.perf_counter()
+
+        @app.after_request
+        def _observe_request(response):
+            start = getattr(request, '_metrics_start', None)
+            if start is not None:
+                rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+                self.observe('http_request_duration_seconds', time.perf_counter() - start,
+                             route=rule, method=request.method, status=response.status_code)
+            return response
+
+    # --- registro -------------------------------------------------------
+
+    def inc(self, name, amount=1, **labels):
+        self._ensure_flusher()
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        self._ensure_flusher()
+        key = (name, _labels_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+                    break
+            hist[1] += value
+            hist[2] += 1
+
+    def register_gauge(self, collector):
+        """collector() -> [(nome, {labels}, valor)] lido a cada snapshot"""
+        self._gauge_collectors.append(collector)
+
+    def register_counter(self, collector):
+        """Como register_gauge, para contadores mantidos por outro componente"""
+        self._counter_collectors.append(collector)
+
+    # --- snapshots --------------------------------------------------------
+
+    def snapshot(self):
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(hist[0]), hist[1], hist[2]]
+                          for (name, labels), hist in self._histograms.items()]
+        for collector in self._counter_collectors:
+            counters += [[name, sorted(labels.items()), value] for name, labels, value in collector()]
+        gauges = []
+        for collector in self._gauge_collectors:
+            gauges += [[name, sorted(labels.items()), value] for name, labels, value in collector()]
+        return {'pid': os.getpid(), 'time': time.time(), 'counters': counters,
+                'histograms': histograms, 'gauges': gauges}
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'metrics_{pid}.json')
+
+    def flush(self):
+        if not self.directory:
+            return
+        path = self._path(os.getpid())
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _ensure_flusher(self):
+        if self._pid == os.getpid() or not self.directory:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Após fork os valores herdados pertencem ao processo pai
+            self._counters = {}
+            self._histograms = {}
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning('⚠️ Erro ao gravar métricas: %s', e)
+
+    def _load_snapshots(self):
+        snapshots = {os.getpid(): self.snapshot()}
+        if not self.directory:
+            return snapshots.values()
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            pid = data.get('pid')
+            if pid in snapshots:
+                continue
+            alive = _pid_alive(pid)
+            if not alive and now - data.get('time', 0) > self.stale_after:
+                os.remove(path)
+                continue
+            if not alive:
+                data['gauges'] = []
+            snapshots[pid] = data
+        return snapshots.values()
+
+    def render(self):
+        """Texto no formato de exposição do Prometheus, somado entre processos"""
+        counters, gauges, histograms = {}, {}, {}
+        for data in self._load_snapshots():
+            for name, labels, value in data['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in data['gauges']:
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = gauges.get(key, 0) + value
+            for name, labels, buckets, total, count in data['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                hist = histograms.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+                hist[0] = [a + b for a, b in zip(hist[0], buckets)]
+                hist[1] += total
+                hist[2] += count
+
+        lines = []
+        for kind, series in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({name for name, _ in series}):
+                lines.append(f'# HELP {PREFIX}{name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {PREFIX}{name} {kind}')
+                for (series_name, labels), value in sorted(series.items()):
+                    if series_name == name:
+                        lines.append(f'{PREFIX}{name}{_format_labels(labels)} {value}')
+
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f'# HELP {PREFIX}{name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            for (series_name, labels), (buckets, total, count) in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, buckets):
+                    cumulative += bucket_count
+                    lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {count}')
+                lines.append(f'{PREFIX}{name}_sum{_format_labels(labels)} {total}')
+                lines.append(f'{PREFIX}{name}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_start(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_metrics_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_end(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_metrics_query_start')
+    if starts:
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else 'OTHER'
+        metrics.observe('db_query_duration_seconds', time.perf_counter() - starts.pop(), operation=operation)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _query_error(exception_context):
+    # Comando que falhou (IntegrityError, lock ocupado): sem after_cursor_execute, descartar o início
+    conn = exception_context.connection
+    starts = conn.info.get('_metrics_query_start') if conn is not None else None
+    if starts:
+        starts.pop()
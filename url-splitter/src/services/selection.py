@@ -0,0 +1,160 @@
+"""
+Seleção ponderada de destinos
+
+- AliasTable: sorteio em tempo constante (método de alias de Walker/Vose). A
+  tabela é construída uma vez por versão do split (O(n)); cada escolha custa
+  um único número aleatório, independente da quantidade de destinos.
+- StickyTable: atribuição determinística por visitante (modo sticky), via
+  rendezvous hashing ponderado memoizado numa tabela fixa de slots.
+"""
+import math
+import random
+import zlib
+from array import array
+
+
+class AliasTable:
+    """Tabela de alias para sortear índices conforme pesos não negativos"""
+
+    __slots__ = ('n', 'prob', 'alias')
+
+    def __init__(self, weights):
+        n = len(weights)
+        if n == 0:
+            raise ValueError('AliasTable precisa de pelo menos um peso')
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError('A soma dos pesos deve ser positiva')
+
+        scaled = [w * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        # Sobras (erro de ponto flutuante) ficam com probabilidade 1
+        for i in small + large:
+            prob[i] = 1.0
+            alias[i] = i
+
+        self.n = n
+        self.prob = prob
+        self.alias = alias
+
+    def sample(self, rand=random.random):
+        """Sorteia um índice usando um único número aleatório"""
+        u = rand() * self.n
+        i = int(u)
+        if i >= self.n:
+            i = self.n - 1
+        return i if (u - i) < self.prob[i] else self.alias[i]
+
+
+
+_MASK64 = (1 << 64) - 1
+_INV_2_53 = 1.0 / (1 << 53)
+
+
+def _mix64(x):
+    # Finalizador do splitmix64
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & _MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & _MASK64
+    return x ^ (x >> 31)
+
+
+def hash_key(key, salt=0):
+    """Hash estável de 64 bits (igual em todos os workers e nós)"""
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return _mix64(zlib.crc32(key) ^ (salt * 0x9E3779B97F4A7C15 & _MASK64))
+
+
+def rendezvous_score(key_hash, seed, inv_weight):
+    """Pontuação -ln(U)/peso do destino (`seed`) para a chave; vence a menor"""
+    h = _mix64(key_hash ^ seed)
+    # U em (0, 1]: 53 bits mais altos + 1
+    return -math.log(((h >> 11) + 1) * _INV_2_53) * inv_weight
+
+
+def slot_hash(slot, salt):
+    """Chave de rendezvous de um slot sticky"""
+    return _mix64(slot ^ (salt << 20))
+
+
+class RendezvousTable:
+    """
+    Atribuição fixa por visitante via rendezvous hashing ponderado
+
+    Cada destino recebe a pontuação -ln(U)/peso, com U derivado do hash
+    (chave, destino); vence a menor. A probabilidade de cada destino é
+    proporcional ao peso e, ao mudar pesos, só trocam de destino as chaves
+    estritamente necessárias. Custo O(n) por chave.
+    """
+
+    __slots__ = ('seeds', 'inv_weights')
+
+    def __init__(self, keys, weights):
+        if len(keys) != len(weights) or not keys:
+            raise ValueError('RendezvousTable precisa de chaves e pesos do mesmo tamanho')
+        self.seeds = [hash_key(k) for k in keys]
+        self.inv_weights = [1.0 / w if w > 0 else math.inf for w in weights]
+
+    def assign(self, key_hash, excluded=()):
+        """
+        Índice do destino para uma chave (hash de 64 bits). Com `excluded`
+        (índices), vence o melhor entre os demais: só as chaves dos excluídos
+        mudam de destino, na proporção dos pesos restantes.
+        """
+        best = 0
+        best_score = math.inf
+        for i, seed in enumerate(self.seeds):
+            if i in excluded:
+                continue
+            score = rendezvous_score(key_hash, seed, self.inv_weights[i])
+            if score < best_score:
+                best, best_score = i, score
+        return best
+
+
+class StickyTable:
+    """
+    Atribuição sticky em O(1): o visitante cai num de SLOTS slots fixos e o
+    destino de cada slot é decidido por RendezvousTable na primeira vez que
+    é usado. Tudo depende só de (split, pesos, visitante), então workers e
+    nós diferentes concordam sem guardar estado por visitante.
+    """
+
+    SLOTS = 1 << 14
+    _EMPTY = 0xFFFFFFFF
+
+    __slots__ = ('rendezvous', 'salt', 'slots')
+
+    def __init__(self, keys, weights, salt=0):
+        self.rendezvous = RendezvousTable(keys, weights)
+        self.salt = salt
+        self.slots = array('I', [self._EMPTY]) * self.SLOTS
+
+    def assign(self, visitor_key):
+        """Índice do destino para o visitante"""
+        slot = hash_key(visitor_key, self.salt) & (self.SLOTS - 1)
+        index = self.slots[slot]
+        if index == self._EMPTY:
+            index = self.rendezvous.assign(slot_hash(slot, self.salt))
+            self.slots[slot] = index
+        return index
+
+    def assign_excluding(self, visitor_key, excluded):
+        """Como assign, sem os destinos em `excluded` (sem memoizar: exclusões são temporárias)"""
+        slot = hash_key(visitor_key, self.salt) & (self.SLOTS - 1)
+        return self.rendezvous.assign(slot_hash(slot, self.salt), excluded)
@@ -0,0 +1,357 @@
+"""
+Tabela de splits compartilhada entre processos via arquivo mapeado (mmap)
+
+Um único processo carregador compila todos os splits num arquivo binário
+compacto (índice hash por slug e destinos com a tabela de alias e as
+sementes do rendezvous hashing do modo sticky) e o publica com os.replace.
+Os workers mapeiam o arquivo somente leitura: as páginas ficam no page cache
+uma vez só, qualquer que seja o número de workers, e nenhum objeto Python é
+criado por split. Cada publicação é um novo arquivo; o worker percebe a troca
+pelo inode e passa a ler a nova geração inteira de uma vez.
+
+Layout (little-endian):
+    cabeçalho   HEADER
+    buckets     n_buckets x u32 (índice do split + 1; 0 = vazio), sondagem linear
+    splits      n_splits x SPLIT_RECORD
+    destinos    DEST_RECORD por destino (prob/alias, semente/1/peso, URL)
+    strings     UTF-8 (slugs, URLs, sticky_param, planos de pesos, regras de direcionamento)
+
+Splits com plano de pesos guardam o plano compilado (JSON) nas strings e
+splits em modo bandit guardam o modo; o worker monta um ScheduledSplit ou
+BanditSplit na primeira consulta ao slug e o reaproveita enquanto o snapshot
+for o mesmo, já que esses pesos mudam com o relógio ou com as conversões e
+não cabem nas tabelas de alias do arquivo. As regras de direcionamento
+também vão em JSON nas strings; o RuleIndex é montado na primeira consulta
+ao slug e reaproveitado do mesmo jeito.
+"""
+import logging
+import mmap
+import os
+import random
+import struct
+import time
+import zlib
+from array import array
+
+from src.services.selection import StickyTable, hash_key, rendezvous_score, slot_hash
+from src.services.bandit import BANDIT_MODES, bandit
+from src.services.split_cache import (STICKY_MODES, BanditSplit, GenerationFile, ScheduledSplit,
+                                      load_split_table)
+from src.services.targeting import RuleIndex
+from src.services.weight_schedule import WeightSchedule
+
+MAGIC = b'USPT'
+VERSION = 6
+HEADER = struct.Struct('<4sHHQIIIIII')
+SPLIT_RECORD = struct.Struct('<qIIIIIIBBHffiIIBfII')
+DEST_RECORD = struct.Struct('<ddQIII')
+BUCKET = struct.Struct('<I')
+SLOTS = StickyTable.SLOTS
+
+logger = logging.getLogger('url_splitter.shared_table')
+
+
+def _slug_hash(slug_bytes):
+    return zlib.crc32(slug_bytes)
+
+
+def build_table(splits, generation):
+    """Serializa {slug: CompiledSplit ou None} no formato do arquivo compartilhado"""
+    strings = bytearray()
+
+    def add_string(value):
+        data = (value or '').encode('utf-8')
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    n_splits = len(splits)
+    n_buckets = 1
+    while n_buckets < n_splits * 2:
+        n_buckets <<= 1
+    buckets = array('I', [0]) * n_buckets
+    split_records = bytearray()
+    dest_records = bytearray()
+    dest_count_total = 0
+
+    for index, (slug, compiled) in enumerate(splits.items()):
+        slug_off, slug_len = add_string(slug)
+        position = _slug_hash(slug.encode('utf-8')) & (n_buckets - 1)
+        while buckets[position]:
+            position = (position + 1) & (n_buckets - 1)
+        buckets[position] = index + 1
+
+        if compiled is None:
+            split_records += SPLIT_RECORD.pack(0, slug_off, slug_len, 0, 0, 0, 0, 0, 0, 0, 0.0, 0.0, -1,
+                                               0, 0, 0, -1.0, 0, 0)
+            continue
+
+        alias = compiled.table
+        rendezvous = compiled.sticky_table.rendezvous if compiled.sticky_table is not None else None
+        dest_start = dest_count_total
+        for i, dest in enumerate(compiled.destinations):
+            url_off, url_len = add_string(dest)
+            seed, inv_weight = (rendezvous.seeds[i], rendezvous.inv_weights[i]) if rendezvous else (0, 0.0)
+            dest_records += DEST_RECORD.pack(alias.prob[i], inv_weight, seed, alias.alias[i], url_off, url_len)
+        dest_count_total += len(compiled.destinations)
+
+        mode = STICKY_MODES.index(compiled.sticky_mode) + 1 if compiled.sticky_mode else 0
+        param_off, param_len = add_string(compiled.sticky_param)
+        schedule_off, schedule_len = (add_string(compiled.schedule.to_json())
+                                      if isinstance(compiled, ScheduledSplit) else (0, 0))
+        bandit_mode, bandit_epsilon = ((BANDIT_MODES.index(compiled.arms.mode) + 1, compiled.arms.epsilon)
+                                       if isinstance(compiled, BanditSplit) else (0, -1.0))
+        rules_off, rules_len = add_string(compiled.rules.to_json()) if compiled.rules is not None else (0, 0)
+        split_records += SPLIT_RECORD.pack(compiled.id, slug_off, slug_len, dest_start,
+                                           len(compiled.destinations), param_off, param_len, mode, 1,
+                                           compiled.redirect_status, compiled.rate_limit or 0.0,
+                                           compiled.ip_rate_limit or 0.0,
+                                           -1 if compiled.cache_max_age is None else compiled.cache_max_age,
+                                           schedule_off, schedule_len, bandit_mode, bandit_epsilon,
+                                           rules_off, rules_len)
+
+    buckets_off = HEADER.size
+    splits_off = buckets_off + n_buckets * BUCKET.size
+    dests_off = splits_off + len(split_records)
+    strings_off = dests_off + len(dest_records)
+    header = HEADER.pack(MAGIC, VERSION, 0, generation, n_splits, n_buckets,
+                         buckets_off, splits_off, dests_off, strings_off)
+    return b''.join([header, buckets.tobytes(), bytes(split_records), bytes(dest_records), bytes(strings)])
+
+
+def publish_table(path, splits, generation):
+    """Grava a tabela num arquivo novo e troca atomicamente (os.replace)"""
+    data = build_table(splits, generation)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+class SharedSplit:
+    """Visão de um split dentro do arquivo mapeado (mesma interface do CompiledSplit)"""
+
+    __slots__ = ('_snapshot', 'id', 'slug', 'sticky_mode', 'sticky_param', 'rate_limit',
+                 'ip_rate_limit', 'redirect_status', 'cache_max_age', 'rules', '_dest_start', '_dest_count')
+
+    def __init__(self, snapshot, split_id, slug, sticky_mode, sticky_param, dest_start, dest_count,
+                 rate_limit=None, ip_rate_limit=None, redirect_status=302, cache_max_age=None, rules=None):
+        self._snapshot = snapshot
+        self.id = split_id
+        self.slug = slug
+        self.sticky_mode = sticky_mode
+        self.sticky_param = sticky_param
+        self.rate_limit = rate_limit
+        self.ip_rate_limit = ip_rate_limit
+        self.redirect_status = redirect_status
+        self.cache_max_age = cache_max_age
+        self.rules = rules
+        self._dest_start = dest_start
+        self._dest_count = dest_count
+
+    @property
+    def destination_count(self):
+        return self._dest_count
+
+    @property
+    def destinations(self):
+        return tuple(self._snapshot.url(self._dest_start + i) for i in range(self._dest_count))
+
+    def pick(self):
+        """Sorteio O(1) lendo prob/alias direto do arquivo"""
+        n = self._dest_count
+        u = random.random() * n
+        i = int(u)
+        if i >= n:
+            i = n - 1
+        prob, alias = self._snapshot.alias_entry(self._dest_start + i)
+        return self._snapshot.url(self._dest_start + (i if (u - i) < prob else alias))
+
+    def pick_sticky(self, visitor_key):
+        """
+        Mesmo destino da StickyTable, sem a memoização por slot (que seria
+        memória por worker): rendezvous O(destinos) a cada requisição
+        """
+        if not self.sticky_mode or not visitor_key:
+            return self.pick()
+        return self.pick_sticky_excluding(visitor_key, ())
+
+    def pick_sticky_excluding(self, visitor_key, excluded):
+        """Destino sticky entre os índices fora de `excluded` (failover de destinos fora do ar)"""
+        key_hash = slot_hash(hash_key(visitor_key, self.id) & (SLOTS - 1), self.id)
+        best = 0
+        best_score = None
+        for i in range(self._dest_count):
+            if i in excluded:
+                continue
+            seed, inv_weight = self._snapshot.rendezvous_entry(self._dest_start + i)
+            score = rendezvous_score(key_hash, seed, inv_weight)
+            if best_score is None or score < best_score:
+                best, best_score = i, score
+        return self._snapshot.url(self._dest_start + best)
+
+
+class TableSnapshot:
+    """Um arquivo publicado, mapeado somente leitura"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.generation, self.n_splits, self.n_buckets, self.buckets_off,
+         self.splits_off, self.dests_off, self.strings_off) = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'Arquivo de tabela inválido: {path}')
+        self.local_splits = {}  # slug -> ScheduledSplit/BanditSplit montado nesta geração
+        self.rule_indexes = {}  # slug -> RuleIndex montado nesta geração
+
+    def _string(self, offset, length):
+        start = self.strings_off + offset
+        return self.buffer[start:start + length].decode('utf-8')
+
+    def alias_entry(self, index):
+        prob, _, _, alias, _, _ = DEST_RECORD.unpack_from(self.buffer, self.dests_off + index * DEST_RECORD.size)
+        return prob, alias
+
+    def rendezvous_entry(self, index):
+        _, inv_weight, seed, _, _, _ = DEST_RECORD.unpack_from(
+            self.buffer, self.dests_off + index * DEST_RECORD.size)
+        return seed, inv_weight
+
+    def url(self, index):
+        *_, url_off, url_len = DEST_RECORD.unpack_from(self.buffer, self.dests_off + index * DEST_RECORD.size)
+        return self._string(url_off, url_len)
+
+    def get(self, slug):
+        """(encontrado, SharedSplit ou None), como SplitCache.get"""
+        slug_bytes = slug.encode('utf-8')
+        mask = self.n_buckets - 1
+        position = _slug_hash(slug_bytes) & mask
+        buffer = self.buffer
+        while True:
+            entry = BUCKET.unpack_from(buffer, self.buckets_off + position * BUCKET.size)[0]
+            if not entry:
+                return False, None
+            (split_id, slug_off, slug_len, dest_start, dest_count, param_off, param_len,
+             mode, valid, redirect_status, rate_limit, ip_rate_limit, cache_max_age,
+             schedule_off, schedule_len, bandit_mode, bandit_epsilon,
+             rules_off, rules_len) = SPLIT_RECORD.unpack_from(
+                buffer, self.splits_off + (entry - 1) * SPLIT_RECORD.size)
+            start = self.strings_off + slug_off
+            if slug_len == len(slug_bytes) and buffer[start:start + slug_len] == slug_bytes:
+                if not valid:
+                    return True, None
+                sticky_mode = STICKY_MODES[mode - 1] if mode else None
+                sticky_param = self._string(param_off, param_len) or None
+                cache_max_age = None if cache_max_age < 0 else cache_max_age
+                rules = self._rules(slug, rules_off, rules_len) if rules_len else None
+                if schedule_len or bandit_mode:
+                    compiled = self.local_splits.get(slug)
+                    if compiled is None:
+                        compiled = self._local_split(
+                            split_id, slug, dest_start, dest_count, schedule_off, schedule_len, bandit_mode,
+                            bandit_epsilon, sticky_mode=sticky_mode, sticky_param=sticky_param,
+                            rate_limit=rate_limit or None, ip_rate_limit=ip_rate_limit or None,
+                            redirect_status=redirect_status, cache_max_age=cache_max_age, rules=rules)
+                    return True, compiled
+                return True, SharedSplit(self, split_id, slug, sticky_mode, sticky_param,
+                                         dest_start, dest_count, rate_limit or None, ip_rate_limit or None,
+                                         redirect_status, cache_max_age, rules)
+            position = (position + 1) & mask
+
+    def _local_split(self, split_id, slug, dest_start, dest_count, schedule_off, schedule_len, bandit_mode,
+                     bandit_epsilon, **options):
+        destinations = [self.url(dest_start + i) for i in range(dest_count)]
+        if bandit_mode:
+            # float32 no arquivo: arredondar para reencontrar os mesmos braços do cache local
+            arms = bandit.arms_for(split_id, destinations, BANDIT_MODES[bandit_mode - 1],
+                                   None if bandit_epsilon < 0 else round(bandit_epsilon, 6))
+            compiled = BanditSplit(split_id, slug, destinations, arms, **options)
+        else:
+            schedule = WeightSchedule.from_json(self._string(schedule_off, schedule_len))
+            compiled = ScheduledSplit(split_id, slug, destinations, schedule.base, schedule, **options)
+        self.local_splits[slug] = compiled
+        return compiled
+
+    def _rules(self, slug, rules_off, rules_len):
+        rules = self.rule_indexes.get(slug)
+        if rules is None:
+            rules = RuleIndex.compile(self._string(rules_off, rules_len))
+            self.rule_indexes[slug] = rules
+        return rules
+
+class SharedSplitTable:
+    """Lado do worker: mantém o snapshot atual e troca quando o arquivo muda"""
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.snapshot = None
+        self._next_check = 0.0
+
+    @property
+    def generation(self):
+        snapshot = self.refresh()
+        return snapshot.generation if snapshot is not None else None
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return self.snapshot
+        self._next_check = now + self.check_interval
+        try:
+            inode = os.stat(self.path).st_ino
+            if self.snapshot is None or inode != self.snapshot.inode:
+                # O snapshot antigo continua válido para quem ainda o referencia
+                self.snapshot = TableSnapshot(self.path)
+        except (OSError, ValueError) as e:
+            if self.snapshot is None:
+                logger.warning('⚠️ Tabela compartilhada indisponível (%s): %s', self.path, e)
+        return self.snapshot
+
+    def get(self, slug):
+        snapshot = self.refresh()
+        if snapshot is None:
+            return False, None
+        return snapshot.get(slug)
+
+    def __len__(self):
+        snapshot = self.refresh()
+        return snapshot.n_splits if snapshot is not None else 0
+
+
+class SplitTablePublisher:
+    """Lado do carregador: recompila e publica quando a geração muda"""
+
+    def __init__(self, engine, path, generation_path=None, check_interval=1.0):
+        self.engine = engine
+        self.path = path
+        self.generation = GenerationFile(generation_path)
+        self.check_interval = check_interval
+        self.published_generation = None
+        self.publishes = 0
+
+    def publish(self):
+        generation = self.generation.read()
+        start = time.perf_counter()
+        splits = load_split_table(self.engine)
+        size = publish_table(self.path, splits, generation)
+        self.published_generation = generation
+        self.publishes += 1
+        logger.info('📦 Tabela compartilhada publicada: %d splits, %d KB, geração %s (%.0f ms)',
+                    len(splits), size // 1024, generation, (time.perf_counter() - start) * 1000)
+        return size
+
+    def run_forever(self, stop=None):
+        """Laço do carregador; `stop` é um threading.Event opcional"""
+        while stop is None or not stop.is_set():
+            try:
+                if self.generation.read() != self.published_generation:
+                    self.publish()
+            except Exception as e:
+                logger.error('❌ Erro ao publicar tabela compartilhada: %s', e)
+            if stop is not None:
+                stop.wait(self.check_interval)
+            else:
+                time.sleep(self.check_interval)
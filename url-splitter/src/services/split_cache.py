@@ -0,0 +1,418 @@
+"""
+Cache em memória da tabela de roteamento (slug -> split compilado)
+
+O redirecionamento consulta apenas este cache: destinos já validados e pesos
+já normalizados. Escritas (criar/editar/deletar) invalidam o slug localmente e
+incrementam uma geração gravada em arquivo, que os outros workers verificam
+no máximo a cada `SPLIT_CACHE_CHECK_INTERVAL` segundos.
+
+Com `SPLIT_SHARED_TABLE` configurado, o cache lê primeiro a tabela publicada
+pelo carregador em arquivo mapeado (src/services/shared_table.py), enquanto
+ela estiver em dia com a geração vista pelo worker.
+
+Slugs inexistentes também ficam em cache (até `SPLIT_CACHE_NEGATIVE_SIZE`, o
+mais antigo sai primeiro), para uma varredura de slugs aleatórios não custar
+uma consulta por requisição; a invalidação e a troca de geração os descartam,
+então um split recém-criado aparece como qualquer edição.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from src.models.url_split import URLSplit as UrlSplit
+from src.services.bandit import BANDIT_MODES, bandit
+from src.services.selection import AliasTable, StickyTable
+from src.services.targeting import RuleIndex
+from src.services.weight_schedule import WeightSchedule
+
+VALID_PREFIXES = ('http://', 'https://')
+STICKY_MODES = ('cookie', 'ip_ua', 'param')
+REDIRECT_STATUSES = (302, 307, 308)
+
+
+def decode_json_list(data):
+    """Decodifica uma coluna JSON de lista (codificação única; o legado é reparado na migração)"""
+    if data is None:
+        return []
+    if isinstance(data, list):
+        return data
+    try:
+        parsed = json.loads(data)
+    except (TypeError, ValueError):
+        return []
+    return parsed if isinstance(parsed, list) else []
+
+
+def sticky_keys(destinations):
+    """
+    Chave de cada destino no modo sticky: a própria URL, para que
+    adicionar/remover um destino não embaralhe os visitantes dos demais
+    """
+    seen = {}
+    keys = []
+    for dest in destinations:
+        seen[dest] = seen.get(dest, 0) + 1
+        keys.append(dest if seen[dest] == 1 else f'{dest}#{seen[dest]}')
+    return keys
+
+
+class CompiledSplit:
+    """Split pronto para servir: sem JSON e sem validações por requisição"""
+
+    __slots__ = ('id', 'slug', 'destinations', 'destination_count', 'weights', 'table',
+                 'sticky_mode', 'sticky_param', 'sticky_table', 'rate_limit', 'ip_rate_limit',
+                 'redirect_status', 'cache_max_age', 'rules')
+
+    def __init__(self, split_id, slug, destinations, weights, sticky_mode=None, sticky_param=None,
+                 rate_limit=None, ip_rate_limit=None, redirect_status=None, cache_max_age=None, rules=None):
+        self.id = split_id
+        self.slug = slug
+        self.destinations = tuple(destinations)
+        self.destination_count = len(self.destinations)
+        self.weights = tuple(weights)
+        self.table = AliasTable(self.weights)
+        self.sticky_mode = sticky_mode if sticky_mode in STICKY_MODES else None
+        self.sticky_param = sticky_param
+        self.sticky_table = None
+        self.rate_limit = rate_limit or None
+        self.ip_rate_limit = ip_rate_limit or None
+        self.redirect_status = redirect_status if redirect_status in REDIRECT_STATUSES else 302
+        self.cache_max_age = cache_max_age
+        self.rules = rules  # RuleIndex das regras de direcionamento, ou None
+        if self.sticky_mode:
+            self.sticky_table = StickyTable(sticky_keys(self.destinations), self.weights, salt=split_id)
+
+    def pick(self):
+        """Escolhe um destino conforme os pesos em O(1)"""
+        return self.destinations[self.table.sample()]
+
+    def pick_sticky(self, visitor_key):
+        """Destino fixo para o visitante; sem chave, cai no sorteio normal"""
+        if self.sticky_table is None or not visitor_key:
+            return self.pick()
+        return self.destinations[self.sticky_table.assign(visitor_key)]
+
+    def pick_sticky_excluding(self, visitor_key, excluded):
+        """Destino sticky entre os índices fora de `excluded` (failover de destinos fora do ar)"""
+        return self.destinations[self.sticky_table.assign_excluding(visitor_key, excluded)]
+
+
+class ScheduledSplit(CompiledSplit):
+    """
+    Split com plano de pesos: as tabelas de alias e sticky são trocadas só
+    quando o prazo dos pesos vigentes vence, então o sorteio continua O(1)
+    e sem acesso ao banco. A troca substitui os objetos inteiros, sem lock:
+    um sorteio concorrente usa a tabela anterior ou a nova.
+    """
+
+    __slots__ = ('schedule', 'valid_until', 'clock')
+
+    def __init__(self, split_id, slug, destinations, weights, schedule, clock=time.time, **options):
+        super().__init__(split_id, slug, destinations, weights, **options)
+        self.schedule = schedule
+        self.clock = clock
+        self.valid_until = -math.inf
+
+    def _refresh(self, now):
+        weights, valid_until = self.schedule.at(now)
+        self.weights = tuple(weights)
+        self.table = AliasTable(self.weights)
+        if self.sticky_mode:
+            self.sticky_table = StickyTable(sticky_keys(self.destinations), self.weights, salt=self.id)
+        self.valid_until = valid_until
+
+    def pick(self):
+        now = self.clock()
+        if now >= self.valid_until:
+            self._refresh(now)
+        return self.destinations[self.table.sample()]
+
+    def pick_sticky(self, visitor_key):
+        now = self.clock()
+        if now >= self.valid_until:
+            self._refresh(now)
+        return super().pick_sticky(visitor_key)
+
+
+class BanditSplit(CompiledSplit):
+    """
+    Split em modo bandit: os pesos vêm dos braços (src/services/bandit.py),
+    recalculados pela sincronização periódica; a tabela de alias é trocada
+    quando a versão dos pesos muda, como no ScheduledSplit.
+    """
+
+    __slots__ = ('arms', 'version')
+
+    def __init__(self, split_id, slug, destinations, arms, **options):
+        super().__init__(split_id, slug, destinations, [1.0] * len(destinations), **options)
+        self.arms = arms
+        self.version = -1
+
+    def _refresh(self):
+        arms = self.arms
+        version = arms.version
+        # URLs repetidas são um braço só: o peso do braço é dividido entre as cópias
+        copies = {}
+        for dest in self.destinations:
+            copies[dest] = copies.get(dest, 0) + 1
+        weights = tuple(arms.weights[arms.positions[dest]] / copies[dest] for dest in self.destinations)
+        self.weights = weights
+        self.table = AliasTable(weights)
+        if self.sticky_mode:
+            self.sticky_table = StickyTable(sticky_keys(self.destinations), weights, salt=self.id)
+        self.version = version
+
+    def pick(self):
+        if self.arms.version != self.version:
+            self._refresh()
+        return self.destinations[self.table.sample()]
+
+    def pick_sticky(self, visitor_key):
+        if self.arms.version != self.version:
+            self._refresh()
+        return super().pick_sticky(visitor_key)
+
+
+def compile_split(split_id, slug, destinations_raw, weights_raw, sticky_mode=None, sticky_param=None,
+                  rate_limit=None, ip_rate_limit=None, redirect_status=None, cache_max_age=None,
+                  weight_schedule=None, bandit_mode=None, bandit_epsilon=None, targeting_rules=None):
+    """
+    Compila as colunas brutas de um split. Retorna None se não houver destino válido.
+
+    Destinos inválidos são descartados junto com o peso correspondente; se os
+    pesos não baterem com os destinos (ou não forem positivos) a distribuição
+    passa a ser uniforme, como no redirecionamento original. Um plano de
+    pesos (`weight_schedule`) ou regras de direcionamento (`targeting_rules`)
+    inválidos são ignorados; em modo bandit os pesos do split não são usados.
+    """
+    destinations = decode_json_list(destinations_raw)
+    weights = decode_json_list(weights_raw)
+
+    weighted = (len(weights) == len(destinations) and
+                all(isinstance(w, (int, float)) and not isinstance(w, bool) and w > 0 for w in weights))
+
+    valid_destinations = []
+    valid_weights = []
+    valid_indexes = []
+    for index, dest in enumerate(destinations):
+        if isinstance(dest, str) and dest.startswith(VALID_PREFIXES):
+            valid_destinations.append(dest)
+            valid_indexes.append(index)
+            valid_weights.append(float(weights[index]) if weighted else 1.0)
+
+    if not valid_destinations:
+        return None
+
+    total = sum(valid_weights)
+    normalized = [w / total for w in valid_weights]
+    options = dict(sticky_mode=sticky_mode, sticky_param=sticky_param, rate_limit=rate_limit,
+                   ip_rate_limit=ip_rate_limit, redirect_status=redirect_status, cache_max_age=cache_max_age,
+                   rules=RuleIndex.compile(targeting_rules))
+    if bandit_mode in BANDIT_MODES:
+        arms = bandit.arms_for(split_id, valid_destinations, bandit_mode, bandit_epsilon)
+        return BanditSplit(split_id, slug, valid_destinations, arms, **options)
+    schedule = WeightSchedule.compile(weight_schedule, normalized, valid_indexes)
+    if schedule is not None:
+        return ScheduledSplit(split_id, slug, valid_destinations, normalized, schedule, **options)
+    return CompiledSplit(split_id, slug, valid_destinations, normalized, **options)
+
+
+def cache_control(compiled, default_max_age):
+    """
+    Cache-Control do redirecionamento. Só um split de destino único dá sempre a
+    mesma resposta e pode ficar no CDN; com sorteio ou regras de
+    direcionamento, cada resposta vale para uma requisição só.
+    """
+    if compiled.destination_count != 1 or compiled.rules is not None:
+        return 'no-store'
+    max_age = default_max_age if compiled.cache_max_age is None else compiled.cache_max_age
+    return f'public, max-age={max_age}' if max_age > 0 else 'no-store'
+
+
+def split_columns():
+    """Colunas de url_splits na ordem dos argumentos de compile_split"""
+    table = UrlSplit.__table__
+    return (table.c.id, table.c.slug, table.c.destinations, table.c.weights,
+            table.c.sticky_mode, table.c.sticky_param, table.c.rate_limit, table.c.ip_rate_limit,
+            table.c.redirect_status, table.c.cache_max_age, table.c.weight_schedule,
+            table.c.bandit_mode, table.c.bandit_epsilon, table.c.targeting_rules)
+
+
+def load_split_table(engine):
+    """
+    Compila todos os splits de uma vez: {slug: CompiledSplit ou None}.
+    Usado por quem serve só a partir da memória (servidor assíncrono).
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(select(*split_columns())).fetchall()
+    return {row.slug: compile_split(*row) for row in rows}
+
+
+class GenerationFile:
+    """Marcador de geração compartilhado entre processos via arquivo"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._memory = 0  # usado quando não há arquivo configurado (processo único)
+
+    def read(self):
+        if not self.path:
+            return self._memory
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self):
+        """Grava uma nova geração (escrita atômica via rename)"""
+        generation = max(time.time_ns(), self.read() + 1)
+        self._memory = generation
+        if self.path:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(str(generation))
+            os.replace(tmp_path, self.path)
+        return generation
+
+
+class SplitCache:
+    """Tabela slug -> CompiledSplit mantida em memória por processo"""
+
+    def __init__(self, generation_path=None, check_interval=1.0, negative_size=10000):
+        self.generation = GenerationFile(generation_path)
+        self.check_interval = check_interval
+        self.negative_size = negative_size
+        self._splits = {}
+        self._missing = OrderedDict()
+        self._lock = threading.Lock()
+        self._seen_generation = None
+        self._next_check = 0.0
+        self.shared = None
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.generation.path = app.config.get('SPLIT_GENERATION_PATH')
+        self.check_interval = app.config.get('SPLIT_CACHE_CHECK_INTERVAL', self.check_interval)
+        self.negative_size = app.config.get('SPLIT_CACHE_NEGATIVE_SIZE', self.negative_size)
+        self.shared = None
+        if app.config.get('SPLIT_SHARED_TABLE'):
+            from src.services.shared_table import SharedSplitTable
+            self.shared = SharedSplitTable(app.config['SPLIT_SHARED_TABLE'], self.check_interval)
+        self.clear()
+
+    def clear(self):
+        self._splits = {}
+        self._missing = OrderedDict()
+        self._seen_generation = self.generation.read()
+        self._next_check = time.monotonic() + self.check_interval
+
+    def _check_generation(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            current = self.generation.read()
+            if current != self._seen_generation:
+                self._splits = {}
+                self._missing = OrderedDict()
+                self._seen_generation = current
+            self._next_check = now + self.check_interval
+
+    def _load(self, slug):
+        row = (UrlSplit.query
+               .with_entities(UrlSplit.id, UrlSplit.slug, UrlSplit.destinations, UrlSplit.weights,
+                              UrlSplit.sticky_mode, UrlSplit.sticky_param,
+                              UrlSplit.rate_limit, UrlSplit.ip_rate_limit,
+                              UrlSplit.redirect_status, UrlSplit.cache_max_age,
+                              UrlSplit.weight_schedule, UrlSplit.bandit_mode, UrlSplit.bandit_epsilon,
+                              UrlSplit.targeting_rules)
+               .filter_by(slug=slug)
+               .first())
+        if row is None:
+            return False, None
+        return True, compile_split(*row)
+
+    def get(self, slug):
+        """
+        Retorna (encontrado, CompiledSplit ou None). Um split existente mas sem
+        destino válido retorna (True, None).
+        """
+        self._check_generation()
+        if self.shared is not None:
+            snapshot = self.shared.refresh()
+            # Publicação atrasada em relação a uma edição: cair no cache local
+            if snapshot is not None and snapshot.generation >= self._seen_generation:
+                self.hits += 1
+                return snapshot.get(slug)
+
+        splits, missing = self._splits, self._missing
+        if slug in splits:
+            self.hits += 1
+            return True, splits[slug]
+        if slug in missing:
+            self.hits += 1
+            return False, None
+
+        self.misses += 1
+        found, compiled = self._load(slug)
+        if found:
+            splits[slug] = compiled
+        elif self.negative_size > 0:
+            # Grava no OrderedDict lido antes da consulta: se uma invalidação o trocou, a ausência é descartada
+            with self._lock:
+                missing[slug] = True
+                if len(missing) > self.negative_size:
+                    missing.popitem(last=False)
+        return found, compiled
+
+    def warm(self, engine, limit):
+        """
+        Pré-carrega os `limit` splits com mais cliques (total_clicks), para as
+        primeiras requisições de um worker novo não irem ao banco. Retorna
+        quantos splits foram carregados.
+        """
+        generation = self.generation.read()
+        query = select(*split_columns()).order_by(UrlSplit.__table__.c.total_clicks.desc()).limit(limit)
+        with engine.connect() as conn:
+            rows = conn.execute(query).fetchall()
+        compiled = {row.slug: compile_split(*row) for row in rows}
+        with self._lock:
+            # Uma edição publicada durante a leitura: a carga pode estar velha
+            if generation != self._seen_generation:
+                return 0
+            splits = dict(compiled)
+            splits.update(self._splits)
+            self._splits = splits
+        return len(compiled)
+
+    def stats(self):
+        stats = {'hits': self.hits, 'misses': self.misses, 'size': len(self._splits),
+                 'missing': len(self._missing), 'generation': self._seen_generation}
+        if self.shared is not None:
+            stats['shared_generation'] = self.shared.generation
+        return stats
+
+    def invalidate(self, *slugs):
+        """Remove slugs do cache local e publica nova geração para os outros workers"""
+        with self._lock:
+            if self.generation.read() != self._seen_generation:
+                # Outro worker publicou antes: descartar tudo o que pode estar velho
+                self._splits = {}
+            else:
+                # Novo dicionário: cargas em andamento gravam no antigo e são descartadas
+                self._splits = {k: v for k, v in self._splits.items() if k not in slugs}
+            # Uma criação pode tornar qualquer slug ausente válido (import em lote não informa os slugs)
+            self._missing = OrderedDict()
+            self._seen_generation = self.generation.bump()
+
+
+split_cache = SplitCache()
@@ -0,0 +1,415 @@
+"""
+Regras de direcionamento por país, dispositivo, sistema e idioma
+
+Cada split pode ter uma lista ordenada de regras; a primeira que casar com o
+visitante decide o destino e, se nenhuma casar, vale o sorteio pelos pesos.
+Formato (coluna `targeting_rules`, JSON):
+
+    [{"match": {"device": ["mobile"], "os": ["ios"]}, "destination": "https://apps.apple.com/..."},
+     {"match": {"country": ["BR", "PT"], "language": ["pt"]}, "destination": "https://..."}]
+
+Chaves diferentes de `match` se combinam com E; os valores de uma chave,
+com OU. Uma regra sem `match` casa com todos.
+
+Nada é interpretado por requisição:
+
+- as regras são compiladas junto com o split num índice invertido
+  (RuleIndex): para cada dimensão, valor -> conjunto de regras em bitset
+  (int), mais o conjunto das regras que não restringem a dimensão. A
+  avaliação é um E dos bitsets das dimensões usadas e o menor bit ligado é a
+  primeira regra que casa, com custo que quase não cresce com o número de
+  regras;
+- o país vem de um arquivo local de faixas de IP (GEOIP_RANGES_PATH, CSV
+  `inicio,fim,país` ou `rede/prefixo,país`), carregado em arrays ordenados
+  e consultado com bisect; um cabeçalho de país do CDN/proxy
+  (GEOIP_COUNTRY_HEADER, ex.: CF-IPCountry) tem precedência;
+- dispositivo e sistema saem do user-agent por regexes pré-compiladas (só
+  literais minúsculos, como o filtro de bots) e o idioma preferido do
+  Accept-Language; os três são memoizados por valor do cabeçalho.
+
+Uma amostra de faixas (redes de documentação, RFC 5737/3849, e 10.0.0.0/8)
+está em src/data/geoip_sample.csv.
+"""
+import bisect
+import csv
+import functools
+import ipaddress
+import json
+import logging
+import re
+import socket
+import threading
+
+DIMENSIONS = ('country', 'device', 'os', 'language')
+DEVICE_CLASSES = ('mobile', 'tablet', 'desktop')
+OS_FAMILIES = ('ios', 'android', 'windows', 'macos', 'linux', 'other')
+MAX_TARGETING_RULES = 10000
+MAX_RULE_VALUES = 300
+
+_COUNTRY_RE = re.compile(r'^[A-Z]{2}$')
+_LANGUAGE_RE = re.compile(r'^[a-z]{1,8}(-[a-z0-9]{1,8})*$')
+
+# Ordem importa: tablets Android não têm 'mobile' no user-agent
+_TABLET_RE = re.compile(r'ipad|tablet|kindle|silk/|playbook|sm-t\d')
+_MOBILE_RE = re.compile(r'mobi|iphone|ipod|android|windows phone|blackberry|opera mini')
+_OS_PATTERNS = (
+    ('ios', re.compile(r'iphone|ipad|ipod')),
+    ('android', re.compile(r'android')),
+    ('windows', re.compile(r'windows')),
+    ('macos', re.compile(r'macintosh|mac os x')),
+    ('linux', re.compile(r'linux|x11|cros')),
+)
+
+_V4_MAPPED = b'\x00' * 10 + b'\xff\xff'
+
+logger = logging.getLogger('url_splitter.targeting')
+
+
+def ip_value(ip):
+    """
+    (família, inteiro) de um IP em texto, ou None. inet_pton em vez de
+    ipaddress: é o que roda por requisição; IPv4 mapeado em IPv6 vira IPv4.
+    """
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except (OSError, TypeError):
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, ip)
+    except (OSError, TypeError):
+        return None
+    if packed[:12] == _V4_MAPPED:
+        return 4, int.from_bytes(packed[12:], 'big')
+    return 6, int.from_bytes(packed, 'big')
+
+
+@functools.lru_cache(maxsize=4096)
+def device_class(user_agent):
+    """'mobile', 'tablet' ou 'desktop' (sem user-agent: desktop)"""
+    if not user_agent:
+        return 'desktop'
+    text = user_agent.lower()
+    if _TABLET_RE.search(text) or ('android' in text and 'mobile' not in text):
+        return 'tablet'
+    if _MOBILE_RE.search(text):
+        return 'mobile'
+    return 'desktop'
+
+
+@functools.lru_cache(maxsize=4096)
+def os_family(user_agent):
+    if not user_agent:
+        return 'other'
+    text = user_agent.lower()
+    for family, pattern in _OS_PATTERNS:
+        if pattern.search(text):
+            return family
+    return 'other'
+
+
+@functools.lru_cache(maxsize=4096)
+def language_keys(accept_language):
+    """
+    Chaves do idioma preferido (maior q) do Accept-Language:
+    'pt-BR,pt;q=0.9,en;q=0.8' -> ('pt-br', 'pt')
+    """
+    if not accept_language:
+        return ()
+    best, best_q = None, 0.0
+    for part in accept_language.split(','):
+        tag, _, params = part.strip().partition(';')
+        tag = tag.strip().lower()
+        if not tag or tag == '*':
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        # Empate: vale o primeiro da lista
+        if q > best_q:
+            best, best_q = tag, q
+    if best is None:
+        return ()
+    primary = best.split('-', 1)[0]
+    return (best, primary) if primary != best else (best,)
+
+
+class GeoIPRanges:
+    """Faixas de IP -> país em arrays ordenados (um por família), consulta por bisect"""
+
+    def __init__(self):
+        self._starts = {4: [], 6: []}
+        self._ends = {4: [], 6: []}
+        self._countries = {4: [], 6: []}
+
+    @classmethod
+    def load(cls, path):
+        """
+        Lê o CSV (`inicio,fim,país` ou `rede/prefixo,país`; linhas vazias, com
+        '#' ou cabeçalho são ignoradas). Faixas sobrepostas a uma anterior são
+        descartadas com aviso.
+        """
+        ranges = {4: [], 6: []}
+        skipped = 0
+        header = True
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+                    continue
+                first, header = header, False
+                if len(row) == 2:
+                    try:
+                        network = ipaddress.ip_network(row[0].strip(), strict=False)
+                    except ValueError:
+                        network = None
+                    start, end = ((network.version, int(network.network_address)),
+                                  (network.version, int(network.broadcast_address))) if network else (None, None)
+                else:
+                    start, end = ip_value(row[0].strip()), ip_value(row[1].strip())
+                if start is None or end is None:
+                    # A primeira linha pode ser o cabeçalho
+                    if not first:
+                        skipped += 1
+                    continue
+                country = row[-1].strip().upper()
+                if start[0] != end[0] or start[1] > end[1] or not _COUNTRY_RE.match(country):
+                    skipped += 1
+                    continue
+                ranges[start[0]].append((start[1], end[1], country))
+
+        table = cls()
+        for version, items in ranges.items():
+            items.sort()
+            for start, end, country in items:
+                if table._ends[version] and start <= table._ends[version][-1]:
+                    skipped += 1
+                    continue
+                table._starts[version].append(start)
+                table._ends[version].append(end)
+                table._countries[version].append(country)
+        if skipped:
+            logger.warning('⚠️ %d linhas ignoradas em %s (inválidas ou sobrepostas)', skipped, path)
+        return table
+
+    def lookup(self, ip):
+        """País (ISO 3166 alfa-2) do IP, ou None"""
+        parsed = ip_value(ip) if ip else None
+        if parsed is None:
+            return None
+        version, value = parsed
+        index = bisect.bisect_right(self._starts[version], value) - 1
+        if index >= 0 and value <= self._ends[version][index]:
+            return self._countries[version][index]
+        return None
+
+    def __len__(self):
+        return len(self._starts[4]) + len(self._starts[6])
+
+
+def _normalize_values(dimension, values, index):
+    if isinstance(values, str):
+        values = [values]
+    if not isinstance(values, list) or not values or len(values) > MAX_RULE_VALUES:
+        return None, (f'targeting_rules[{index}].match.{dimension} deve ser uma lista '
+                      f'de 1 a {MAX_RULE_VALUES} valores')
+    normalized = []
+    for value in values:
+        if not isinstance(value, str):
+            return None, f'targeting_rules[{index}].match.{dimension} deve conter textos'
+        if dimension == 'country':
+            value = value.strip().upper()
+            valid = bool(_COUNTRY_RE.match(value))
+        else:
+            value = value.strip().lower()
+            valid = (value in DEVICE_CLASSES if dimension == 'device' else
+                     value in OS_FAMILIES if dimension == 'os' else bool(_LANGUAGE_RE.match(value)))
+        if not valid:
+            return None, f'targeting_rules[{index}].match.{dimension}: valor inválido {value!r}'
+        if value not in normalized:
+            normalized.append(value)
+    return normalized, None
+
+
+def normalize_rules(data, valid_prefixes=('http://', 'https://')):
+    """
+    Valida as regras enviadas pela API. Retorna (lista normalizada ou None, erro).
+
+    Países em ISO 3166 alfa-2 (BR), dispositivos em DEVICE_CLASSES, sistemas
+    em OS_FAMILIES e idiomas como tags BCP 47 ('pt' casa com pt-BR e pt-PT;
+    'pt-br' só com pt-BR).
+    """
+    if data is None:
+        return None, None
+    if isinstance(data, str):
+        try:
+            data = json.loads(data) if data.strip() else None
+        except ValueError:
+            return None, 'targeting_rules deve ser uma lista JSON'
+        if data is None:
+            return None, None
+    if not isinstance(data, list):
+        return None, 'targeting_rules deve ser uma lista de regras com match e destination'
+    if not data:
+        return None, None
+    if len(data) > MAX_TARGETING_RULES:
+        return None, f'targeting_rules aceita no máximo {MAX_TARGETING_RULES} regras'
+
+    normalized = []
+    for index, rule in enumerate(data):
+        if not isinstance(rule, dict):
+            return None, f'targeting_rules[{index}] deve ser um objeto com match e destination'
+        destination = rule.get('destination')
+        if not isinstance(destination, str) or not destination.startswith(valid_prefixes):
+            return None, f'targeting_rules[{index}].destination: URL inválida'
+        match = rule.get('match') or {}
+        if not isinstance(match, dict):
+            return None, f'targeting_rules[{index}].match deve ser um objeto'
+        unknown = set(match) - set(DIMENSIONS)
+        if unknown:
+            return None, (f'targeting_rules[{index}].match: chave inválida {sorted(unknown)[0]} '
+                          f'(use {", ".join(DIMENSIONS)})')
+        conditions = {}
+        for dimension in DIMENSIONS:
+            if dimension in match:
+                values, error = _normalize_values(dimension, match[dimension], index)
+                if error:
+                    return None, error
+                conditions[dimension] = values
+        normalized.append({'match': conditions, 'destination': destination})
+    return normalized, None
+
+
+class RuleIndex:
+    """Regras compiladas: bitsets por (dimensão, valor); a primeira regra que casa vence"""
+
+    __slots__ = ('destinations', 'dimensions', '_any', '_by_value', '_raw')
+
+    def __init__(self, rules):
+        self.destinations = tuple(rule['destination'] for rule in rules)
+        everything = (1 << len(rules)) - 1
+        any_mask = {}
+        by_value = {}
+        for dimension in DIMENSIONS:
+            unrestricted = everything
+            values = {}
+            for position, rule in enumerate(rules):
+                accepted = rule['match'].get(dimension)
+                if accepted is None:
+                    continue
+                bit = 1 << position
+                unrestricted &= ~bit
+                for value in accepted:
+                    values[value] = values.get(value, 0) | bit
+            if values:
+                any_mask[dimension] = unrestricted
+                by_value[dimension] = values
+        # Só as dimensões que alguma regra restringe (as demais não precisam ser calculadas)
+        self.dimensions = tuple(by_value)
+        self._any = any_mask
+        self._by_value = by_value
+        self._raw = rules
+
+    @classmethod
+    def compile(cls, raw):
+        """Índice a partir da coluna JSON; None se não houver regras ou elas não servirem"""
+        if not raw:
+            return None
+        rules, error = normalize_rules(raw)
+        if error or not rules:
+            return None
+        return cls(rules)
+
+    def to_json(self):
+        return json.dumps(self._raw, separators=(',', ':'))
+
+    def match(self, features):
+        """
+        Destino da primeira regra que casa, ou None. `features` traz, para
+        cada dimensão em `self.dimensions`, os valores do visitante.
+        """
+        candidates = -1
+        for dimension in self.dimensions:
+            mask = self._any[dimension]
+            values = self._by_value[dimension]
+            for value in features.get(dimension, ()):
+                mask |= values.get(value, 0)
+            candidates &= mask
+            if not candidates:
+                return None
+        if candidates == -1:
+            # Nenhuma dimensão restrita: todas as regras casam, vale a primeira
+            return self.destinations[0]
+        return self.destinations[(candidates & -candidates).bit_length() - 1]
+
+    def __len__(self):
+        return len(self.destinations)
+
+
+class Targeting:
+    """Configuração (init_app) e avaliação das regras por requisição"""
+
+    def __init__(self):
+        self.ranges_path = None
+        self.country_header = None
+        self._geoip = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.configure(app.config.get('GEOIP_RANGES_PATH') or None,
+                       app.config.get('GEOIP_COUNTRY_HEADER') or None)
+
+    def configure(self, ranges_path=None, country_header=None):
+        self.ranges_path = ranges_path
+        self.country_header = country_header.lower() if country_header else None
+        self._geoip = None
+
+    @property
+    def geoip(self):
+        """Faixas carregadas na primeira consulta de país (arquivo ausente: tabela vazia)"""
+        geoip = self._geoip
+        if geoip is None:
+            with self._lock:
+                if self._geoip is None:
+                    self._geoip = self._load_ranges()
+                geoip = self._geoip
+        return geoip
+
+    def _load_ranges(self):
+        if not self.ranges_path:
+            return GeoIPRanges()
+        try:
+            geoip = GeoIPRanges.load(self.ranges_path)
+        except OSError as e:
+            logger.warning('⚠️ Faixas de GeoIP indisponíveis (%s): %s', self.ranges_path, e)
+            return GeoIPRanges()
+        logger.info('🌍 %d faixas de GeoIP carregadas de %s', len(geoip), self.ranges_path)
+        return geoip
+
+    def route(self, rules, ip, headers):
+        """
+        Destino das regras para o visitante, ou None. `headers` é qualquer
+        mapeamento de cabeçalhos com .get (Flask ou dict em minúsculas).
+        """
+        features = {}
+        for dimension in rules.dimensions:
+            if dimension == 'country':
+                country = headers.get(self.country_header) if self.country_header else None
+                country = country.strip().upper() if country else self.geoip.lookup(ip)
+                features['country'] = (country,) if country else ()
+            elif dimension == 'device':
+                features['device'] = (device_class(headers.get('user-agent')),)
+            elif dimension == 'os':
+                features['os'] = (os_family(headers.get('user-agent')),)
+            else:
+                features['language'] = language_keys(headers.get('accept-language'))
+        return rules.match(features)
+
+    def stats(self):
+        return {'geoip_ranges': len(self._geoip) if self._geoip is not None else None,
+                'country_header': self.country_header}
+
+
+targeting = Targeting()
@@ -0,0 +1,195 @@
+"""
+Limite de taxa e filtro de bots no redirecionamento
+
+Token buckets em memória por processo, guardados num LRU limitado
+(RATE_LIMIT_MAX_KEYS chaves por limitador; a chave menos recente é
+descartada e recomeça com o balde cheio). Há dois limitadores:
+
+- por split (todas as requisições do slug), RATE_LIMIT_SPLIT ou a coluna
+  `rate_limit` do split;
+- por visitante (IP), RATE_LIMIT_IP global ou a coluna `ip_rate_limit` do
+  split, que passa a contar por (split, IP).
+
+O classificador de user-agent usa um único regex pré-compilado, só com
+literais em minúsculas (sem IGNORECASE nem lookbehind, que desligam as
+otimizações do sre), e memoiza o resultado por user-agent. BOT_FILTER
+define o que fazer com bots: 'skip' redireciona sem gravar o clique,
+'record' grava normalmente e 'off' desliga a classificação. Bots
+classificados são contados em bot_redirects_total.
+
+O IP do visitante é o da conexão; o X-Forwarded-For só é considerado com
+TRUSTED_PROXIES > 0, pela mesma regra do ProxyFix do werkzeug (o N-ésimo valor
+a partir do fim, o que o último proxy confiável viu), para que um cliente não
+escape do limite por IP trocando o cabeçalho a cada requisição.
+
+Com vários workers cada processo tem seus baldes: o limite efetivo é
+aproximadamente o configurado vezes o número de workers que atendem a chave.
+"""
+import functools
+import re
+import threading
+import time
+from collections import OrderedDict
+
+BOT_MODES = ('skip', 'record', 'off')
+
+# Trechos (minúsculos) de user-agent de crawlers, pré-visualizadores de link e clientes HTTP
+BOT_PATTERNS = (
+    r'bot', r'crawl', r'spider', r'slurp', r'facebookexternalhit', r'facebot',
+    r'whatsapp', r'telegram', r'preview', r'embedly', r'headless', r'phantomjs',
+    r'lighthouse', r'curl/', r'wget/', r'python-requests', r'python-urllib', r'aiohttp',
+    r'httpx', r'go-http-client', r'java/', r'okhttp', r'libwww', r'axios', r'node-fetch',
+    r'scrapy', r'feedfetcher', r'mediapartners', r'pingdom', r'uptime', r'monitor',
+    r'validator', r'vkshare', r'skypeuripreview',
+)
+
+
+def forwarded_client_ip(peer_ip, forwarded, trusted_proxies):
+    """IP do visitante atrás de `trusted_proxies` proxies (mesma regra do ProxyFix(x_for=N))"""
+    if trusted_proxies and forwarded:
+        values = [value.strip() for value in forwarded.split(',')]
+        if len(values) >= trusted_proxies:
+            return values[-trusted_proxies]
+    return peer_ip
+
+
+class TokenBucketLimiter:
+    """Token buckets por chave num LRU limitado a `max_keys` entradas"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key, rate, burst, now):
+        """Consome um token; retorna 0.0 se liberado ou os segundos até o próximo token"""
+        with self._lock:
+            buckets = self._buckets
+            entry = buckets.get(key)
+            if entry is None:
+                if len(buckets) >= self.max_keys:
+                    buckets.popitem(last=False)
+                buckets[key] = [burst - 1.0, now]
+                return 0.0
+            buckets.move_to_end(key)
+            tokens = entry[0] + (now - entry[1]) * rate
+            if tokens > burst:
+                tokens = burst
+            entry[1] = now
+            if tokens < 1.0:
+                entry[0] = tokens
+                return (1.0 - tokens) / rate
+            entry[0] = tokens - 1.0
+            return 0.0
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class BotClassifier:
+    """User-agent -> bot ou não, com regex único e cache LRU por user-agent"""
+
+    def __init__(self, patterns=BOT_PATTERNS, cache_size=4096):
+        self._search = re.compile('|'.join(patterns)).search
+        self.is_bot = functools.lru_cache(maxsize=cache_size)(self._classify)
+
+    def _classify(self, user_agent):
+        # Sem user-agent: scripts e ferramentas, não navegadores
+        if not user_agent:
+            return True
+        text = user_agent.lower()
+        match = self._search(text)
+        # 'bot' dentro de 'cubot' é fabricante de celular, não crawler
+        while match is not None and match.group() == 'bot' and text[match.start() - 2:match.start()] == 'cu':
+            match = self._search(text, match.end())
+        return match is not None
+
+
+class TrafficFilter:
+    """Configuração (init_app) e decisão por requisição de redirecionamento"""
+
+    def __init__(self):
+        self.ip_rate = 0.0
+        self.ip_burst = 0.0
+        self.split_rate = 0.0
+        self.split_burst = 0.0
+        self.bot_mode = 'skip'
+        self.trusted_proxies = 0
+        self.ip_buckets = TokenBucketLimiter()
+        self.split_buckets = TokenBucketLimiter()
+        self.classifier = BotClassifier()
+
+    def init_app(self, app):
+        self.configure(
+            ip_rate=app.config.get('RATE_LIMIT_IP', 0.0),
+            ip_burst=app.config.get('RATE_LIMIT_IP_BURST'),
+            split_rate=app.config.get('RATE_LIMIT_SPLIT', 0.0),
+            split_burst=app.config.get('RATE_LIMIT_SPLIT_BURST'),
+            max_keys=app.config.get('RATE_LIMIT_MAX_KEYS', 100000),
+            bot_mode=app.config.get('BOT_FILTER', 'skip'),
+            extra_patterns=app.config.get('BOT_USER_AGENT_PATTERNS', ''),
+            trusted_proxies=app.config.get('TRUSTED_PROXIES', 0),
+        )
+
+    def configure(self, ip_rate=0.0, ip_burst=None, split_rate=0.0, split_burst=None,
+                  max_keys=100000, bot_mode='skip', extra_patterns='', trusted_proxies=0):
+        if bot_mode not in BOT_MODES:
+            raise ValueError(f'BOT_FILTER inválido: {bot_mode}')
+        self.ip_rate = float(ip_rate or 0.0)
+        self.ip_burst = float(ip_burst or max(1.0, self.ip_rate))
+        self.split_rate = float(split_rate or 0.0)
+        self.split_burst = float(split_burst or max(1.0, self.split_rate))
+        self.ip_buckets = TokenBucketLimiter(max_keys)
+        self.split_buckets = TokenBucketLimiter(max_keys)
+        self.bot_mode = bot_mode
+        self.trusted_proxies = int(trusted_proxies or 0)
+        extra = tuple(re.escape(p.strip().lower()) for p in extra_patterns.split(',') if p.strip())
+        self.classifier = BotClassifier(BOT_PATTERNS + extra)
+
+    def client_ip(self, peer_ip, forwarded):
+        """IP usado nos limites, no sticky por IP e na segmentação (servidor asyncio)"""
+        return forwarded_client_ip(peer_ip, forwarded, self.trusted_proxies)
+
+    def check(self, compiled, ip, now=None):
+        """
+        Aplica os limites ao split e ao visitante. Retorna None se liberado ou
+        (escopo, segundos para tentar de novo) se a requisição deve ser recusada.
+        """
+        if now is None:
+            now = time.monotonic()
+        if compiled.ip_rate_limit:
+            rate = compiled.ip_rate_limit
+            wait = self.ip_buckets.acquire((compiled.id, ip), rate, max(1.0, rate), now)
+        elif self.ip_rate:
+            wait = self.ip_buckets.acquire(ip, self.ip_rate, self.ip_burst, now)
+        else:
+            wait = 0.0
+        if wait:
+            return 'ip', wait
+
+        if compiled.rate_limit:
+            rate = compiled.rate_limit
+            wait = self.split_buckets.acquire(compiled.id, rate, max(1.0, rate), now)
+        elif self.split_rate:
+            wait = self.split_buckets.acquire(compiled.id, self.split_rate, self.split_burst, now)
+        if wait:
+            return 'split', wait
+        return None
+
+    def is_bot(self, user_agent):
+        return self.bot_mode != 'off' and self.classifier.is_bot(user_agent)
+
+    def skip_click(self, is_bot):
+        """Se o clique de um bot (já classificado) deve deixar de ser gravado"""
+        return is_bot and self.bot_mode == 'skip'
+
+    def stats(self):
+        return {'ip_keys': len(self.ip_buckets), 'split_keys': len(self.split_buckets),
+                'bot_mode': self.bot_mode}
+
+
+traffic_filter = TrafficFilter()
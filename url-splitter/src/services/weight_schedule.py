@@ -0,0 +1,163 @@
+"""
+Planos de pesos agendados por split
+
+Um plano é uma lista de pontos (instante, pesos) em um de dois modos:
+
+- 'step': os pesos de cada ponto valem a partir do seu instante até o próximo;
+- 'linear': entre dois pontos os pesos variam linearmente (rampa), em
+  degraus de SCHEDULE_RESOLUTION segundos.
+
+Antes do primeiro ponto valem os pesos do próprio split; depois do último,
+os do último ponto. O plano é compilado junto com o split (nada é lido do
+banco por requisição): `at(now)` devolve os pesos vigentes e até quando eles
+valem, e o split só reconstrói a tabela de alias quando esse prazo vence.
+"""
+import bisect
+import json
+import math
+from datetime import datetime, timezone
+
+SCHEDULE_MODES = ('step', 'linear')
+SCHEDULE_RESOLUTION = 60.0
+MAX_SCHEDULE_POINTS = 100
+
+
+def parse_instant(value):
+    """Epoch (número) ou ISO 8601 -> epoch em segundos; sem fuso é UTC. None se inválido"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    if not isinstance(value, str) or not value.strip():
+        return None
+    text = value.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def normalize_schedule(data, destination_count):
+    """
+    Valida o plano enviado pela API. Retorna (dict normalizado ou None, erro).
+
+    Formato: {"mode": "step"|"linear", "points": [{"at": ..., "weights": [...]}]}
+    com `at` em epoch ou ISO 8601 e um peso (>= 0, soma positiva) por destino.
+    """
+    if data is None:
+        return None, None
+    if isinstance(data, str):
+        try:
+            data = json.loads(data) if data.strip() else None
+        except ValueError:
+            return None, 'weight_schedule deve ser um objeto JSON'
+        if data is None:
+            return None, None
+    if not isinstance(data, dict):
+        return None, 'weight_schedule deve ser um objeto com mode e points'
+
+    mode = data.get('mode', 'step')
+    if mode not in SCHEDULE_MODES:
+        return None, f'weight_schedule.mode deve ser um de: {", ".join(SCHEDULE_MODES)}'
+    points = data.get('points')
+    if not isinstance(points, list) or not points:
+        return None, 'weight_schedule.points deve ser uma lista não vazia'
+    if len(points) > MAX_SCHEDULE_POINTS:
+        return None, f'weight_schedule aceita no máximo {MAX_SCHEDULE_POINTS} pontos'
+
+    normalized = []
+    for index, point in enumerate(points):
+        if not isinstance(point, dict):
+            return None, f'weight_schedule.points[{index}] deve ser um objeto com at e weights'
+        at = parse_instant(point.get('at'))
+        if at is None:
+            return None, f'weight_schedule.points[{index}].at inválido (epoch ou ISO 8601)'
+        weights = point.get('weights')
+        if not isinstance(weights, list) or len(weights) != destination_count:
+            return None, f'weight_schedule.points[{index}].weights deve ter um peso por destino'
+        if not all(isinstance(w, (int, float)) and not isinstance(w, bool) and math.isfinite(w) and w >= 0
+                   for w in weights) or sum(weights) <= 0:
+            return None, f'weight_schedule.points[{index}].weights deve ter números >= 0 com soma positiva'
+        normalized.append({'at': at, 'weights': weights})
+
+    normalized.sort(key=lambda point: point['at'])
+    if len({point['at'] for point in normalized}) != len(normalized):
+        return None, 'weight_schedule não pode ter dois pontos no mesmo instante'
+    return {'mode': mode, 'points': normalized}, None
+
+
+class WeightSchedule:
+    """Plano compilado: pesos normalizados por ponto, já filtrados pelos destinos válidos"""
+
+    __slots__ = ('mode', 'base', 'times', 'weights', 'resolution')
+
+    def __init__(self, mode, base, points, resolution=SCHEDULE_RESOLUTION):
+        self.mode = mode if mode in SCHEDULE_MODES else 'step'
+        self.base = tuple(base)
+        self.times = [float(at) for at, _ in points]
+        self.weights = []
+        for _, weights in points:
+            total = float(sum(weights))
+            self.weights.append(tuple(w / total for w in weights))
+        self.resolution = resolution
+
+    @classmethod
+    def compile(cls, raw, base, indexes):
+        """
+        Plano a partir da coluna JSON, mantendo só os pesos dos destinos em
+        `indexes` (os válidos). None se não houver plano ou ele não servir.
+        """
+        if not raw:
+            return None
+        try:
+            data = json.loads(raw) if isinstance(raw, str) else raw
+            mode = data.get('mode', 'step')
+            points = []
+            for point in data['points']:
+                weights = point['weights']
+                kept = [float(weights[i]) for i in indexes]
+                if any(w < 0 for w in kept) or sum(kept) <= 0:
+                    return None
+                points.append((float(point['at']), kept))
+        except (TypeError, ValueError, KeyError, IndexError, AttributeError):
+            return None
+        if not points:
+            return None
+        points.sort(key=lambda point: point[0])
+        return cls(mode, base, points)
+
+    def to_json(self):
+        """Forma compacta (pesos já normalizados) gravada na tabela compartilhada"""
+        return json.dumps({'mode': self.mode, 'base': self.base,
+                           'points': [[at, w] for at, w in zip(self.times, self.weights)]},
+                          separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data):
+        parsed = json.loads(data)
+        return cls(parsed['mode'], parsed['base'], parsed['points'])
+
+    def at(self, now):
+        """(pesos vigentes em `now`, instante até o qual eles valem)"""
+        times = self.times
+        index = bisect.bisect_right(times, now) - 1
+        if index < 0:
+            return self.base, times[0]
+        if index == len(times) - 1:
+            return self.weights[index], math.inf
+        start, end = times[index], times[index + 1]
+        if self.mode == 'step':
+            return self.weights[index], end
+        # Rampa: o degrau começa no múltiplo da resolução e vale até o próximo
+        step_start = start + math.floor((now - start) / self.resolution) * self.resolution
+        fraction = (step_start - start) / (end - start)
+        weights = tuple(a + (b - a) * fraction
+                        for a, b in zip(self.weights[index], self.weights[index + 1]))
+        return weights, min(step_start + self.resolution, end)
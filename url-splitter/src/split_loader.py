@@ -0,0 +1,33 @@
+"""
+Carregador único da tabela de splits compartilhada (SPLIT_SHARED_TABLE)
+
+Para os workers do gunicorn (src/main.py) lerem a tabela em arquivo mapeado
+em vez de cada um manter sua cópia: rode um único processo deste script na
+mesma máquina/volume. Ele publica a tabela a cada nova geração de splits.
+
+Uso: SPLIT_SHARED_TABLE=/app/data/split_table.bin python src/split_loader.py
+"""
+import argparse
+import os
+import sys
+
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.models.user import db
+from src.redirect_server import build_config_app
+from src.services.shared_table import SplitTablePublisher
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Carregador da tabela de splits compartilhada')
+    parser.add_argument('--database', default=None, help='caminho do SQLite (padrão: DATABASE_PATH)')
+    parser.add_argument('--shared-table', default=None, help='arquivo publicado (padrão: SPLIT_SHARED_TABLE)')
+    args = parser.parse_args()
+
+    app = build_config_app(args.database)
+    path = args.shared_table or app.config['SPLIT_SHARED_TABLE']
+    if not path:
+        parser.error('informe --shared-table ou SPLIT_SHARED_TABLE')
+    publisher = SplitTablePublisher(db.get_engine(app), path, app.config['SPLIT_GENERATION_PATH'],
+                                    app.config['SPLIT_CACHE_CHECK_INTERVAL'])
+    publisher.run_forever()